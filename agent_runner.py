@@ -0,0 +1,232 @@
+import asyncio
+import json
+import time
+from typing import Any
+
+from agents import Agent, RunConfig, RunHooks, Runner
+from agents.models.interface import ModelProvider
+from openai.types.responses import ResponseTextDeltaEvent
+
+from execution import (
+    MAX_RETRIES,
+    OUTPUT_TOKEN_RESERVE,
+    DeadlineExceeded,
+    acquire_capacity,
+    backoff_delay,
+    is_retryable,
+    mark_exhausted,
+    record,
+    settle_usage,
+    stage_slot,
+    time_left,
+)
+from followup_context import count_tokens
+from metrics import record_span, timed
+from model_routing import get_router
+from run_context import RunContext
+from usage import stage_usage
+
+
+# Shared by every stage; None keeps the SDK defaults (OpenAI). Benchmarks and offline runs swap
+# in their own model provider through set_model_provider.
+_run_config: RunConfig | None = None
+
+
+def set_model_provider(provider: ModelProvider | None) -> None:
+    global _run_config
+    _run_config = RunConfig(model_provider=provider) if provider is not None else None
+
+
+##########################
+### STAGE EXECUTION ######
+##########################
+
+
+def _tool_name(item: Any) -> str | None:
+    raw_item = getattr(item, "raw_item", None)
+    return getattr(raw_item, "name", None) or getattr(raw_item, "type", None)
+
+
+# Model calls and local tool calls of one stage, timed through the SDK's lifecycle hooks.
+# Hosted tools (file search) run inside the model call, so their time is part of "model".
+class _TimingHooks(RunHooks):
+    def __init__(self):
+        self._started: dict[tuple[str, str], list[float]] = {}
+
+    def _start(self, kind: str, name: str) -> None:
+        self._started.setdefault((kind, name), []).append(time.perf_counter())
+
+    def _end(self, kind: str, name: str, wrapper) -> None:
+        starts = self._started.get((kind, name))
+        if starts:
+            context = wrapper.context if isinstance(wrapper.context, RunContext) else None
+            record_span(kind, name, starts.pop(0), context)
+
+    async def on_llm_start(self, context, agent, system_prompt, input_items) -> None:
+        self._start("model", agent.name)
+
+    async def on_llm_end(self, context, agent, response) -> None:
+        self._end("model", agent.name, context)
+
+    async def on_tool_start(self, context, agent, tool) -> None:
+        self._start("tool", tool.name)
+
+    async def on_tool_end(self, context, agent, tool, result) -> None:
+        self._end("tool", tool.name, context)
+
+
+# Charged against the tokens-per-minute bucket up front and corrected once real usage is known
+def _estimate_tokens(agent: Agent, input_data: Any) -> int:
+    text = input_data if isinstance(input_data, str) else json.dumps(input_data, default=str)
+    instructions = agent.instructions if isinstance(agent.instructions, str) else ""
+    return count_tokens(text) + count_tokens(instructions) + OUTPUT_TOKEN_RESERVE
+
+
+async def _run_once(
+    agent: Agent, input_data: Any, context: RunContext | None, stage: str, streamed: list
+):
+    hooks = _TimingHooks()
+    if context is None or context.events is None:
+        return await Runner.run(
+            agent, input_data, context=context, run_config=_run_config, hooks=hooks
+        )
+
+    # Only plain-text agents stream deltas; structured outputs would just leak partial JSON
+    stream_text = agent.output_type in (None, str)
+
+    result = Runner.run_streamed(
+        agent, input_data, context=context, run_config=_run_config, hooks=hooks
+    )
+    async for event in result.stream_events():
+        if event.type == "raw_response_event":
+            if stream_text and isinstance(event.data, ResponseTextDeltaEvent):
+                streamed.append("text_delta")
+                context.emit("text_delta", stage=stage, delta=event.data.delta)
+        elif event.type == "run_item_stream_event":
+            if event.name == "tool_called":
+                streamed.append("tool_call")
+                context.emit("tool_call", stage=stage, tool=_tool_name(event.item))
+            elif event.name == "tool_output":
+                streamed.append("tool_output")
+                context.emit("tool_output", stage=stage, tool=_tool_name(event.item))
+    return result
+
+
+async def _run_with_retries(
+    agent: Agent, input_data: Any, context: RunContext | None, stage: str, estimate: int
+):
+    deadline = context.deadline if context is not None else None
+    workflow_name = context.workflow if context is not None else None
+    attempt = 0
+    while True:
+        waiting = time.perf_counter()
+        if await acquire_capacity(estimate, deadline):
+            record_span("step", "rate_limit_wait", waiting, context, workflow_name)
+        streamed: list[str] = []
+        charts_before = len(context.charts) if context is not None else 0
+        left = time_left(deadline)
+        try:
+            attempt_run = _run_once(agent, input_data, context, stage, streamed)
+            if left is None:
+                return await attempt_run
+            return await asyncio.wait_for(attempt_run, max(left, 0.0))
+        except asyncio.TimeoutError as e:
+            if left is None or isinstance(e, DeadlineExceeded):
+                raise
+            record("deadline_exceeded")
+            raise DeadlineExceeded(f"Stage '{stage}' ran out of request time") from e
+        except Exception as e:
+            # Events already streamed to the client can't be taken back, so only a stage
+            # that has not emitted anything yet is retried
+            if not is_retryable(e) or streamed:
+                raise
+            if attempt >= MAX_RETRIES:
+                mark_exhausted(e)
+                raise
+            if context is not None:
+                # Charts of the failed attempt are rendered again by the retry
+                del context.charts[charts_before:]
+            delay = backoff_delay(attempt, e)
+            left = time_left(deadline)
+            if left is not None and delay >= left:
+                record("deadline_exceeded")
+                raise DeadlineExceeded(f"No time left to retry stage '{stage}'") from e
+            record("retries")
+            if context is not None:
+                context.emit("stage_retry", stage=stage, attempt=attempt + 1, delay=delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def _route(agent: Agent, context: RunContext | None, stage: str) -> tuple[Agent, dict | None]:
+    router = get_router()
+    if router is None or not isinstance(agent.model, str):
+        return agent, None
+    decision = router.choose(stage, agent.model, context)
+    if decision is None:
+        return agent, None
+    entry = decision.to_dict()
+    if context is not None:
+        context.routing.append(entry)
+    return router.agent_for(agent, decision.model), entry
+
+
+def _settle_route(decision: dict | None, status: str, started: float | None) -> None:
+    if decision is None:
+        return
+    decision["status"] = status
+    if started is not None:
+        seconds = time.perf_counter() - started
+        decision["seconds"] = round(seconds, 3)
+        get_router().observe(decision["role"], decision["model"], seconds)
+
+
+# Every workflow stage, guardrail and follow-up goes through run_stage, which is where the
+# outbound limits live:
+#   - a concurrency slot, overall and per workflow (nested stages reuse their parent's)
+#   - requests- and tokens-per-minute buckets
+#   - retries of rate limits and transient errors with jittered exponential backoff
+#   - the request deadline on the context: no attempt, wait or backoff runs past it
+# Each stage is timed (metrics.timed), with its model and tool calls and any queueing.
+# The model comes from model_routing when routing is on: the stage's role decides the candidates
+# and its time budget decides which of them runs. The decision is kept on the context and the
+# stage's duration feeds the router's rolling p95 for that role and model.
+# Without an event listener on the context a stage is a plain Runner.run; with one, it runs
+# streamed and forwards stage, tool-call and text-delta events as they happen.
+async def run_stage(
+    agent: Agent,
+    input_data: Any,
+    context: RunContext | None = None,
+    stage: str | None = None,
+):
+    stage = stage or agent.name
+    workflow_name = context.workflow if context is not None else None
+    estimate = _estimate_tokens(agent, input_data)
+
+    queued = time.perf_counter()
+    async with stage_slot(workflow_name):
+        with timed("stage", stage, context, workflow_name):
+            if time.perf_counter() - queued > 0.001:
+                record_span("step", "queue_wait", queued, context, workflow_name)
+            agent, decision = _route(agent, context, stage)
+            if context is not None:
+                context.emit("stage_start", stage=stage, agent=agent.name)
+            started = time.perf_counter()
+            try:
+                result = await _run_with_retries(agent, input_data, context, stage, estimate)
+            except asyncio.TimeoutError:
+                # A stage cut off by the deadline still tells the router its model was slow
+                _settle_route(decision, "timeout", started)
+                raise
+            except Exception:
+                _settle_route(decision, "error", None)
+                raise
+            _settle_route(decision, "ok", started)
+
+            usage = result.context_wrapper.usage
+            settle_usage(usage.requests, usage.total_tokens, estimate)
+            if context is not None:
+                # Each Runner.run counts its own calls, so nested guardrail stages aren't doubled
+                context.usage.append(stage_usage(stage, agent.name, usage))
+                context.emit("stage_end", stage=stage, agent=agent.name)
+    return result
@@ -1,36 +1,79 @@
-import ecooptima
+import background_loop
+import static_assets
+from response_cache import get_response_cache
+from run_context import CHART_MODES, DEFAULT_CHART_MODE
+from session_store import create_session_store
+from usage import usage_totals
 from flask import (
     Flask,
+    Response,
     request,
     render_template,
     url_for,
     jsonify,
-    send_from_directory,
     session,
+    stream_with_context,
 )
-import asyncio
+import json
 import os
-from pathlib import Path
+import queue
+import threading
+import time
 from uuid import uuid4
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "ecooptima-dev-secret")
+# Hashed, pre-compressed static files with immutable caching; gzip/br for JSON and pages
+static_assets.init_app(app)
 
+# Mirrors ecooptima.WORKFLOW_CLASSES without importing the agent stack
+WORKFLOWS = ("community", "consumer", "academic")
 
-conversation_store: dict[str, dict] = {}
 
+# The agents SDK, workflows and their pydantic schemas are only loaded on first real use,
+# so importing app (and serving the static pages) stays cheap
+def _ecooptima():
+    import ecooptima
 
-def _get_session_state() -> dict:
+    return ecooptima
+
+
+# Build the shared workflow instances (and check the static asset build) right after startup,
+# off the request path. Called from gunicorn's post_worker_init hook (and when app.py is run
+# directly); ECOOPTIMA_WARMUP=0 leaves everything to the first requests instead.
+def start_background_warmup() -> threading.Thread | None:
+    if os.environ.get("ECOOPTIMA_WARMUP", "1") == "0":
+        return None
+
+    def warm():
+        if static_assets.STATIC_ASSETS_ENABLED:
+            static_assets.get_manifest()
+        _ecooptima().warm()
+
+    thread = threading.Thread(
+        target=warm,
+        name="ecooptima-warmup",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+# Conversation state per browser session: bounded in memory, or SQLite shared by all workers
+session_store = create_session_store()
+
+
+def _session_id() -> str:
     session_id = session.get("session_id")
     if not session_id:
         session_id = str(uuid4())
         session["session_id"] = session_id
-    if session_id not in conversation_store:
-        conversation_store[session_id] = {
-            "chat_history": [],
-            "last_pipeline_output": "",
-        }
-    return conversation_store[session_id]
+    return session_id
+
+
+def _get_session_state() -> tuple[str, dict]:
+    session_id = _session_id()
+    return session_id, session_store.load(session_id)
 
 
 @app.route("/")
@@ -68,57 +111,375 @@ def government():
     return render_template("government.html")
 
 
-@app.route("/response", methods=["POST"])
-def workFlowRoute():
+# Maintenance endpoints need the X-Admin-Token header to match ECOOPTIMA_ADMIN_TOKEN
+def _is_admin_request() -> bool:
+    admin_token = os.environ.get("ECOOPTIMA_ADMIN_TOKEN")
+    return bool(admin_token) and request.headers.get("X-Admin-Token") == admin_token
+
+
+def _use_cache() -> bool:
+    return request.form.get("noCache", "").strip().lower() not in {"1", "true", "yes"}
+
+
+def _read_workflow_form() -> tuple[str, str, str, str]:
     user_text = request.form.get("userInput", "")
     mode = request.form.get("mode", "analyze").strip().lower()
     workflow = request.form.get("workflow", "community").strip().lower()
+    chart_mode = request.form.get("chartMode", DEFAULT_CHART_MODE).strip().lower()
 
-    if mode not in {"analyze", "followup"}:
+    if mode not in {"analyze", "followup", "fanout"}:
         mode = "analyze"
 
-    if workflow not in {"community", "consumer", "academic"}:
+    if workflow not in WORKFLOWS:
         workflow = "community"
 
-    session_state = _get_session_state()
-    result = asyncio.run(
-        ecooptima.main(
-            user_text, mode=mode, workflow=workflow, session_state=session_state
+    if chart_mode not in CHART_MODES:
+        chart_mode = DEFAULT_CHART_MODE
+
+    return user_text, mode, workflow, chart_mode
+
+
+# Explicit what-if parameters of a follow-up (discount_rate_real, time_horizon_years,
+# household_archetype form fields); without them the follow-up text is parsed for changes
+def _read_scenario_fields() -> dict | None:
+    from scenarios import scenario_from_fields
+
+    return scenario_from_fields(request.form) or None
+
+
+# Target seconds for this request ("latencySlo" form field), within the hard request timeout;
+# without it the routing policy's target for the request kind applies
+def _read_latency_slo() -> float | None:
+    from execution import REQUEST_TIMEOUT
+
+    seconds = request.form.get("latencySlo", type=float)
+    if seconds is None or seconds <= 0:
+        return None
+    return min(seconds, REQUEST_TIMEOUT)
+
+
+# Workflows of a fan-out run: form field "workflows" ("consumer,academic"), default all three
+def _read_fanout_workflows() -> list[str]:
+    requested = request.form.get("workflows", "")
+    workflows = [name.strip().lower() for name in requested.split(",") if name.strip()]
+    workflows = [name for name in dict.fromkeys(workflows) if name in WORKFLOWS]
+    return workflows or list(WORKFLOWS)
+
+
+# Manifest entry for the browser: image charts get a URL, data charts carry their series inline
+def _chart_payload(chart) -> dict:
+    payload = chart.to_dict()
+    if chart.path is not None:
+        payload["url"] = url_for("response_log_file", filename=chart.relative_path)
+    return payload
+
+
+def _response_payload(result) -> dict:
+    charts = [_chart_payload(chart) for chart in result.charts]
+    payload = {
+        "result": result.text,
+        "img_urls": [chart["url"] for chart in charts if "url" in chart],
+        "charts": charts,
+        "cached": result.cached,
+        "similar": result.similar,
+        "usage": usage_totals(result.usage),
+    }
+    if result.outcomes:
+        payload["workflows"] = [
+            {
+                "workflow": outcome.workflow,
+                "status": outcome.status,
+                "error": outcome.error,
+                "result": outcome.result.text if outcome.result else None,
+                "charts": [_chart_payload(chart) for chart in outcome.result.charts]
+                if outcome.result
+                else [],
+                "cached": outcome.result.cached if outcome.result else False,
+            }
+            for outcome in result.outcomes
+        ]
+    return payload
+
+
+def _run_workflow_request(mode: str | None = None):
+    user_text, form_mode, workflow, chart_mode = _read_workflow_form()
+    mode = mode or form_mode
+
+    session_id, session_state = _get_session_state()
+    # Runs on the worker's shared event loop so concurrent requests overlap
+    result = background_loop.run_coroutine(
+        _ecooptima().main(
+            user_text,
+            mode=mode,
+            workflow=workflow,
+            session_state=session_state,
+            chart_mode=chart_mode,
+            use_cache=_use_cache(),
+            workflows=_read_fanout_workflows() if mode == "fanout" else None,
+            session_id=session_id,
+            scenario=_read_scenario_fields() if mode == "followup" else None,
+            latency_slo=_read_latency_slo(),
+        )
+    )
+    session_store.save(session_id, session_state)
+
+    # Charts come straight from the run's manifest
+    return jsonify(_response_payload(result))
+
+
+@app.route("/response", methods=["POST"])
+def workFlowRoute():
+    return _run_workflow_request()
+
+
+# Several workflows ("workflows" form field, default all) on one input, run concurrently.
+# Same as /response with mode=fanout: merged text and charts plus a per-workflow breakdown.
+@app.route("/response/fanout", methods=["POST"])
+def fanout_route():
+    return _run_workflow_request(mode="fanout")
+
+
+def _sse(event: dict) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+# Same inputs as /response, but answers with server-sent events as the run progresses:
+# stage_start/stage_end, tool_call/tool_output, chart_ready (with url), text_delta, then done
+@app.route("/response/stream", methods=["POST"])
+def stream_workflow_route():
+    user_text, mode, workflow, chart_mode = _read_workflow_form()
+    session_id, session_state = _get_session_state()
+
+    # The run emits from the loop thread; this request thread drains the queue into the response
+    events: queue.Queue = queue.Queue()
+    future = background_loop.submit(
+        _ecooptima().main(
+            user_text,
+            mode=mode,
+            workflow=workflow,
+            session_state=session_state,
+            on_event=events.put,
+            chart_mode=chart_mode,
+            use_cache=_use_cache(),
+            workflows=_read_fanout_workflows() if mode == "fanout" else None,
+            session_id=session_id,
+            scenario=_read_scenario_fields() if mode == "followup" else None,
+            latency_slo=_read_latency_slo(),
         )
     )
-    img_urls = []
-    folder_env = os.environ.get("ECOOPTIMA_LOG_DIR")
-    if folder_env and mode == "analyze":
-        folder = Path(folder_env)
-        if folder.exists():
-            for p in sorted(folder.iterdir()):
-                if p.suffix.lower() == ".png":
-                    relative_path = p.relative_to("response_log")
-                    img_urls.append(
-                        url_for("response_log_file", filename=relative_path.as_posix())
-                    )
 
-    return jsonify({"result": result, "img_urls": img_urls})
+    # Saved even if the client disconnects mid-stream; the sentinel goes out after the save
+    def finished(_):
+        try:
+            session_store.save(session_id, session_state)
+        finally:
+            events.put(None)
+
+    future.add_done_callback(finished)
+
+    def generate():
+        while (event := events.get()) is not None:
+            if event["type"] == "chart_ready" and "path" in event["chart"]:
+                event["chart"]["url"] = url_for(
+                    "response_log_file", filename=event["chart"]["path"]
+                )
+            yield _sse(event)
+
+        try:
+            result = future.result()
+        except Exception as e:
+            yield _sse({"type": "error", "message": str(e)})
+            return
+
+        yield _sse({"type": "done", **_response_payload(result)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/reset", methods=["POST"])
 def reset_conversation():
     session_id = session.get("session_id")
-    if session_id and session_id in conversation_store:
-        conversation_store[session_id] = {
-            "chat_history": [],
-            "last_pipeline_output": "",
-        }
+    if session_id:
+        session_store.reset(session_id)
     return jsonify({"status": "ok", "message": "Conversation context cleared."})
 
 
+# Hit rate, latency and size of the shared analyze response cache and chart store
+@app.route("/cache/stats")
+def cache_stats():
+    from chart_store import get_chart_store
+
+    chart_store = get_chart_store()
+    charts = chart_store.stats() if chart_store is not None else {"enabled": False}
+    cache = get_response_cache()
+    if cache is None:
+        return jsonify({"enabled": False, "charts": charts})
+    return jsonify({"enabled": True, **cache.stats(), "charts": charts})
+
+
+# Prometheus scrape target: per-stage/workflow latency histograms and p50/p95/p99, in-flight
+# counts, retry and rate-limit counters. Per worker process.
+@app.route("/metrics")
+def prometheus_metrics():
+    from execution import execution_stats
+    from metrics import get_metrics
+
+    return Response(
+        get_metrics().render(execution_stats()),
+        mimetype="text/plain; version=0.0.4",
+    )
+
+
+# Guardrail model calls avoided by local/cached verdicts in this worker, and the time saved
+@app.route("/guardrail/stats")
+def guardrail_stats():
+    from guardrail import get_guardrail
+
+    return jsonify(get_guardrail().stats())
+
+
+# Model routing in this worker: the policy and the rolling p95 per role and model
+@app.route("/routing/stats")
+def routing_stats():
+    from model_routing import get_router
+
+    router = get_router()
+    if router is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, "policy": router.policy, "latency": router.stats()})
+
+
+# Token usage of this browser session: running totals over its analyses and follow-ups
+@app.route("/usage/session")
+def session_usage():
+    session_id, session_state = _get_session_state()
+    return jsonify({"session_id": session_id, "usage": session_state.get("usage") or {}})
+
+
+def _usage_filters() -> dict:
+    hours = request.args.get("since_hours", type=float)
+    return {
+        "since": time.time() - hours * 3600 if hours else None,
+        "workflow": request.args.get("workflow") or None,
+    }
+
+
+# Usage across all sessions: ?group_by=workflow|stage|session|run, optional workflow= and
+# since_hours=. Admin only, since it lists other sessions and runs.
+@app.route("/usage")
+def usage_summary():
+    if not _is_admin_request():
+        return jsonify({"status": "error", "message": "Admin token required."}), 403
+    from usage import GROUP_COLUMNS, get_usage_store
+
+    usage_store = get_usage_store()
+    if usage_store is None:
+        return jsonify({"enabled": False})
+    group_by = request.args.get("group_by", "workflow")
+    if group_by not in GROUP_COLUMNS:
+        message = f"group_by must be one of {', '.join(GROUP_COLUMNS)}"
+        return jsonify({"status": "error", "message": message}), 400
+    rows = usage_store.summary(
+        group_by,
+        session_id=request.args.get("session_id") or None,
+        limit=request.args.get("limit", 100, type=int),
+        **_usage_filters(),
+    )
+    return jsonify({"enabled": True, "group_by": group_by, "rows": rows})
+
+
+# Stage calls with the largest prompts (input tokens), with the run id to open its logs
+@app.route("/usage/prompts")
+def usage_prompts():
+    if not _is_admin_request():
+        return jsonify({"status": "error", "message": "Admin token required."}), 403
+    from usage import get_usage_store
+
+    usage_store = get_usage_store()
+    if usage_store is None:
+        return jsonify({"enabled": False})
+    rows = usage_store.largest_prompts(
+        limit=request.args.get("limit", 20, type=int), **_usage_filters()
+    )
+    return jsonify({"enabled": True, "rows": rows})
+
+
+# Recent runs, newest first: optional workflow=, session_id=, status=, since_hours=, limit=.
+# Admin only; summaries leave out outputs and timing spans (see /runs/<run_id>).
+@app.route("/runs")
+def run_log_query():
+    if not _is_admin_request():
+        return jsonify({"status": "error", "message": "Admin token required."}), 403
+    from run_log import get_run_log
+
+    run_log = get_run_log()
+    if run_log is None:
+        return jsonify({"enabled": False})
+    records = run_log.query(
+        session_id=request.args.get("session_id") or None,
+        status=request.args.get("status") or None,
+        limit=min(request.args.get("limit", 50, type=int), 1000),
+        **_usage_filters(),
+    )
+    runs = [
+        {
+            "run_id": record.run_id,
+            "created_at": record.created_at,
+            "workflow": record.workflow,
+            "session_id": record.session_id,
+            "kind": record.kind,
+            "status": record.status,
+            "seconds": record.seconds,
+            "input": record.input,
+            "charts": len(record.charts),
+            "total_tokens": sum(stage["total_tokens"] for stage in record.usage),
+        }
+        for record in records
+    ]
+    return jsonify({"enabled": True, "stats": run_log.stats(), "runs": runs})
+
+
+@app.route("/runs/<run_id>")
+def run_log_record(run_id: str):
+    if not _is_admin_request():
+        return jsonify({"status": "error", "message": "Admin token required."}), 403
+    from dataclasses import asdict
+
+    from run_log import get_run_log
+
+    run_log = get_run_log()
+    record = run_log.get(run_id) if run_log is not None else None
+    if record is None:
+        return jsonify({"status": "error", "message": "Unknown run."}), 404
+    return jsonify(asdict(record))
+
+
+# Explicit invalidation: one workflow's entries (form field "workflow") or everything
+@app.route("/cache/invalidate", methods=["POST"])
+def cache_invalidate():
+    if not _is_admin_request():
+        return jsonify({"status": "error", "message": "Admin token required."}), 403
+
+    cache = get_response_cache()
+    if cache is None:
+        return jsonify({"status": "ok", "removed": 0})
+    workflow = request.form.get("workflow", "").strip().lower() or None
+    removed = cache.invalidate(workflow_name=workflow)
+    return jsonify({"status": "ok", "removed": removed})
+
+
 @app.route("/response_log/<path:filename>")
 def response_log_file(filename: str):
-    return send_from_directory("response_log", filename)
+    return static_assets.serve_chart_image(filename)
 
 
 port = int(os.environ.get("PORT", 10000))
 
 if __name__ == "__main__":
+    start_background_warmup()
     app.run(host="0.0.0.0", port=port) # DEPLOYMENT FOR ONLINE HOST --- DO NOT COMMENT OUT DURING COMMITS
     # app.run(debug=True)                  # DEPLOYMENT FOR LOCAL HOST --- THIS MUST BE LEFT COMMNETED OUT DURING COMMITS
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Coroutine
+
+
+################################
+### SHARED WORKER EVENT LOOP ###
+################################
+
+
+# One long-lived event loop per worker process, driven from a daemon thread.
+# Flask request threads hand their coroutines to it instead of calling asyncio.run,
+# so concurrent /response requests share one loop (and the SDK's HTTP client state).
+class BackgroundLoop:
+    def __init__(self, name: str = "ecooptima-loop"):
+        self.name = name
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+
+    def _is_running(self) -> bool:
+        # gunicorn forks workers after import, and the loop thread does not survive a fork
+        return (
+            self._loop is not None
+            and self._thread is not None
+            and self._thread.is_alive()
+            and self._pid == os.getpid()
+        )
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._is_running():
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run_forever():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=_run_forever, name=self.name, daemon=True)
+            thread.start()
+            ready.wait()
+
+            self._loop = loop
+            self._thread = thread
+            self._pid = os.getpid()
+            return loop
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self.start()
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[Any, Any, Any], timeout: float | None = None) -> Any:
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self) -> None:
+        with self._lock:
+            if not self._is_running():
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+
+
+_background_loop = BackgroundLoop()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    return _background_loop.loop
+
+
+def submit(coro: Coroutine[Any, Any, Any]) -> Future:
+    return _background_loop.submit(coro)
+
+
+# Blocking helper for sync (WSGI) callers: runs the coroutine on the shared loop
+def run_coroutine(coro: Coroutine[Any, Any, Any], timeout: float | None = None) -> Any:
+    return _background_loop.run(coro, timeout=timeout)
@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from run_context import CHART_MODES, DEFAULT_CHART_MODE, ChartMode
+
+
+# Offline batch runs: python batch.py sweeps.jsonl results.jsonl --concurrency 8
+#
+# Each input line is {"workflow": ..., "input": ..., "id": optional}; records without an id are
+# keyed by line number. Results are appended to the output file as each record finishes, one
+# JSON line each, flushed and fsynced. The output file doubles as the checkpoint: a rerun
+# skips every record id already in it, so an interrupted batch resumes where it stopped.
+
+
+@dataclass
+class BatchReport:
+    total: int = 0
+    skipped: int = 0
+    ok: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    latencies: list[float] = field(default_factory=list, repr=False)
+
+    @property
+    def completed(self) -> int:
+        return self.ok + self.failed
+
+    @property
+    def records_per_minute(self) -> float:
+        return self.completed / self.seconds * 60 if self.seconds else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[int(fraction * (len(ordered) - 1))]
+
+    def summary(self) -> str:
+        return (
+            f"{self.completed}/{self.total - self.skipped} records in {self.seconds:.1f} s "
+            f"({self.records_per_minute:.1f}/min), ok={self.ok} failed={self.failed} "
+            f"skipped={self.skipped}, per record p50={self.percentile(0.5):.1f} s "
+            f"p95={self.percentile(0.95):.1f} s"
+        )
+
+
+def read_records(path: Path) -> list[dict]:
+    records = []
+    with path.open(encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record["id"] = str(record.get("id", line_number))
+            records.append(record)
+    return records
+
+
+# Record ids already written by an earlier run. A torn last line (the process died mid-write)
+# is cut off so the file stays valid JSONL; a line only counts once its newline is on disk,
+# since a write cut short can still parse ('{"id": 1}' of '{"id": 12, ...}').
+def completed_ids(output_path: Path, retry_failed: bool = False) -> set[str]:
+    if not output_path.exists():
+        return set()
+    done: set[str] = set()
+    valid_bytes = 0
+    with output_path.open("rb") as handle:
+        for line in handle:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                result = json.loads(line)
+            except ValueError:
+                break
+            valid_bytes += len(line)
+            if result.get("status") == "ok" or not retry_failed:
+                done.add(str(result["id"]))
+    if valid_bytes < output_path.stat().st_size:
+        with output_path.open("r+b") as handle:
+            handle.truncate(valid_bytes)
+    return done
+
+
+async def _run_record(record: dict, chart_mode: ChartMode, use_cache: bool) -> dict:
+    from ecooptima import run_pipeline
+
+    started = time.perf_counter()
+    result = {"id": record["id"], "workflow": record.get("workflow"), "input": record.get("input")}
+    try:
+        pipeline_result = await run_pipeline(
+            record["input"],
+            record.get("workflow", "community"),
+            chart_mode=chart_mode,
+            use_cache=use_cache,
+        )
+        result.update(
+            status="ok",
+            result=pipeline_result.text,
+            charts=[chart.to_dict() for chart in pipeline_result.charts],
+            cached=pipeline_result.cached,
+        )
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def run_batch(
+    records: list[dict],
+    output_path: Path,
+    concurrency: int = 4,
+    chart_mode: ChartMode = DEFAULT_CHART_MODE,
+    use_cache: bool = True,
+    retry_failed: bool = False,
+    progress_every: int = 10,
+) -> BatchReport:
+    done = completed_ids(output_path, retry_failed)
+    pending = [record for record in records if record["id"] not in done]
+    report = BatchReport(total=len(records), skipped=len(records) - len(pending))
+    queue = iter(pending)
+    started = time.perf_counter()
+
+    with output_path.open("a", encoding="utf-8") as output:
+
+        def write(result: dict):
+            # Only the loop thread writes, so lines never interleave
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            os.fsync(output.fileno())
+
+            report.latencies.append(result["seconds"])
+            if result["status"] == "ok":
+                report.ok += 1
+            else:
+                report.failed += 1
+            report.seconds = time.perf_counter() - started
+            if progress_every and report.completed % progress_every == 0:
+                print(f"[batch] {report.summary()}", file=sys.stderr)
+
+        # `concurrency` workers pull from one iterator, so at most that many records are in flight
+        async def worker():
+            for record in queue:
+                write(await _run_record(record, chart_mode, use_cache))
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of {workflow, input} records")
+    parser.add_argument("input", type=Path)
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--chart-mode", choices=CHART_MODES, default=DEFAULT_CHART_MODE)
+    parser.add_argument("--no-cache", action="store_true", help="bypass the response cache")
+    parser.add_argument("--retry-failed", action="store_true", help="rerun records that errored")
+    parser.add_argument("--progress-every", type=int, default=10)
+    args = parser.parse_args()
+
+    report = asyncio.run(
+        run_batch(
+            read_records(args.input),
+            args.output,
+            concurrency=args.concurrency,
+            chart_mode=args.chart_mode,
+            use_cache=not args.no_cache,
+            retry_failed=args.retry_failed,
+            progress_every=args.progress_every,
+        )
+    )
+    print(report.summary())
+    sys.exit(1 if report.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chart_render import BarChartSpec, render_bar_chart, render_bar_chart_async
+
+
+# Charts per second and event-loop stall while rendering:
+#   inline - render_bar_chart called on the loop thread (what the sync tool used to do)
+#   pool   - render_bar_chart_async, i.e. the chart worker pool used by plot_bar_chart
+# A 1 ms ticker runs on the loop; its worst lateness is the longest stall any other request would see.
+
+
+def _spec(index: int, bars: int) -> BarChartSpec:
+    return BarChartSpec(
+        labels=tuple(f"Option {index}-{n}" for n in range(bars)),
+        values=tuple(float((n * 37 + index) % 250) for n in range(bars)),
+        metric_name="Cost per tCO2e (USD)",
+        title=f"Benchmark chart {index}",
+    )
+
+
+async def _ticker(stop: asyncio.Event, stalls: list[float]):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        stalls.append(time.perf_counter() - start - 0.001)
+
+
+async def _run(mode: str, charts: int, bars: int, concurrency: int, out_dir: Path):
+    stop = asyncio.Event()
+    stalls: list[float] = []
+    ticker = asyncio.create_task(_ticker(stop, stalls))
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        path = str(out_dir / f"{mode}-{index}.png")
+        async with limit:
+            if mode == "inline":
+                render_bar_chart(_spec(index, bars), path)
+                await asyncio.sleep(0)
+            else:
+                await render_bar_chart_async(_spec(index, bars), path)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(charts)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+
+    stalls.sort()
+    p99 = stalls[int(0.99 * (len(stalls) - 1))] if stalls else 0.0
+    print(
+        f"{mode:<7} charts={charts:<4} {charts / elapsed:7.1f} charts/s  "
+        f"loop stall max={max(stalls, default=0.0) * 1000:7.1f} ms p99={p99 * 1000:6.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chart rendering throughput and loop stall")
+    parser.add_argument("--charts", type=int, default=40)
+    parser.add_argument("--bars", type=int, default=12)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("inline", "pool"):
+            asyncio.run(_run(mode, args.charts, args.bars, args.concurrency, Path(tmp)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import asyncio
+import json
+import random
+import time
+
+import httpx
+import openai
+from agents import Model, ModelProvider, ModelResponse, Usage
+from agents.usage import InputTokensDetails, OutputTokensDetails
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseCreatedEvent,
+    ResponseFunctionToolCall,
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseTextDeltaEvent,
+)
+
+
+# Offline stand-in for the OpenAI model behind every agent, for benchmarks and smoke runs:
+#   agent_runner.set_model_provider(FakeProvider(FakeModel(latency=0.2, error_rate=0.1)))
+# Structured stages get canned outputs of their schema (guardrail verdict, plant matrix,
+# consumer/academic MACC), chart stages call plot_bar_chart once and then answer in prose.
+# Latency and injected 429s (with a Retry-After header) are seeded, so runs are repeatable.
+
+GUARDRAIL_OUTPUT = {"is_eco_optima": True, "reasoning": "Asks which plants suit a site."}
+PLANT_MATRIX_RESULT = {
+    "rankings": [
+        {"species": "White Oak", "size": "60-80 ft", "survivial_probability": "high",
+         "maintenance_costs": "low"},
+        {"species": "Eastern Redbud", "size": "20-30 ft", "survivial_probability": "high",
+         "maintenance_costs": "low"},
+        {"species": "Swamp Milkweed", "size": "3-5 ft", "survivial_probability": "medium",
+         "maintenance_costs": "medium"},
+    ]
+}
+CHART_ARGS = {
+    "series": [
+        {"label": "LED retrofit", "value": -120},
+        {"label": "Insulation", "value": "35 usd"},
+        {"label": "Heat pump", "value": 85},
+    ],
+    "metric_name": "cost_per_tCO2e_usd",
+    "title": "Marginal abatement cost",
+}
+PROSE = "Findings: native oaks and redbuds fit the site. Takeaways: start with the LED retrofit."
+
+
+def consumer_macc_result() -> dict:
+    return {
+        "assumptions": {
+            "location": "Cincinnati, Ohio",
+            "household_archetype": "mixed",
+            "discount_rate_real": 0.04,
+            "grid_emissions_basis": "eGRID RFCW average",
+            "key_notes": ["Canned output of bench/fake_model.py"],
+        },
+        "options": [
+            {
+                "option_id": f"c{index}",
+                "category": "home",
+                "description": f"Household option {index}",
+                "annual_abatement_tCO2e": 0.5 * (index + 1),
+                "lifetime_years": 10 + index,
+                "net_present_cost_usd": 500 * index - 1000,
+                "homeowner_feasible": True,
+                "renter_feasible": [True, False, "Limited"][index % 3],
+                "notes": "",
+            }
+            for index in range(6)
+        ],
+        "narrative": "Cheapest abatement first: lighting, then envelope, then heating.",
+    }
+
+
+def academic_macc_result() -> dict:
+    return {
+        "assumptions": {
+            "institution_type": "mixed",
+            "region": "US",
+            "discount_rate_real": 0.04,
+            "time_horizon_years": 20,
+            "research_attribution_method": "share of funded projects",
+            "workforce_attribution_method": "graduates in the field",
+            "key_notes": ["Canned output of bench/fake_model.py"],
+        },
+        "options": [
+            {
+                "option_id": f"a{index}",
+                "category": "campus_operations",
+                "description": f"Campus option {index}",
+                "cost_usd": 1000 * index - 2000,
+                "lifetime_years": 10 + index,
+                "operational_abatement_tCO2e": index + 1,
+                "research_spillover_tCO2e": 0.5 * index,
+                "workforce_spillover_tCO2e": 0.2 * index,
+                "notes": "",
+            }
+            for index in range(5)
+        ],
+        "narrative": "Operational savings carry the curve; research spillovers extend it.",
+    }
+
+
+def rate_limit_error(retry_after: float) -> openai.RateLimitError:
+    response = httpx.Response(
+        429,
+        headers={"retry-after-ms": str(int(retry_after * 1000))},
+        request=httpx.Request("POST", "https://api.openai.com/v1/responses"),
+    )
+    return openai.RateLimitError("Rate limit reached (injected)", response=response, body=None)
+
+
+def _message(text: str) -> ResponseOutputMessage:
+    return ResponseOutputMessage(
+        id="msg_fake",
+        type="message",
+        role="assistant",
+        status="completed",
+        content=[ResponseOutputText(type="output_text", text=text, annotations=[])],
+    )
+
+
+class FakeModel(Model):
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        retry_after: float = 0.0,
+        output_tokens: int = 60,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.output_tokens = output_tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _output(self, system_instructions, input, output_schema, tools) -> list:
+        if output_schema is not None and not output_schema.is_plain_text():
+            name = output_schema.name()
+            if "Guardrail" in name:
+                body = GUARDRAIL_OUTPUT
+            elif "PlantMatrix" in name:
+                body = PLANT_MATRIX_RESULT
+            elif "academic" in (system_instructions or "").lower():
+                body = academic_macc_result()
+            else:
+                body = consumer_macc_result()
+            return [_message(json.dumps(body))]
+
+        items = input if isinstance(input, list) else []
+        charted = any(isinstance(item, dict) and item.get("type") == "function_call_output"
+                      for item in items)
+        if not charted and any(getattr(tool, "name", None) == "plot_bar_chart" for tool in tools):
+            return [
+                ResponseFunctionToolCall(
+                    id="fc_fake",
+                    call_id=f"call_{self.calls}",
+                    type="function_call",
+                    name="plot_bar_chart",
+                    arguments=json.dumps(CHART_ARGS),
+                )
+            ]
+        return [_message(PROSE)]
+
+    def _usage(self, system_instructions, input) -> Usage:
+        # About four characters per token, like English text through the real tokenizer
+        input_tokens = (len(system_instructions or "") + len(json.dumps(input, default=str))) // 4
+        return Usage(
+            requests=1,
+            input_tokens=input_tokens,
+            output_tokens=self.output_tokens,
+            total_tokens=input_tokens + self.output_tokens,
+            input_tokens_details=InputTokensDetails(cached_tokens=0),
+            output_tokens_details=OutputTokensDetails(reasoning_tokens=0),
+        )
+
+    async def _call(self) -> None:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+        finally:
+            self.in_flight -= 1
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            raise rate_limit_error(self.retry_after)
+
+    async def get_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id=None,
+        conversation_id=None,
+        prompt=None,
+    ) -> ModelResponse:
+        await self._call()
+        return ModelResponse(
+            output=self._output(system_instructions, input, output_schema, tools),
+            usage=self._usage(system_instructions, input),
+            response_id=None,
+        )
+
+    async def stream_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id=None,
+        conversation_id=None,
+        prompt=None,
+    ):
+        await self._call()
+        output = self._output(system_instructions, input, output_schema, tools)
+        response = Response(
+            id="resp_fake",
+            created_at=time.time(),
+            model="fake",
+            object="response",
+            output=output,
+            parallel_tool_calls=False,
+            tool_choice="auto",
+            tools=[],
+            usage=None,
+        )
+        yield ResponseCreatedEvent(type="response.created", response=response, sequence_number=0)
+        sequence = 1
+        for item in output:
+            if isinstance(item, ResponseOutputMessage):
+                for word in item.content[0].text.split(" "):
+                    yield ResponseTextDeltaEvent(
+                        type="response.output_text.delta",
+                        delta=word + " ",
+                        item_id=item.id,
+                        output_index=0,
+                        content_index=0,
+                        sequence_number=sequence,
+                        logprobs=[],
+                    )
+                    sequence += 1
+        yield ResponseCompletedEvent(
+            type="response.completed", response=response, sequence_number=sequence
+        )
+
+
+class FakeProvider(ModelProvider):
+    def __init__(self, model: FakeModel):
+        self.model = model
+
+    def get_model(self, model_name: str | None) -> Model:
+        return self.model
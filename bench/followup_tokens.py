@@ -0,0 +1,120 @@
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from followup_context import (
+    FOLLOWUP_TOKEN_BUDGET,
+    build_followup_payload,
+    count_tokens,
+    roll_history,
+)
+from session_store import SESSION_HISTORY_TURNS
+
+
+# Prompt tokens per follow-up, before and after the budgeted context builder.
+#   before - last_pipeline_output verbatim plus the last 8 chat messages (the old run_followup)
+#   after  - build_followup_payload within ECOOPTIMA_FOLLOWUP_TOKENS
+# One analysis (verbose ROI prose, plus a MaccResult for consumer) is followed by --followups
+# questions with long-ish answers; the table shows the prompt at a few points in that chat.
+
+WORDS = (
+    "the option reduces household emissions through lower grid demand and the payback period "
+    "depends on local rates incentives and financing while renters face limited feasibility"
+).split()
+
+
+def _prose(rng: random.Random, words: int) -> str:
+    sentences = []
+    while sum(len(sentence.split()) for sentence in sentences) < words:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20)))
+        sentences.append(sentence.capitalize() + ".")
+    return " ".join(sentences)
+
+
+def _macc_result(rng: random.Random, options: int) -> dict:
+    return {
+        "assumptions": {"location": "Cincinnati, Ohio", "household_archetype": "mixed",
+                        "discount_rate_real": 0.04, "key_notes": [_prose(rng, 25)]},
+        "options": [
+            {
+                "option_id": f"opt_{n}",
+                "category": rng.choice(["home energy", "transport", "efficiency", "behavior"]),
+                "description": _prose(rng, 15),
+                "annual_abatement_tCO2e": round(rng.uniform(0.1, 3), 2),
+                "lifetime_years": rng.randint(1, 20),
+                "net_present_cost_usd": round(rng.uniform(-2000, 9000), 2),
+                "homeowner_feasible": True,
+                "renter_feasible": rng.choice([True, False, "Limited"]),
+                "notes": _prose(rng, 30),
+                "lifetime_abatement_tCO2e": round(rng.uniform(1, 40), 2),
+                "cost_per_tCO2e_usd": round(rng.uniform(-100, 400), 2),
+            }
+            for n in range(options)
+        ],
+        "sorted_option_ids": [f"opt_{n}" for n in range(options)],
+        "cumulative_abatement_tCO2e": [float(n) for n in range(options)],
+        "narrative": _prose(rng, 120),
+    }
+
+
+def _before(state: dict, question: str) -> int:
+    payload = {
+        "latest_workflow_output": state["last_pipeline_output"],
+        "chat_history": state["chat_history"][-8:],
+        "user_followup": question,
+    }
+    return count_tokens(json.dumps(payload))
+
+
+def _after(state: dict, question: str, budget: int) -> int:
+    return count_tokens(json.dumps(build_followup_payload(state, question, budget)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow-up prompt tokens before/after")
+    parser.add_argument("--followups", type=int, default=20)
+    parser.add_argument("--output-words", type=int, default=1500)
+    parser.add_argument("--reply-words", type=int, default=250)
+    parser.add_argument("--budget", type=int, default=FOLLOWUP_TOKEN_BUDGET)
+    args = parser.parse_args()
+
+    checkpoints = sorted({1, 2, 5, 10, args.followups} & set(range(1, args.followups + 1)))
+    for workflow in ("community", "consumer"):
+        rng = random.Random(11)
+        output = _prose(rng, args.output_words)
+        state = {
+            "last_pipeline_output": output,
+            "last_macc_result": _macc_result(rng, 12) if workflow == "consumer" else None,
+            "chat_history": [
+                {"role": "user", "content": "Which actions should we prioritise?"},
+                {"role": "assistant", "content": output},
+            ],
+        }
+
+        print(f"{workflow} (budget {args.budget} tokens)")
+        totals = [0, 0]
+        for followup in range(1, args.followups + 1):
+            question = f"Follow-up {followup}: {_prose(rng, 20)}"
+            before, after = _before(state, question), _after(state, question, args.budget)
+            totals[0] += before
+            totals[1] += after
+            if followup in checkpoints:
+                print(f"  follow-up {followup:>3}: before {before:>6}  after {after:>6} tokens")
+
+            state["chat_history"] += [
+                {"role": "user", "content": question},
+                {"role": "assistant", "content": _prose(rng, args.reply_words)},
+            ]
+            roll_history(state, keep_last=SESSION_HISTORY_TURNS)
+        print(
+            f"  total over {args.followups}: before {totals[0]:,}  after {totals[1]:,} "
+            f"({1 - totals[1] / totals[0]:.0%} fewer)"
+        )
+
+
+if __name__ == "__main__":
+    main()
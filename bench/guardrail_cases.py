@@ -0,0 +1,61 @@
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from guardrail import LocalGuardrail
+from plant_matrix import get_plant_matrix
+
+
+# Local guardrail verdicts on known inputs. Accepted inputs must be settled locally (no model
+# call); the others may go to the LLM or be rejected locally, but never be accepted without it.
+# Exits non-zero on any mismatch, so a keyword or threshold change that brings back a false
+# accept fails here.
+
+ACCEPTED = (
+    # The example questions on the app's pages
+    "What plants should I use for a community park with a budget of 5000 dollars?",
+    "What plants should I use for a mini forest in Ohio?",
+    "What plant bundles should I use for LEED implementation?",
+    "which trees should we plant in the community park",
+    "native shrubs for a school yard with clay soil",
+    "which white oak trees should we plant along the street",
+)
+
+NOT_ACCEPTED = (
+    # Site and place words are no plant context
+    "the power plant emissions in clay county",
+    "Oak Ridge National Lab salary in sandy springs",
+    "best shade of red paint for my garden shed",
+    # A species name and its own head word are one mention, not two signals
+    "how to kill my neighbor and bury him under an oak tree",
+    "how to kill my neighbor and bury him under a white oak tree",
+    # Two generic keywords
+    "the plant manager salary at the garden center",
+    "best laptop with a landscape screen",
+    "will it rain in my garden tomorrow",
+    "what is the weather tomorrow",
+)
+
+
+def main():
+    argparse.ArgumentParser(description="Local guardrail verdicts on known inputs").parse_args()
+
+    guardrail = LocalGuardrail(get_plant_matrix())
+    failures = 0
+    for expected, inputs in ((True, ACCEPTED), (False, NOT_ACCEPTED)):
+        for text in inputs:
+            verdict = guardrail.classify(text)
+            accepted = verdict is not None and verdict.is_eco_optima
+            label = "llm" if verdict is None else f"{verdict.source}:{verdict.is_eco_optima}"
+            ok = accepted == expected
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {label:<14} {text}")
+
+    print(f"{failures} failure(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
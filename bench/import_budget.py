@@ -0,0 +1,84 @@
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BUDGET_FILE = Path(__file__).resolve().parent / "import_budget.json"
+
+
+# Import-time budget check built on `python -X importtime`.
+# Each entry point in import_budget.json is imported in a fresh interpreter (best of --runs),
+# the per-module self/cumulative costs are recorded, and the script exits non-zero when an
+# entry point goes over its budget or pulls in a module it must leave for first real use.
+
+
+def _measure(module: str) -> dict[str, tuple[int, int]]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    costs: dict[str, tuple[int, int]] = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        costs[name.strip()] = (int(self_us), int(cumulative_us))
+    return costs
+
+
+def _best_of(module: str, runs: int) -> dict[str, tuple[int, int]]:
+    best: dict[str, tuple[int, int]] = {}
+    for _ in range(runs):
+        for name, cost in _measure(module).items():
+            if name not in best or cost[1] < best[name][1]:
+                best[name] = cost
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget check")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budgets", type=Path, default=BUDGET_FILE)
+    parser.add_argument("--json", type=Path, help="write every module's cost here")
+    args = parser.parse_args()
+
+    budgets = json.loads(args.budgets.read_text(encoding="utf-8"))
+    report: dict[str, dict] = {}
+    failures: list[str] = []
+
+    for entry_point, budget in budgets.items():
+        costs = _best_of(entry_point, args.runs)
+        total_ms = costs[entry_point][1] / 1000
+        report[entry_point] = {
+            name: {"self_us": self_us, "cumulative_us": cumulative_us}
+            for name, (self_us, cumulative_us) in costs.items()
+        }
+
+        print(f"{entry_point}: {total_ms:.1f} ms (budget {budget['budget_ms']} ms)")
+        slowest = sorted(costs.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (self_us, cumulative_us) in slowest[1 : args.top + 1]:
+            print(f"    {cumulative_us / 1000:9.1f} ms  {self_us / 1000:7.1f} ms self  {name}")
+
+        if total_ms > budget["budget_ms"]:
+            failures.append(f"{entry_point} took {total_ms:.1f} ms > {budget['budget_ms']} ms")
+        for forbidden in budget.get("forbidden", []):
+            if forbidden in costs:
+                failures.append(f"{entry_point} imports {forbidden} eagerly")
+
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+# Offline load test of the web app: python bench/loadbench.py --levels 1,4,16,32
+#
+# Starts app.py in a child process on a local port (threaded WSGI server), with every agent
+# backed by bench/fake_model.py: canned PlantMatrixResult / MaccResult outputs, real
+# plot_bar_chart calls rendered by matplotlib, configurable latency and token counts. No
+# network or API key is needed. At each concurrency level, that many virtual users loop for
+# --duration seconds over: analyze (/response, rotating workflows and inputs), follow-up, and
+# /reset. Per level it reports requests/s, latency percentiles per route, errors, and the
+# server's CPU use and resident memory.
+
+WORKFLOWS = ("community", "consumer", "academic")
+SITES = ("school yard", "church lot", "backyard", "riverbank", "parking strip", "rooftop")
+SOILS = ("clay", "sandy", "loamy", "wet", "rocky")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+##############
+### SERVER ###
+##############
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # Peak instead of current RSS (macOS reports bytes, Linux kilobytes)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def serve(args) -> None:
+    os.environ.setdefault("OPENAI_API_KEY", "sk-offline")
+    os.environ["ECOOPTIMA_DATA_DIR"] = str(Path.cwd() / "ecooptima_data")
+
+    from agents import set_tracing_disabled
+    from werkzeug.serving import make_server
+
+    from agent_runner import set_model_provider
+    from bench.fake_model import FakeModel, FakeProvider
+
+    set_tracing_disabled(True)
+    set_model_provider(
+        FakeProvider(
+            FakeModel(latency=args.latency, jitter=args.jitter, output_tokens=args.output_tokens)
+        )
+    )
+
+    import app as webapp
+
+    # Bench-only: the driver samples the server's CPU time and memory between levels
+    @webapp.app.route("/_bench/stats")
+    def bench_stats():
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return {"cpu_seconds": usage.ru_utime + usage.ru_stime, "rss_mb": _rss_mb()}
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    webapp.start_background_warmup()
+    server = make_server("127.0.0.1", args.port, webapp.app, threaded=True)
+    print("ready", flush=True)
+    server.serve_forever()
+
+
+##############
+### DRIVER ###
+##############
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = {}
+        self.errors = 0
+
+    def add(self, route: str, seconds: float, ok: bool) -> None:
+        with self.lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors += 1
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def _user(base: str, user: int, stop_at: float, recorder: Recorder, use_cache: bool) -> None:
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def post(route: str, label: str, **form) -> None:
+        started = time.perf_counter()
+        ok = False
+        try:
+            data = urllib.parse.urlencode(form).encode()
+            with opener.open(base + route, data=data, timeout=300) as response:
+                body = json.loads(response.read())
+                ok = body.get("status", "ok") == "ok"
+        except Exception:
+            ok = False
+        recorder.add(label, time.perf_counter() - started, ok)
+
+    iteration = 0
+    while time.perf_counter() < stop_at:
+        workflow = WORKFLOWS[(user + iteration) % len(WORKFLOWS)]
+        site = SITES[(user * 7 + iteration) % len(SITES)]
+        soil = SOILS[(user + iteration * 3) % len(SOILS)]
+        post(
+            "/response",
+            "analyze",
+            userInput=f"Which native plants suit a {soil} soil {site} in Cincinnati? user {user}",
+            workflow=workflow,
+            noCache="0" if use_cache else "1",
+        )
+        post("/response", "followup", userInput="Which option is cheapest?", mode="followup")
+        post("/reset", "reset")
+        iteration += 1
+
+
+def _stats(base: str) -> dict:
+    with urllib.request.urlopen(base + "/_bench/stats", timeout=30) as response:
+        return json.loads(response.read())
+
+
+def drive(args) -> None:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        command = [
+            sys.executable, str(Path(__file__).resolve()), "--serve", "--port", str(port),
+            "--latency", str(args.latency), "--jitter", str(args.jitter),
+            "--output-tokens", str(args.output_tokens),
+        ]
+        server = subprocess.Popen(command, cwd=tmp, stdout=subprocess.PIPE, text=True)
+        try:
+            if server.stdout.readline().strip() != "ready":
+                raise SystemExit("server did not start")
+            baseline = _stats(base)
+            print(
+                f"fake model latency {args.latency * 1000:.0f} ms (+{args.jitter * 1000:.0f} ms "
+                f"jitter), server rss {baseline['rss_mb']:.0f} MB at start"
+            )
+            print(
+                f"{'users':>5} {'req/s':>7} {'analyze p50/p95/p99 (s)':>24} "
+                f"{'followup p50/p95':>17} {'reset p50':>10} {'errors':>6} {'cpu %':>6} "
+                f"{'rss MB':>7}"
+            )
+            for users in args.levels:
+                recorder = Recorder()
+                before = _stats(base)
+                started = time.perf_counter()
+                stop_at = started + args.duration
+                threads = [
+                    threading.Thread(
+                        target=_user, args=(base, user, stop_at, recorder, args.cache)
+                    )
+                    for user in range(users)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - started
+                after = _stats(base)
+
+                analyze = recorder.latencies.get("analyze", [])
+                followup = recorder.latencies.get("followup", [])
+                reset = recorder.latencies.get("reset", [])
+                total = len(analyze) + len(followup) + len(reset)
+                cpu = (after["cpu_seconds"] - before["cpu_seconds"]) / elapsed * 100
+                print(
+                    f"{users:>5} {total / elapsed:>7.1f} "
+                    f"{_percentile(analyze, 0.5):>8.2f}/{_percentile(analyze, 0.95):.2f}/"
+                    f"{_percentile(analyze, 0.99):.2f} "
+                    f"{_percentile(followup, 0.5):>11.2f}/{_percentile(followup, 0.95):.2f} "
+                    f"{_percentile(reset, 0.5) * 1000:>8.1f}ms {recorder.errors:>6} "
+                    f"{cpu:>6.0f} {after['rss_mb']:>7.0f}"
+                )
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline /response and /reset load benchmark")
+    parser.add_argument("--levels", type=lambda text: [int(n) for n in text.split(",")],
+                        default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--duration", type=float, default=15, help="seconds per level")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake model call latency")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--output-tokens", type=int, default=400)
+    parser.add_argument("--cache", action="store_true", help="let the response cache answer")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+    else:
+        drive(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as ecooptima_app
+import ecooptima
+
+
+# Compares how many concurrent analyses one worker process holds:
+#   legacy  - one sync worker thread, asyncio.run per request (today's gunicorn default)
+#   shared  - gthread worker, every request on the shared background loop
+# The pipeline is replaced by an asyncio.sleep of the configured latency so no model calls are made.
+
+
+def _install_fake_pipeline(latency: float):
+    async def fake_main(user_text, mode="analyze", workflow="community", session_state=None):
+        await asyncio.sleep(latency)
+        return ecooptima.PipelineResult(text=f"{workflow}:{mode}:{user_text}")
+
+    ecooptima.main = fake_main
+
+
+def _legacy_run(coro):
+    return asyncio.run(coro)
+
+
+def _drive(requests: int, threads: int) -> list[float]:
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def one(index: int):
+        client = ecooptima_app.app.test_client()
+        start = time.perf_counter()
+        response = client.post(
+            "/response",
+            data={"userInput": f"query {index}", "mode": "analyze", "workflow": "community"},
+        )
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200
+        with lock:
+            latencies.append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(requests)))
+    return latencies
+
+
+def _report(label: str, wall: float, latencies: list[float]):
+    latencies.sort()
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(
+        f"{label:<8} requests={len(latencies):<5} wall={wall:7.2f}s "
+        f"rps={len(latencies) / wall:7.2f} p50={statistics.median(latencies):6.2f}s p95={p95:6.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent analyses per worker")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=2.0, help="simulated pipeline seconds")
+    parser.add_argument("--threads", type=int, default=32, help="gthread threads per worker")
+    args = parser.parse_args()
+
+    _install_fake_pipeline(args.latency)
+
+    # Legacy: a sync worker serves one request at a time and builds a fresh loop for each
+    original_runner = ecooptima_app.background_loop.run_coroutine
+    ecooptima_app.background_loop.run_coroutine = _legacy_run
+    start = time.perf_counter()
+    latencies = _drive(args.requests, threads=1)
+    _report("legacy", time.perf_counter() - start, latencies)
+    ecooptima_app.background_loop.run_coroutine = original_runner
+
+    start = time.perf_counter()
+    latencies = _drive(args.requests, threads=args.threads)
+    _report("shared", time.perf_counter() - start, latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+# Page weight and transfer time of the landing pages: python bench/page_weight.py
+#
+# Loads every page through the Flask test client, then every static asset it references, in
+# three ways: "plain" (original static/ files, no Accept-Encoding, as before the asset build),
+# "first visit" (hashed URLs with a browser's Accept / Accept-Encoding headers, so pre-compressed
+# and WebP variants are picked) and "repeat visit" (immutable assets stay in the browser cache;
+# only the page itself is fetched again). Transfer time is estimated for a few link profiles as
+# round trips (six connections per origin) plus bytes over bandwidth. A /response JSON payload
+# from the fake model is measured with and without negotiated compression.
+
+PAGES = ("/", "/about", "/academic", "/business", "/community", "/consumer", "/government")
+# name -> (bandwidth in Mbit/s, round-trip time in ms)
+LINKS = {"3g": (1.6, 150), "4g": (9.0, 60), "broadband": (50.0, 20)}
+CONNECTIONS = 6
+BROWSER_HEADERS = {"Accept-Encoding": "gzip, deflate, br"}
+IMAGE_ACCEPT = "image/avif,image/webp,image/apng,image/*,*/*;q=0.8"
+ASSET_PATTERN = re.compile(r"""(?:src|href)=["'](/static/[^"']+)["']""")
+
+
+def _transfer_ms(bytes_total: int, requests: int, link: str) -> float:
+    bandwidth, rtt = LINKS[link]
+    round_trips = 1 + -(-requests // CONNECTIONS)
+    return round_trips * rtt + bytes_total * 8 / (bandwidth * 1000)
+
+
+def _fetch(client, url: str, headers: dict) -> int:
+    response = client.get(url, headers=headers)
+    if response.status_code != 200:
+        raise SystemExit(f"{url}: HTTP {response.status_code}")
+    return len(response.get_data())
+
+
+def _page_weight(client, page: str, manifest: dict) -> dict:
+    html = client.get(page).get_data(as_text=True)
+    hashed_urls = sorted(set(ASSET_PATTERN.findall(html)))
+    original = {entry["path"]: name for name, entry in manifest["assets"].items()}
+
+    plain = _fetch(client, page, {})
+    first = _fetch(client, page, BROWSER_HEADERS)
+    repeat = first
+    for url in hashed_urls:
+        hashed = url[len("/static/") :]
+        plain += _fetch(client, f"/static/{original.get(hashed, hashed)}", {})
+        headers = dict(BROWSER_HEADERS)
+        if hashed.endswith((".png", ".jpg", ".jpeg")):
+            headers["Accept"] = IMAGE_ACCEPT
+        first += _fetch(client, url, headers)
+    return {
+        "requests": 1 + len(hashed_urls),
+        "plain": plain,
+        "first": first,
+        "repeat": repeat,
+    }
+
+
+def _response_payload(client) -> tuple[int, int]:
+    from agents import set_tracing_disabled
+
+    from agent_runner import set_model_provider
+    from bench.fake_model import FakeModel, FakeProvider
+
+    set_tracing_disabled(True)
+    set_model_provider(FakeProvider(FakeModel(latency=0.0)))
+    form = {
+        "userInput": "Native trees for a clay soil school yard",
+        "workflow": "consumer",
+        "noCache": "1",
+    }
+    plain = client.post("/response", data=form)
+    compressed = client.post("/response", data=form, headers=BROWSER_HEADERS)
+    # Write the two run log records before the temporary data folder goes away
+    from run_log import get_run_log
+
+    run_log = get_run_log()
+    if run_log is not None:
+        run_log.close()
+    return len(plain.get_data()), len(compressed.get_data())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Landing page weight and transfer time")
+    parser.add_argument("--skip-response", action="store_true", help="skip the /response JSON")
+    parser.add_argument("--json", type=Path, help="write the measurements here")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-offline")
+    os.environ["ECOOPTIMA_WARMUP"] = "0"
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["ECOOPTIMA_DATA_DIR"] = str(Path(tmp) / "ecooptima_data")
+        os.chdir(tmp)
+
+        import app as webapp
+        import static_assets
+
+        started = time.perf_counter()
+        manifest = static_assets.get_manifest()
+        print(
+            f"asset build: {len(manifest['assets'])} files in "
+            f"{time.perf_counter() - started:.2f} s (brotli: {manifest['brotli']})"
+        )
+        client = webapp.app.test_client()
+
+        results = {page: _page_weight(client, page, manifest) for page in PAGES}
+        print(
+            f"\n{'page':<12} {'reqs':>4} {'plain KB':>9} {'first KB':>9} {'repeat KB':>10}  "
+            + "  ".join(f"{link + ' ms (plain/first/repeat)':>30}" for link in LINKS)
+        )
+        for page, weight in results.items():
+            times = []
+            for link in LINKS:
+                plain = _transfer_ms(weight["plain"], weight["requests"], link)
+                first = _transfer_ms(weight["first"], weight["requests"], link)
+                repeat = _transfer_ms(weight["repeat"], 1, link)
+                times.append(f"{plain:>10.0f}/{first:.0f}/{repeat:.0f}".rjust(30))
+            print(
+                f"{page:<12} {weight['requests']:>4} {weight['plain'] / 1024:>9.1f} "
+                f"{weight['first'] / 1024:>9.1f} {weight['repeat'] / 1024:>10.1f}  "
+                + "  ".join(times)
+            )
+
+        report = {"pages": results}
+        if not args.skip_response:
+            plain, compressed = _response_payload(client)
+            report["response_json"] = {"plain": plain, "compressed": compressed}
+            print(
+                f"\n/response JSON: {plain} B plain, {compressed} B with Accept-Encoding "
+                f"(compressed from {static_assets.DYNAMIC_MIN_BYTES} B)"
+            )
+        if args.json:
+            args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
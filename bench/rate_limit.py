@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+# Exercises the execution layer (execution.py / agent_runner.run_stage) against the offline
+# fake model, with injected 429s and latency:
+#   1. retries: --runs concurrent analyses while --error-rate of model calls answer 429; every
+#      run must still succeed, and no more than ECOOPTIMA_STAGE_CONCURRENCY stages may be in
+#      flight at once
+#   2. deadline: every call answers 429 with a long Retry-After; each run must fail with
+#      DeadlineExceeded no later than its --deadline (plus scheduling slack)
+# --rpm / --tpm set the token buckets, e.g. --rpm 120 to watch runs being paced.
+# Exits non-zero when a check fails.
+
+SLACK = 0.25
+
+
+async def _run_all(run_pipeline, workflow: str, runs: int, deadline: float | None):
+    from execution import new_deadline
+
+    async def one(index: int):
+        started = time.perf_counter()
+        try:
+            await run_pipeline(
+                f"Which native trees and shrubs suit a clay-soil school yard, site {index}?",
+                workflow,
+                use_cache=False,
+                deadline=new_deadline(deadline) if deadline else None,
+            )
+            return "ok", time.perf_counter() - started
+        except Exception as e:
+            return type(e).__name__, time.perf_counter() - started
+
+    return await asyncio.gather(*(one(index) for index in range(runs)))
+
+
+def _summary(results) -> str:
+    statuses: dict[str, int] = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = sorted(seconds for _, seconds in results)
+    return (
+        f"{statuses}, latency p50={latencies[len(latencies) // 2]:.2f} s "
+        f"max={latencies[-1]:.2f} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate limit, retry and deadline checks")
+    parser.add_argument("--workflow", choices=("community", "consumer", "academic"),
+                        default="consumer")
+    parser.add_argument("--runs", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--deadline", type=float, default=1.5)
+    parser.add_argument("--rpm", type=float, default=0)
+    parser.add_argument("--tpm", type=float, default=0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    # Read by execution.py at import time
+    os.environ["ECOOPTIMA_RPM"] = str(args.rpm)
+    os.environ["ECOOPTIMA_TPM"] = str(args.tpm)
+    os.environ["ECOOPTIMA_STAGE_CONCURRENCY"] = str(args.concurrency)
+    os.environ.setdefault("ECOOPTIMA_BACKOFF_BASE", "0.05")
+    # Six retries leave a stage failing 0.2**7 of the time at the default error rate
+    os.environ.setdefault("ECOOPTIMA_MAX_RETRIES", "6")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-offline")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Run folders (response_log/) and local stores land in the scratch directory
+        os.environ["ECOOPTIMA_DATA_DIR"] = tmp
+        os.chdir(tmp)
+
+        from agents import set_tracing_disabled
+
+        from agent_runner import set_model_provider
+        from ecooptima import run_pipeline
+        from execution import execution_stats
+        from bench.fake_model import FakeModel, FakeProvider
+
+        set_tracing_disabled(True)
+        failures = []
+
+        model = FakeModel(
+            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, retry_after=0.02
+        )
+        set_model_provider(FakeProvider(model))
+        started = time.perf_counter()
+        results = asyncio.run(_run_all(run_pipeline, args.workflow, args.runs, None))
+        elapsed = time.perf_counter() - started
+        stats = execution_stats()
+        print(
+            f"retries: {_summary(results)} in {elapsed:.2f} s; model calls={model.calls} "
+            f"injected 429s={model.errors} retries={stats.get('retries', 0)} "
+            f"rate limit waits={stats.get('rate_limit_waits', 0)} "
+            f"({stats.get('rate_limit_wait_seconds', 0):.2f} s) "
+            f"max in flight={model.max_in_flight}"
+        )
+        if any(status != "ok" for status, _ in results):
+            failures.append("some runs failed despite retries")
+        if model.max_in_flight > args.concurrency:
+            failures.append(f"{model.max_in_flight} calls in flight, limit {args.concurrency}")
+
+        model = FakeModel(latency=args.latency, error_rate=1.0, retry_after=0.4)
+        set_model_provider(FakeProvider(model))
+        results = asyncio.run(_run_all(run_pipeline, args.workflow, 8, args.deadline))
+        print(f"deadline {args.deadline:g} s: {_summary(results)}, model calls={model.calls}")
+        if any(status != "DeadlineExceeded" for status, _ in results):
+            failures.append("runs without a budget left did not fail with DeadlineExceeded")
+        if max(seconds for _, seconds in results) > args.deadline + SLACK:
+            failures.append("a run outlived its deadline")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from session_store import SESSION_HISTORY_TURNS, MemorySessionStore, SqliteSessionStore
+
+
+# Soak test for the session stores: --sessions distinct session ids each run one analyze turn,
+# and a share of requests (--revisit) go back to an earlier session for a follow-up, the way a
+# long-running worker sees traffic. Resident memory is sampled ten times along the way; with a
+# bounded store it should level off once the caps are reached instead of growing with traffic.
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # Peak rather than current RSS, but still shows unbounded growth
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _turn(state: dict, text: str) -> None:
+    state.setdefault("workflow", "community")
+    state["last_pipeline_output"] = text
+    state["chat_history"].append({"role": "user", "content": text[:80]})
+    state["chat_history"].append({"role": "assistant", "content": text})
+    state["chat_history"] = state["chat_history"][-SESSION_HISTORY_TURNS:]
+    state["turn_count"] = state.get("turn_count", 0) + 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session store memory soak")
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--revisit", type=float, default=0.2)
+    parser.add_argument("--reply-bytes", type=int, default=1500)
+    parser.add_argument("--max-entries", type=int, default=10_000)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    reply = "Findings and ranked options. " * (args.reply_bytes // 29)
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.backend == "memory":
+            store = MemorySessionStore(max_entries=args.max_entries)
+        else:
+            store = SqliteSessionStore(Path(tmp) / "sessions.sqlite3")
+
+        baseline = _rss_mb()
+        print(f"{args.backend}: baseline rss {baseline:.1f} MB")
+        start = time.perf_counter()
+        step = max(1, args.sessions // 10)
+        created = 0
+        requests = 0
+        while created < args.sessions:
+            is_new = not created or rng.random() >= args.revisit
+            if is_new:
+                session_id = f"session-{created}"
+                created += 1
+            else:
+                session_id = f"session-{rng.randrange(max(0, created - 5000), created)}"
+            state = store.load(session_id)
+            _turn(state, f"{reply} #{requests}")
+            store.save(session_id, state)
+            requests += 1
+
+            if is_new and created % step == 0:
+                elapsed = time.perf_counter() - start
+                print(
+                    f"  sessions={created:>9,} requests={requests:>9,} held={len(store):>9,} "
+                    f"rss={_rss_mb():8.1f} MB  {requests / elapsed:9.0f} req/s"
+                )
+        if args.backend == "sqlite":
+            size = store.path.stat().st_size + Path(f"{store.path}-wal").stat().st_size
+            print(f"  database {size / 2**20:.1f} MB, {store.stats()['turns']:,} turn rows")
+
+
+if __name__ == "__main__":
+    main()
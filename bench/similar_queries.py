@@ -0,0 +1,92 @@
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from similar_queries import QueryIndex
+
+
+# Near-duplicate lookup cost over a large synthetic query log.
+# Builds a QueryIndex of --queries generated inputs one add() at a time (as runs get cached),
+# then times lookups for reworded variants of stored queries and for unrelated queries.
+
+PLACES = ["park", "school yard", "backyard", "community garden", "street median", "rooftop",
+          "church lot", "playground", "riverbank", "parking lot", "campus quad", "office courtyard"]
+GOALS = ["shade trees", "native shrubs", "pollinator plants", "drought tolerant plants",
+         "rain garden plants", "evergreen hedges", "flowering trees", "ground cover",
+         "heat pump", "rooftop solar", "insulation upgrade", "ev charger", "led retrofit"]
+# Made-up neighbourhood names so stored queries are spread out like real free text
+SITES = ["".join(chr(97 + (n * 7919 // 26**p) % 26) for p in range(5)) for n in range(4000)]
+SOILS = ["clay soil", "sandy soil", "loamy soil", "acidic soil", "wet soil", "dry soil", ""]
+TEMPLATES = [
+    "{goal} for a {place} in {site} with {soil}, ${budget} budget",
+    "what {goal} should we use in our {place} at {site}? {soil} budget {budget}",
+    "recommend {goal} for {site} {place} {soil} under ${budget}",
+]
+REWORDS = [
+    "{site} {place}: {goal}, {soil}, {k}k budget",
+    "Best {goal} for the {place} in {site} with {soil} and a ${budget:,} budget",
+]
+
+
+def _fields(rng: random.Random) -> dict:
+    budget = rng.choice([500, 1000, 2500, 5000, 10000, 20000, 50000, 100000])
+    return {
+        "place": rng.choice(PLACES),
+        "goal": rng.choice(GOALS),
+        "soil": rng.choice(SOILS),
+        "budget": budget,
+        "k": f"{budget / 1000:g}",
+        "site": rng.choice(SITES),
+    }
+
+
+def _percentile(samples: list[float], fraction: float) -> float:
+    return sorted(samples)[int(fraction * (len(samples) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate query index lookup latency")
+    parser.add_argument("--queries", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=2_000)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    index = QueryIndex()
+    stored: list[dict] = []
+    start = time.perf_counter()
+    for n in range(args.queries):
+        fields = _fields(rng)
+        fields["workflow"] = rng.choice(["community", "consumer", "academic"])
+        stored.append(fields)
+        index.add(fields["workflow"], rng.choice(TEMPLATES).format(**fields))
+    build = time.perf_counter() - start
+    print(f"built {len(index)} queries in {build:.2f} s ({build / args.queries * 1e6:.1f} us/add)")
+
+    for label, make in (
+        ("reworded", lambda: (lambda f: (f["workflow"], rng.choice(REWORDS).format(**f)))(rng.choice(stored))),
+        ("unrelated", lambda: ("community", f"how do I compost {rng.randrange(10**6)} coffee grounds")),
+    ):
+        queries = [make() for _ in range(args.lookups)]
+        timings: list[float] = []
+        found = 0
+        served = 0
+        for workflow_name, query in queries:
+            start = time.perf_counter()
+            matches = index.lookup(workflow_name, query, args.threshold)
+            timings.append(time.perf_counter() - start)
+            found += bool(matches)
+            served += any(match.same_ask for match in matches)
+        print(
+            f"{label:<9} p50={_percentile(timings, 0.5) * 1e3:.3f} ms "
+            f"p99={_percentile(timings, 0.99) * 1e3:.3f} ms "
+            f"max={max(timings) * 1e3:.3f} ms matched={found}/{len(queries)} servable={served}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import ecooptima
+
+
+# Startup vs per-request cost of getting a workflow:
+#   build    - what every request paid before (fresh agents, tools and schemas)
+#   warm     - one-off startup cost of ecooptima.warm_workflows()
+#   registry - what a request pays now (shared instance lookup)
+# Each cost is the median of --repeats timed batches. Exits non-zero if the registry lookup is
+# not at least --min-speedup times cheaper than a build; the default sits well below the ~100x
+# measured, so the gate catches a lost registry rather than timer noise.
+
+
+def _time_per_call(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def _median_per_call(fn, iterations: int, repeats: int) -> float:
+    return statistics.median(_time_per_call(fn, iterations) for _ in range(repeats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Workflow construction cost")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-speedup", type=float, default=20.0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ecooptima.warm_workflows()
+    print(f"warm_workflows (startup): {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+    failed = False
+    for workflow_name in ecooptima.WORKFLOW_CLASSES:
+        build = _median_per_call(
+            lambda: ecooptima._build_workflow(workflow_name), args.iterations, args.repeats
+        )
+        lookup = _median_per_call(
+            lambda: ecooptima.get_workflow(workflow_name), args.iterations, args.repeats
+        )
+        speedup = build / lookup if lookup else float("inf")
+        print(
+            f"{workflow_name:<10} build={build * 1e6:9.1f} us  "
+            f"registry={lookup * 1e6:7.2f} us  speedup={speedup:8.0f}x"
+        )
+        failed = failed or speedup < args.min_speedup
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+
+# Object-oriented Figure + Agg canvas only: no pyplot, no global figure state,
+# so renders are safe to run side by side in worker threads or processes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+# Everything a render needs, already cleaned and sorted (picklable for process pools)
+@dataclass(frozen=True)
+class BarChartSpec:
+    labels: tuple[str, ...]
+    values: tuple[float, ...]
+    metric_name: str
+    title: str
+    orientation: str = "horizontal"
+
+
+#################
+### RENDERING ###
+#################
+
+
+def render_bar_chart(spec: BarChartSpec, chart_path: str) -> str:
+    labels = list(spec.labels)
+    values = list(spec.values)
+    fig_height = max(
+        3.5, len(labels) * 0.6
+    )  # dynamic figure height based on number of labels
+    fig = Figure(figsize=(9, fig_height))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    # Plot based on orientation
+    if spec.orientation == "horizontal":
+        ax.barh(labels, values, color="#2f855a")
+        ax.invert_yaxis()
+        ax.set_xlabel(spec.metric_name)
+    else:
+        ax.bar(labels, values, color="#2f855a")
+        ax.set_ylabel(spec.metric_name)
+        ax.set_xticks(range(len(labels)))
+        ax.set_xticklabels(labels, rotation=35, ha="right")
+
+    # Set title
+    ax.set_title(spec.title)
+
+    # Add value labels
+    for index, value in enumerate(values):
+        # Format value to 2 decimal places, removing trailing zeros
+        formatted = f"{value:.2f}".rstrip("0").rstrip(".")
+
+        # Position label based on orientation
+        if spec.orientation == "horizontal":
+            ax.text(value, index, f" {formatted}", va="center", fontsize=9)
+        else:
+            ax.text(index, value, formatted, ha="center", va="bottom", fontsize=9)
+
+    # Finalize and save chart
+    fig.tight_layout()
+    fig.savefig(chart_path)
+    return chart_path
+
+
+###################
+### WORKER POOL ###
+###################
+
+
+# ECOOPTIMA_CHART_POOL: "thread" (default) or "process"
+# ECOOPTIMA_CHART_WORKERS: max renders running at once per worker process
+_executor: Executor | None = None
+_executor_pid: int | None = None
+_executor_lock = threading.Lock()
+
+
+def _build_executor() -> Executor:
+    max_workers = int(
+        os.environ.get("ECOOPTIMA_CHART_WORKERS", min(4, os.cpu_count() or 1))
+    )
+    if os.environ.get("ECOOPTIMA_CHART_POOL", "thread").lower() == "process":
+        # spawn, not fork: the parent is multi-threaded (request threads + event loop)
+        return ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chart-render")
+
+
+def get_executor() -> Executor:
+    global _executor, _executor_pid
+    with _executor_lock:
+        # A pool inherited through a gunicorn fork has no live workers, so build a fresh one
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = _build_executor()
+            _executor_pid = os.getpid()
+        return _executor
+
+
+# Await a render without blocking the event loop
+async def render_bar_chart_async(spec: BarChartSpec, chart_path: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), render_bar_chart, spec, chart_path
+    )
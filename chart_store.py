@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from uuid import uuid4
+
+from local_db import thread_connection
+from run_context import DATA_ROOT, LOG_ROOT
+
+
+# Content-addressed store for rendered chart images, shared by every run and gunicorn worker on
+# the host. A chart's key is the hash of its cleaned spec (sorted labels/values, metric, title,
+# orientation), so a repeated scenario gets the existing PNG instead of a new render. Images
+# live under response_log/charts/ (served by app.response_log_file); a SQLite index tracks size
+# and last use. Past max_bytes, the least recently used charts are evicted, except those used
+# within the grace period (runs still in flight) or referenced by a run log record.
+CHART_STORE_ENABLED = os.environ.get("ECOOPTIMA_CHART_STORE", "1") != "0"
+CHART_STORE_PATH = Path(os.environ.get("ECOOPTIMA_CHART_STORE_PATH", DATA_ROOT / "charts.sqlite3"))
+CHART_STORE_MAX_BYTES = int(os.environ.get("ECOOPTIMA_CHART_STORE_MAX_BYTES", 256 * 1024 * 1024))
+CHART_STORE_GRACE = float(os.environ.get("ECOOPTIMA_CHART_STORE_GRACE", 3600))
+CHART_ROOT = LOG_ROOT / "charts"
+# Bump when render_bar_chart changes how a spec is drawn, so old images stop matching
+RENDER_VERSION = "1"
+# The byte total is checked after every this many new charts
+EVICT_EVERY = 16
+
+
+def chart_key(spec) -> str:
+    material = json.dumps([RENDER_VERSION, "png", asdict(spec)], sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ChartStore:
+    def __init__(
+        self,
+        path: Path = CHART_STORE_PATH,
+        root: Path = CHART_ROOT,
+        max_bytes: int = CHART_STORE_MAX_BYTES,
+        grace: float = CHART_STORE_GRACE,
+    ):
+        self.path = Path(path)
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.grace = grace
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # In-flight renders of this process, so concurrent identical charts render once
+        self._pending: dict[str, asyncio.Future] = {}
+        self._added = 0
+        self._evicting = False
+        self.hits = 0
+        self.misses = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS charts (
+                key TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS charts_last_used ON charts (last_used);
+            """
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        return thread_connection(self._local, self.path)
+
+    def chart_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.png"
+
+    # Indexes (or refreshes) a chart file; last_used is what eviction orders by
+    def _touch(self, key: str, path: Path, size: int) -> None:
+        now = time.time()
+        self._connection().execute(
+            """
+            INSERT INTO charts (key, path, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET last_used = excluded.last_used, size = excluded.size
+            """,
+            (key, path.relative_to(LOG_ROOT).as_posix(), size, now, now),
+        )
+
+    def lookup(self, key: str) -> Path | None:
+        path = self.chart_path(key)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return None
+        self._touch(key, path, size)
+        return path
+
+    # Path of the chart for `spec` and whether it already existed. Misses render to a temporary
+    # file and are moved into place atomically, so workers racing on one key never see a
+    # partial image. The index lookup and upsert are SQLite calls and run in a thread, like the
+    # render, so the event loop never waits on them.
+    async def get_or_render(self, spec) -> tuple[Path, bool]:
+        key = chart_key(spec)
+        path = await asyncio.to_thread(self.lookup, key)
+        if path is not None:
+            self.hits += 1
+            return path, True
+
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(key)
+        if pending is not None and pending.get_loop() is loop:
+            # asyncio.wait never cancels the render this run is piggybacking on
+            await asyncio.wait({pending})
+            if not pending.cancelled():
+                self.hits += 1
+                return pending.result(), True
+
+        future = self._pending[key] = loop.create_future()
+        try:
+            path = await self._render(key, spec)
+            future.set_result(path)
+        except BaseException:
+            # Waiters see a cancelled future and render the chart themselves
+            future.cancel()
+            raise
+        finally:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+        self.misses += 1
+        return path, False
+
+    async def _render(self, key: str, spec) -> Path:
+        from chart_render import render_bar_chart_async
+
+        path = self.chart_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{key}.{uuid4().hex[:8]}.tmp.png")
+        try:
+            await render_bar_chart_async(spec, str(temp_path))
+            os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        await asyncio.to_thread(self._touch, key, path, path.stat().st_size)
+
+        self._added += 1
+        if self._added % EVICT_EVERY == 1 and not self._evicting:
+            self._evicting = True
+            try:
+                await asyncio.to_thread(self.evict)
+            finally:
+                self._evicting = False
+        return path
+
+    ################
+    ### EVICTION ###
+    ################
+
+    # Least recently used first until the images fit max_bytes. Charts used within the grace
+    # period or referenced by a run log record stay, even if that leaves the store over budget.
+    def evict(self) -> int:
+        from run_log import get_run_log
+
+        with self._lock:
+            db = self._connection()
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM charts").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            run_log = get_run_log()
+            candidates = db.execute(
+                "SELECT key, path, size FROM charts WHERE last_used < ? ORDER BY last_used",
+                (time.time() - self.grace,),
+            ).fetchall()
+
+            removed = 0
+            for start in range(0, len(candidates), 500):
+                if total <= self.max_bytes:
+                    break
+                chunk = candidates[start : start + 500]
+                refcounts = (
+                    run_log.chart_refcounts([path for _, path, _ in chunk])
+                    if run_log is not None
+                    else {}
+                )
+                for key, path, size in chunk:
+                    if total <= self.max_bytes:
+                        break
+                    if refcounts.get(path):
+                        continue
+                    (LOG_ROOT / path).unlink(missing_ok=True)
+                    # WebP copy made on demand by static_assets.serve_chart_image
+                    (LOG_ROOT / path).with_suffix(".webp").unlink(missing_ok=True)
+                    db.execute("DELETE FROM charts WHERE key = ?", (key,))
+                    total -= size
+                    removed += 1
+            return removed
+
+    def stats(self) -> dict:
+        entries, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM charts"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_chart_store: ChartStore | None = None
+_chart_store_lock = threading.Lock()
+
+
+def get_chart_store() -> ChartStore | None:
+    global _chart_store
+    if not CHART_STORE_ENABLED:
+        return None
+    if _chart_store is None:
+        with _chart_store_lock:
+            if _chart_store is None:
+                _chart_store = ChartStore(CHART_STORE_PATH)
+    return _chart_store
@@ -1,25 +1,68 @@
-from agents import Runner
 from agents.exceptions import InputGuardrailTripwireTriggered
-from pathlib import Path
-import os
+from dataclasses import dataclass, field
+from typing import Callable, Literal
+import asyncio
 import json
+import os
+import threading
+import time
 
 
 # Import functions
-from ecooptima_tools import _generate_timestamp
+from agent_runner import run_stage
+from ecooptima_tools import chart_series
+from execution import new_deadline
+from metrics import get_metrics, timed
+from model_routing import get_router
+from followup_context import build_followup_payload, roll_history
+from response_cache import CachedResponse, get_response_cache, make_cache_key, normalize_input
+from run_context import DEFAULT_CHART_MODE, ChartArtifact, ChartMode, RunContext
+from run_log import RunRecord, get_run_log
+from scenarios import (
+    apply_scenario,
+    parse_scenario,
+    scenario_series,
+    scenario_title,
+    summarize_scenario,
+)
+from session_store import SESSION_HISTORY_TURNS
+from usage import add_to_session, get_usage_store
+from similar_queries import (
+    SIMILAR_OFFER_THRESHOLD,
+    SimilarQuery,
+    get_similar_cache,
+)
 from workflows import AcademicWorkflow, CommunityWorkflow, ConsumerWorkflow
 
 
 ############################
-######### LOGGING ##########
+######### RESULTS ##########
 ############################
 
 
-# Response logging structure
-class RunLog:
-    timestamp: str
-    input: str
-    response: str
+# What main hands back to the caller: the reply text plus the charts the run produced
+@dataclass
+class PipelineResult:
+    text: str
+    charts: list[ChartArtifact] = field(default_factory=list)
+    cached: bool = False
+    # Past input this answer was served from (cached=True) or that was offered alongside it
+    similar: dict | None = None
+    # Structured MaccResult of Consumer/Academic analyses, used as follow-up context
+    macc_result: dict | None = None
+    # Per-workflow results of a fan-out run (mode="fanout"), in request order
+    outcomes: list["WorkflowOutcome"] = field(default_factory=list)
+    # Token usage per model stage (usage.stage_usage); empty for cached answers
+    usage: list[dict] = field(default_factory=list)
+
+
+# One workflow's share of a fan-out run
+@dataclass
+class WorkflowOutcome:
+    workflow: str
+    status: Literal["ok", "blocked", "timeout", "error"]
+    result: PipelineResult | None = None
+    error: str | None = None
 
 
 #####################
@@ -27,48 +70,491 @@ class RunLog:
 #####################
 
 
-def _build_workflow(workflow_name: str):
-    match workflow_name:
-        case "community":
-            return CommunityWorkflow()
-        case "consumer":
-            return ConsumerWorkflow()
-        case "academic":
-            return AcademicWorkflow()
-        case _:
-            raise ValueError(f"Unsupported workflow '{workflow_name}'")
+WORKFLOW_CLASSES = {
+    "community": CommunityWorkflow,
+    "consumer": ConsumerWorkflow,
+    "academic": AcademicWorkflow,
+}
+
+
+# Process-wide registry of built workflows keyed by (workflow name, model, vector store IDs).
+# Workflows hold only immutable agent/tool/schema config, so requests can share one instance.
+_workflow_registry: dict[tuple[str, str, tuple[str, ...]], object] = {}
+_workflow_registry_lock = threading.Lock()
+
+
+def _workflow_key(
+    workflow_name: str,
+    agent_model: str | None = None,
+    vector_store_ids: tuple[str, ...] | None = None,
+) -> tuple[str, str, tuple[str, ...]]:
+    workflow_class = WORKFLOW_CLASSES.get(workflow_name)
+    if workflow_class is None:
+        raise ValueError(f"Unsupported workflow '{workflow_name}'")
+    return (
+        workflow_name,
+        agent_model or workflow_class.DEFAULT_MODEL,
+        tuple(vector_store_ids or (workflow_class.DEFAULT_VECTOR_STORE,)),
+    )
+
+
+def _build_workflow(
+    workflow_name: str,
+    agent_model: str | None = None,
+    vector_store_ids: tuple[str, ...] | None = None,
+):
+    name, model, store_ids = _workflow_key(workflow_name, agent_model, vector_store_ids)
+    return WORKFLOW_CLASSES[name](model, *store_ids)
+
+
+def get_workflow(
+    workflow_name: str,
+    agent_model: str | None = None,
+    vector_store_ids: tuple[str, ...] | None = None,
+):
+    key = _workflow_key(workflow_name, agent_model, vector_store_ids)
+    workflow = _workflow_registry.get(key)
+    if workflow is not None:
+        return workflow
+
+    # Double-checked so concurrent first requests build each workflow only once
+    with _workflow_registry_lock:
+        workflow = _workflow_registry.get(key)
+        if workflow is None:
+            workflow = _build_workflow(*key)
+            _workflow_registry[key] = workflow
+    return workflow
+
 
+# Build every default workflow up front so no request pays the construction cost
+def warm_workflows(workflow_names: list[str] | None = None) -> None:
+    for workflow_name in workflow_names or list(WORKFLOW_CLASSES):
+        get_workflow(workflow_name)
 
-async def run_pipeline(user_input: str, workflow_name: str) -> str:
-    workflow = _build_workflow(workflow_name)
 
-    RunLog.timestamp = _generate_timestamp()
-    log_dir = Path("response_log") / RunLog.timestamp
-    log_dir.mkdir(parents=True, exist_ok=True)
-    os.environ["ECOOPTIMA_LOG_DIR"] = str(log_dir)
+# Workflows plus the near-duplicate query index, which is rebuilt from the response cache
+def warm() -> None:
+    warm_workflows()
+    get_similar_cache(get_response_cache())
 
-    result = await workflow.run(user_input)
 
-    RunLog.input = user_input
-    RunLog.response = result.final_output
-    (log_dir / "input.txt").write_text(RunLog.input, encoding="utf-8")
-    (log_dir / "output.txt").write_text(RunLog.response, encoding="utf-8")
-    return result.final_output
+# Best stored answer to a reworded version of this question, with the past input and its score.
+# Index entries whose cache row has expired or was built for another model/prompt are skipped,
+# and dropped from the index once their row is gone for good.
+def _find_similar(
+    cache,
+    similar_cache,
+    workflow_name: str,
+    workflow,
+    user_input: str,
+    chart_mode: ChartMode,
+) -> tuple[SimilarQuery, CachedResponse] | None:
+    for match in similar_cache.lookup(workflow_name, user_input, SIMILAR_OFFER_THRESHOLD):
+        cached = cache.get(
+            make_cache_key(
+                workflow_name,
+                match.input,
+                _model_scope(workflow),
+                workflow.vector_store_ids,
+                workflow.prompt_version,
+                chart_mode,
+            )
+        )
+        if cached is not None:
+            return match, cached
+        if not cache.has_input(workflow_name, match.input):
+            similar_cache.index.remove(workflow_name, match.input)
+    return None
+
+
+async def run_pipeline(
+    user_input: str,
+    workflow_name: str,
+    on_event: Callable[[dict], None] | None = None,
+    chart_mode: ChartMode = DEFAULT_CHART_MODE,
+    use_cache: bool = True,
+    deadline: float | None = None,
+    session_id: str | None = None,
+    latency_slo: float | None = None,
+) -> PipelineResult:
+    # Run-scoped context: its own log folder and chart manifest, passed to every agent and tool.
+    # The deadline bounds every stage, rate-limit wait and retry of the run.
+    context = RunContext(
+        workflow=workflow_name,
+        events=on_event,
+        chart_mode=chart_mode,
+        deadline=deadline if deadline is not None else new_deadline(),
+        session_id=session_id,
+        latency_slo=_latency_slo("analyze", latency_slo),
+    )
+    metrics = get_metrics()
+    outcome = "error"
+    result = None
+    error = None
+    with metrics.in_flight("request", workflow_name):
+        try:
+            result = await _run_pipeline(user_input, workflow_name, context, use_cache)
+            outcome = "cached" if result.cached else "ok"
+            return result
+        except InputGuardrailTripwireTriggered:
+            outcome = "blocked"
+            raise
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            metrics.observe(
+                "request", workflow_name, outcome, time.perf_counter() - context.started
+            )
+            _record_usage(context)
+            _record_run(context, "analyze", user_input, result, outcome, error)
+
+
+# Requested SLO of the run, else the routing policy's target for its kind (None: no routing)
+def _latency_slo(kind: str, requested: float | None) -> float | None:
+    if requested is not None:
+        return requested
+    router = get_router()
+    return router.slo_seconds(kind) if router is not None else None
+
+
+# Answers are cached per preferred models; an answer from a fallback model isn't cached at all
+def _model_scope(workflow) -> str:
+    router = get_router()
+    return router.model_scope(workflow.agent_model) if router is not None else workflow.agent_model
+
 
+def _used_fallback(context: RunContext) -> bool:
+    return any(decision["fallback"] for decision in context.routing)
 
-def _trim_history(chat_history: list[dict], keep_last: int = 8) -> list[dict]:
-    return chat_history[-keep_last:]
 
+# Every run that reached a model, failed ones included, lands in the shared usage store (queued,
+# written in the background)
+def _record_usage(context: RunContext) -> None:
+    usage_store = get_usage_store()
+    if usage_store is not None and context.usage:
+        usage_store.record(context.run_id, context.workflow, context.session_id, context.usage)
+
+
+# Every run, cached and failed ones included, gets a run log record (queued, written in the
+# background). Cached answers point at the charts of the run they were served from.
+def _record_run(
+    context: RunContext,
+    kind: str,
+    user_input: str,
+    result: "PipelineResult | None",
+    outcome: str,
+    error: str | None,
+) -> None:
+    run_log = get_run_log()
+    if run_log is None:
+        return
+    charts = result.charts if result is not None else context.charts
+    run_log.append(
+        RunRecord(
+            run_id=context.run_id,
+            workflow=context.workflow,
+            input=user_input,
+            output=result.text if result is not None else "",
+            kind=kind,
+            status=outcome,
+            session_id=context.session_id,
+            seconds=round(time.perf_counter() - context.started, 3),
+            error=error,
+            charts=[chart.to_dict() for chart in charts],
+            usage=context.usage,
+            timings=context.timing_breakdown(),
+            routing=context.routing,
+        )
+    )
+
+
+async def _run_pipeline(
+    user_input: str, workflow_name: str, context: RunContext, use_cache: bool
+) -> PipelineResult:
+    workflow = get_workflow(workflow_name)
+    on_event = context.events
+    chart_mode = context.chart_mode
+    started = time.perf_counter()
+
+    # Identical analyses (same workflow, input, model, stores, prompts) are served from the cache.
+    # Cache reads and writes are SQLite calls, so they run in a thread and never block the loop
+    # the other runs of this worker share.
+    cache = get_response_cache() if use_cache else None
+    cache_key = make_cache_key(
+        workflow_name,
+        user_input,
+        _model_scope(workflow),
+        workflow.vector_store_ids,
+        workflow.prompt_version,
+        chart_mode,
+    )
+    with timed("step", "cache_lookup", context):
+        cached = await asyncio.to_thread(cache.get, cache_key) if cache else None
+    if cached is not None:
+        await asyncio.to_thread(cache.record, "hit", time.perf_counter() - started)
+        if on_event is not None:
+            on_event({"type": "cache_hit", "workflow": workflow_name})
+            for chart in cached.charts:
+                on_event({"type": "chart_ready", "chart": chart.to_dict()})
+        return PipelineResult(
+            text=cached.text, charts=cached.charts, cached=True, macc_result=cached.macc_result
+        )
+
+    # Reworded versions of past questions: served when they ask the same thing, otherwise offered
+    similar_cache = await asyncio.to_thread(get_similar_cache, cache)
+    similar = None
+    found = None
+    if similar_cache is not None:
+        with timed("step", "similar_lookup", context):
+            found = await asyncio.to_thread(
+                _find_similar, cache, similar_cache, workflow_name, workflow, user_input, chart_mode
+            )
+    if found is not None:
+        match, served = found
+        similar = {"input": match.input, "score": match.score}
+        if match.same_ask:
+            await asyncio.to_thread(cache.record, "similar_hit", time.perf_counter() - started)
+            if on_event is not None:
+                on_event({"type": "cache_hit", "workflow": workflow_name, "similar": similar})
+                for chart in served.charts:
+                    on_event({"type": "chart_ready", "chart": chart.to_dict()})
+            return PipelineResult(
+                text=served.text,
+                charts=served.charts,
+                cached=True,
+                similar=similar,
+                macc_result=served.macc_result,
+            )
 
-async def run_followup(user_input: str, session_state: dict) -> str:
-    workflow = _build_workflow(session_state.get("workflow", "community"))
-    payload = {
-        "latest_workflow_output": session_state.get("last_pipeline_output", ""),
-        "chat_history": _trim_history(session_state.get("chat_history", [])),
-        "user_followup": user_input,
-    }
-    result = await Runner.run(workflow.conversational_agent, json.dumps(payload))
-    return result.final_output
+        await asyncio.to_thread(cache.record, "similar_offer", 0.0)
+        if on_event is not None:
+            on_event({"type": "similar_result", **similar, "result": served.text})
+
+    # Input, output, usage and timings go to the run log (run_pipeline); only chart images are
+    # written under the run folder
+    result = await workflow.run(user_input, context=context)
+
+    if cache:
+        if not _used_fallback(context):
+            with timed("step", "cache_write", context):
+                await asyncio.to_thread(
+                    cache.put,
+                    cache_key,
+                    workflow_name,
+                    user_input,
+                    result.final_output,
+                    context.charts,
+                    macc_result=context.macc_result,
+                )
+            if similar_cache:
+                similar_cache.add(workflow_name, normalize_input(user_input))
+        await asyncio.to_thread(cache.record, "miss", time.perf_counter() - started)
+    return PipelineResult(
+        text=result.final_output,
+        charts=context.charts,
+        similar=similar,
+        macc_result=context.macc_result,
+        usage=context.usage,
+    )
+
+
+async def run_followup(
+    user_input: str,
+    session_state: dict,
+    on_event: Callable[[dict], None] | None = None,
+    session_id: str | None = None,
+    latency_slo: float | None = None,
+) -> PipelineResult:
+    workflow_name = session_state.get("workflow", "community")
+    workflow = get_workflow(workflow_name)
+    # Packed into the follow-up token budget; older turns arrive as a rolling summary
+    payload = build_followup_payload(session_state, user_input)
+    context = RunContext(
+        workflow=workflow_name,
+        events=on_event,
+        deadline=new_deadline(),
+        session_id=session_id,
+        latency_slo=_latency_slo("followup", latency_slo),
+    )
+    followup = None
+    outcome = "error"
+    error = None
+    try:
+        result = await run_stage(
+            workflow.conversational_agent,
+            json.dumps(payload),
+            context=context,
+            stage="followup",
+        )
+        followup = PipelineResult(text=result.final_output, usage=context.usage)
+        outcome = "ok"
+        return followup
+    except InputGuardrailTripwireTriggered:
+        outcome = "blocked"
+        raise
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _record_usage(context)
+        _record_run(context, "followup", user_input, followup, outcome, error)
+
+
+# What-if follow-ups over the session's last MaccResult (discount rate, horizon, household),
+# answered by scenarios.py and re-charted locally with no model call. Changes accumulate over
+# follow-ups in session_state["scenario"]; the analysis's own result stays in
+# session_state["base_macc_result"] and last_macc_result holds the current scenario's numbers.
+async def run_scenario(
+    user_input: str,
+    session_state: dict,
+    changes: dict,
+    on_event: Callable[[dict], None] | None = None,
+    chart_mode: ChartMode = DEFAULT_CHART_MODE,
+    session_id: str | None = None,
+) -> PipelineResult:
+    workflow_name = session_state.get("workflow", "consumer")
+    context = RunContext(
+        workflow=workflow_name, events=on_event, chart_mode=chart_mode, session_id=session_id
+    )
+    scenario = None
+    outcome = "error"
+    error = None
+    try:
+        base = session_state.get("base_macc_result") or session_state["last_macc_result"]
+        parameters = {} if changes.get("baseline") else {**session_state.get("scenario", {})}
+        parameters.update({key: value for key, value in changes.items() if key != "baseline"})
+
+        with timed("step", "scenario_recompute", context):
+            macc_result = apply_scenario(base, parameters)
+        context.macc_result = macc_result
+        context.emit("scenario", parameters=parameters)
+        series = scenario_series(macc_result)
+        if series:
+            await chart_series(
+                context, series, "Cost per tCO2e (USD)", scenario_title(parameters)
+            )
+
+        session_state["base_macc_result"] = base
+        session_state["scenario"] = parameters
+        session_state["last_macc_result"] = macc_result
+        scenario = PipelineResult(
+            text=summarize_scenario(macc_result, base),
+            charts=context.charts,
+            macc_result=macc_result,
+        )
+        outcome = "ok"
+        return scenario
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _record_run(context, "scenario", user_input, scenario, outcome, error)
+
+
+# Seconds each workflow of a fan-out run gets before it is cancelled
+FANOUT_TIMEOUT = float(os.environ.get("ECOOPTIMA_FANOUT_TIMEOUT", 240))
+
+WORKFLOW_TITLES = {"community": "Community", "consumer": "Consumer", "academic": "Academic"}
+
+
+async def _run_fanout_part(
+    user_input: str,
+    workflow_name: str,
+    on_event: Callable[[dict], None] | None,
+    chart_mode: ChartMode,
+    use_cache: bool,
+    timeout: float,
+    session_id: str | None = None,
+    latency_slo: float | None = None,
+) -> WorkflowOutcome:
+    # Events from every part share one stream, so each is tagged with its workflow
+    tagged = (lambda event: on_event({**event, "workflow": workflow_name})) if on_event else None
+    try:
+        result = await asyncio.wait_for(
+            run_pipeline(
+                user_input,
+                workflow_name,
+                on_event=tagged,
+                chart_mode=chart_mode,
+                use_cache=use_cache,
+                deadline=new_deadline(timeout),
+                session_id=session_id,
+                latency_slo=latency_slo,
+            ),
+            timeout,
+        )
+        outcome = WorkflowOutcome(workflow_name, "ok", result=result)
+    except InputGuardrailTripwireTriggered as e:
+        outcome = WorkflowOutcome(workflow_name, "blocked", error=str(e))
+    except asyncio.TimeoutError:
+        outcome = WorkflowOutcome(workflow_name, "timeout", error=f"No answer within {timeout:g} s")
+    except Exception as e:
+        outcome = WorkflowOutcome(workflow_name, "error", error=str(e))
+
+    if on_event is not None:
+        on_event({"type": "workflow_done", "workflow": workflow_name, "status": outcome.status})
+    return outcome
+
+
+# Several workflows on one input at once. Each part has its own timeout and failures stay
+# local to their part, so the wall clock is that of the slowest part rather than the sum.
+# The merged result has one section per workflow and all of their charts.
+async def run_fanout(
+    user_input: str,
+    workflow_names: list[str],
+    on_event: Callable[[dict], None] | None = None,
+    chart_mode: ChartMode = DEFAULT_CHART_MODE,
+    use_cache: bool = True,
+    timeout: float = FANOUT_TIMEOUT,
+    session_id: str | None = None,
+    latency_slo: float | None = None,
+) -> PipelineResult:
+    outcomes = await asyncio.gather(
+        *(
+            _run_fanout_part(
+                user_input,
+                name,
+                on_event,
+                chart_mode,
+                use_cache,
+                timeout,
+                session_id,
+                latency_slo,
+            )
+            for name in workflow_names
+        )
+    )
+
+    sections = []
+    charts: list[ChartArtifact] = []
+    for outcome in outcomes:
+        title = WORKFLOW_TITLES.get(outcome.workflow, outcome.workflow)
+        if outcome.result is not None:
+            sections.append(f"## {title}\n\n{outcome.result.text}")
+            charts.extend(outcome.result.charts)
+        else:
+            sections.append(f"## {title}\n\n({outcome.status}: {outcome.error})")
+
+    return PipelineResult(
+        text="\n\n".join(sections),
+        charts=charts,
+        cached=all(outcome.result is not None and outcome.result.cached for outcome in outcomes),
+        outcomes=list(outcomes),
+        usage=[stage for outcome in outcomes if outcome.result for stage in outcome.result.usage],
+    )
+
+
+# A new analysis starts from its own assumptions again
+def _clear_scenario(session_state: dict) -> None:
+    session_state.pop("base_macc_result", None)
+    session_state.pop("scenario", None)
 
 
 # Main function to run either full workflow or conversational follow-up
@@ -77,12 +563,19 @@ async def main(
     mode: str = "analyze",
     workflow: str = "community",
     session_state: dict | None = None,
-):
+    on_event: Callable[[dict], None] | None = None,
+    chart_mode: ChartMode = DEFAULT_CHART_MODE,
+    use_cache: bool = True,
+    workflows: list[str] | None = None,
+    session_id: str | None = None,
+    scenario: dict | None = None,
+    latency_slo: float | None = None,
+) -> PipelineResult:
     try:
         user_input = user_text
 
         if user_input.strip().lower() == "exit":
-            return "exit"
+            return PipelineResult(text="exit")
 
         session_state = session_state if session_state is not None else {}
         session_state.setdefault("chat_history", [])
@@ -90,21 +583,69 @@ async def main(
 
         if mode == "followup":
             if not session_state.get("last_pipeline_output"):
-                return "No prior workflow context found. Run an analysis first, then ask a follow-up."
-            response = await run_followup(user_input, session_state)
+                return PipelineResult(
+                    text="No prior workflow context found. Run an analysis first, then ask a follow-up."
+                )
+            changes = scenario or parse_scenario(user_input, session_state["workflow"])
+            if changes and session_state.get("last_macc_result"):
+                result = await run_scenario(
+                    user_input,
+                    session_state,
+                    changes,
+                    on_event=on_event,
+                    chart_mode=chart_mode,
+                    session_id=session_id,
+                )
+            else:
+                result = await run_followup(
+                    user_input,
+                    session_state,
+                    on_event=on_event,
+                    session_id=session_id,
+                    latency_slo=latency_slo,
+                )
+        elif mode == "fanout":
+            workflow_names = workflows or list(WORKFLOW_CLASSES)
+            result = await run_fanout(
+                user_input,
+                workflow_names,
+                on_event=on_event,
+                chart_mode=chart_mode,
+                use_cache=use_cache,
+                session_id=session_id,
+                latency_slo=latency_slo,
+            )
+            # Follow-ups continue with the first workflow that answered, over the merged text
+            answered = [outcome.workflow for outcome in result.outcomes if outcome.result]
+            session_state["last_pipeline_output"] = result.text
+            session_state["last_macc_result"] = None
+            session_state["workflow"] = answered[0] if answered else workflow_names[0]
+            _clear_scenario(session_state)
         else:
-            response = await run_pipeline(user_input, workflow)
-            session_state["last_pipeline_output"] = response
+            result = await run_pipeline(
+                user_input,
+                workflow,
+                on_event=on_event,
+                chart_mode=chart_mode,
+                use_cache=use_cache,
+                session_id=session_id,
+                latency_slo=latency_slo,
+            )
+            session_state["last_pipeline_output"] = result.text
+            session_state["last_macc_result"] = result.macc_result
             session_state["workflow"] = workflow
+            _clear_scenario(session_state)
 
         session_state["chat_history"].append({"role": "user", "content": user_input})
-        session_state["chat_history"].append({"role": "assistant", "content": response})
-        session_state["chat_history"] = _trim_history(
-            session_state["chat_history"], keep_last=12
-        )
+        session_state["chat_history"].append({"role": "assistant", "content": result.text})
+        # Lets the session store write just the new messages
+        session_state["turn_count"] = session_state.get("turn_count", 0) + 2
+        roll_history(session_state, keep_last=SESSION_HISTORY_TURNS)
+        # Running token totals of the session, stored with it
+        add_to_session(session_state, result.usage)
 
-        return response
+        return result
 
     except InputGuardrailTripwireTriggered as e:
         print("Guardrail blocked this input: ", e)
-        return str(e)
+        return PipelineResult(text=str(e))
@@ -1,13 +1,13 @@
-import os
+import json
 import re
+import time
 from datetime import datetime
 from pathlib import Path
 from typing_extensions import TypedDict, Literal
 from agents import Agent, FunctionTool, RunContextWrapper, function_tool
-import matplotlib
-
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+from metrics import record_span, timed
+from plant_matrix import get_plant_matrix
+from run_context import ChartArtifact, RunContext
 
 
 # TypedDict for structured bar chart data (label-value pairs)
@@ -27,6 +27,8 @@ def _coerce_numeric(raw_value: float | int | str) -> float:
     # If the value is already numeric, return it as float
     if isinstance(raw_value, (int, float)):
         return float(raw_value)
+    if not isinstance(raw_value, str):
+        raise ValueError(f"Could not extract a numeric value from {raw_value!r}.")
 
     # Otherwise, use regex to find a numeric pattern in the string
     match = re.search(r"-?\d+(?:\.\d+)?", raw_value)
@@ -47,23 +49,10 @@ def _slugify_title(title: str) -> str:
     return slug or "tree-chart"
 
 
-# Bar chart plotting function
-@function_tool(name_override="plot_bar_chart")
-def plot_bar_chart(
-    series: list[BarChartPoint],
-    metric_name: str,
-    title: str | None = None,
-    top_n: int | None = None,
-    orientation: Literal["horizontal", "vertical"] = "horizontal",
-    output_directory: str = "response_log",
-) -> str:  # should return a string path to the saved chart image file
-    """Generate a bar chart from structured tree metrics.
-    series: list of (label, value) pairs to chart
-    metric_name: name of the metric being charted (e.g., 'Height', 'Canopy Spread')
-    title: optional name of chart
-    top_n: number of top entries to include (top 10, top 5, etc.)
-    orientation: orientation of chart with default horizontal and option for vertical
-    output_directory: where to save chart image file"""
+# Validate, coerce, sort (largest first) and trim the series an agent passed to a chart tool
+def _clean_series(
+    series: list[BarChartPoint], top_n: int | None = None
+) -> list[tuple[str, float]]:
     # No data provided error
     if not series:
         raise ValueError("Provide at least one (label, value) pair to chart.")
@@ -79,65 +68,155 @@ def plot_bar_chart(
         # Error if no label found
         if not label:
             raise ValueError("Each entry must include a label or tree name.")
+        # Options without a value (e.g. no cost per tCO2e when nothing is abated) have no bar
+        if entry.get("value") is None:
+            continue
         cleaned.append(
             (label, _coerce_numeric(entry["value"]))
         )  # append (label, numeric value) tuple to cleaned list - this is the data we will plot
 
-    # Sort key value pairs and limit to top_n if specified
-    cleaned.sort(key=lambda row: row[1], reverse=True)
+    if not cleaned:
+        raise ValueError("Provide at least one (label, value) pair with a value to chart.")
+
+    # Sort key value pairs (ties by label, so equal data always gives the same chart) and limit
+    # to top_n if specified
+    cleaned.sort(key=lambda row: (-row[1], row[0]))
     if top_n:
         cleaned = cleaned[: max(1, top_n)]
+    return cleaned
 
-    # Chart saving setup
-    chart_dir = Path(os.environ.get("ECOOPTIMA_LOG_DIR", output_directory))
-    chart_dir.mkdir(parents=True, exist_ok=True)
+
+# Bar chart plotting function
+@function_tool(name_override="plot_bar_chart")
+async def plot_bar_chart(
+    ctx: RunContextWrapper[RunContext],
+    series: list[BarChartPoint],
+    metric_name: str,
+    title: str | None = None,
+    top_n: int | None = None,
+    orientation: Literal["horizontal", "vertical"] = "horizontal",
+) -> str:  # should return a string path to the saved chart image file
+    """Generate a bar chart from structured tree metrics.
+    series: list of (label, value) pairs to chart
+    metric_name: name of the metric being charted (e.g., 'Height', 'Canopy Spread')
+    title: optional name of chart
+    top_n: number of top entries to include (top 10, top 5, etc.)
+    orientation: orientation of chart with default horizontal and option for vertical"""
+    cleaned = _clean_series(series, top_n)
     safe_title = title or f"{metric_name} for selected trees"
-    filename = (
-        f"{_slugify_title(safe_title)}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.png"
-    )
-    chart_path = chart_dir / filename
-
-    # Plotting
-    labels = [label for label, _ in cleaned]  # extract labels from cleaned data
-    values = [value for _, value in cleaned]  # extract values from cleaned data
-    fig_height = max(
-        3.5, len(labels) * 0.6
-    )  # dynamic figure height based on number of labels
-    fig, ax = plt.subplots(
-        figsize=(9, fig_height)
-    )  # create figure and axis with specified size
-
-    # Plot based on orientation
-    if orientation == "horizontal":
-        ax.barh(labels, values, color="#2f855a")
-        ax.invert_yaxis()
-        ax.set_xlabel(metric_name)
-    else:
-        ax.bar(labels, values, color="#2f855a")
-        ax.set_ylabel(metric_name)
-        ax.set_xticklabels(labels, rotation=35, ha="right")
+    run_context = ctx.context if isinstance(ctx.context, RunContext) else None
+    return await chart_series(run_context, cleaned, metric_name, safe_title, orientation)
 
-    # Set title
-    ax.set_title(safe_title)
 
-    # Add value labels
-    for index, value in enumerate(values):
-        # Format value to 2 decimal places, removing trailing zeros
-        formatted = f"{value:.2f}".rstrip("0").rstrip(".")
+# Renders (or, in data mode, hands over) a cleaned series and adds it to the run's manifest.
+# Shared by the plot_bar_chart tool and local steps that chart without a model (scenarios).
+async def chart_series(
+    run_context: RunContext | None,
+    cleaned: list[tuple[str, float]],
+    metric_name: str,
+    safe_title: str,
+    orientation: str = "horizontal",
+    output_directory: str = "response_log",
+) -> str:
+    # Data mode: hand the cleaned series back for the browser to draw, no rendering or disk writes
+    if run_context and run_context.chart_mode == "data":
+        run_context.add_chart(
+            ChartArtifact(
+                title=safe_title,
+                metric_name=metric_name,
+                series=[{"label": label, "value": value} for label, value in cleaned],
+                orientation=orientation,
+            )
+        )
+        return f"Bar chart data for '{safe_title}' sent to the user ({len(cleaned)} bars)"
 
-        # Position label based on orientation
-        if orientation == "horizontal":
-            ax.text(value, index, f" {formatted}", va="center", fontsize=9)
+    # Imported here so data mode never loads matplotlib
+    from chart_render import BarChartSpec, render_bar_chart_async
+    from chart_store import get_chart_store
+
+    # Rendering runs in the chart worker pool so the event loop keeps serving other runs
+    spec = BarChartSpec(
+        labels=tuple(label for label, _ in cleaned),
+        values=tuple(value for _, value in cleaned),
+        metric_name=metric_name,
+        title=safe_title,
+        orientation=orientation,
+    )
+    chart_store = get_chart_store() if run_context else None
+    if chart_store is not None:
+        # Identical specs (any run, any worker) share one image; only misses are rendered
+        started = time.perf_counter()
+        chart_path, reused = await chart_store.get_or_render(spec)
+        record_span("step", "chart_reuse" if reused else "chart_render", started, run_context)
+    else:
+        # Chart saving setup - charts go to the run's own folder when called inside a pipeline run
+        chart_dir = run_context.run_dir if run_context else Path(output_directory)
+        chart_dir.mkdir(parents=True, exist_ok=True)
+        if run_context:
+            chart_path = run_context.new_chart_path(_slugify_title(safe_title))
         else:
-            ax.text(index, value, formatted, ha="center", va="bottom", fontsize=9)
+            chart_path = chart_dir / f"{_slugify_title(safe_title)}-{_generate_timestamp()}.png"
+        with timed("step", "chart_render", run_context):
+            await render_bar_chart_async(spec, str(chart_path))
 
-    # Finalize and save chart
-    fig.tight_layout()
-    fig.savefig(chart_path)
-    plt.close(fig)
+    # Record the chart in the run's manifest so callers never have to scan the folder
+    if run_context:
+        run_context.add_chart(
+            ChartArtifact(
+                title=safe_title,
+                metric_name=metric_name,
+                path=chart_path,
+                orientation=orientation,
+            )
+        )
     return f"Bar chart saved to {chart_path.resolve().as_posix()}"
 
 
+# Local plant matrix lookup, replaces the hosted vector store search for the community workflow
+@function_tool(name_override="search_plant_matrix")
+def search_plant_matrix(
+    name: str | None = None,
+    sun: list[str] | None = None,
+    moisture_level: list[str] | None = None,
+    ph: list[str] | None = None,
+    composition: list[str] | None = None,
+    plant_type: list[str] | None = None,
+    min_height_ft: float | None = None,
+    max_height_ft: float | None = None,
+    min_spread_ft: float | None = None,
+    max_spread_ft: float | None = None,
+    limit: int = 15,
+) -> str:  # JSON list of matching plant matrix rows
+    """Search the plant matrix for species matching site conditions.
+    name: common or scientific name, typos allowed (e.g., 'red maple', 'Acer rubrum')
+    sun: any of 'Full sun', 'Partial sun', 'Full shade'
+    moisture_level: any of 'Dry', 'Moist', 'Wet'
+    ph: any of 'Acidic', 'Slightly acidic', 'Neutral'
+    composition: any soil types, e.g. 'Well drained', 'Clay', 'Loamy', 'Sandy', 'Rocky', 'Rich'
+    plant_type: any of e.g. 'Tree', 'Shrub', 'Herbaceous', 'Grass', 'Perennial', 'Deciduous', 'Conifer'
+    min_height_ft / max_height_ft: mature height range in feet
+    min_spread_ft / max_spread_ft: mature spread range in feet
+    limit: maximum number of rows to return"""
+    rows = get_plant_matrix().search(
+        name=name,
+        filters={
+            "Sun": sun,
+            "MoistureLevel": moisture_level,
+            "pH": ph,
+            "Composition": composition,
+            "PlantType": plant_type,
+        },
+        height_range=(min_height_ft, max_height_ft),
+        spread_range=(min_spread_ft, max_spread_ft),
+        limit=limit,
+    )
+    if not rows:
+        return "No plants in the matrix match these filters. Try relaxing one of them."
+    return json.dumps(
+        [{key: value for key, value in row.items() if key != "_id"} for row in rows]
+    )
+
+
 # Pie chart plotting function - not used for now because of MACC focus
 # @function_tool(name_override="plot_pie_chart")
 # def plot_pie_chart(
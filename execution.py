@@ -0,0 +1,223 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import asynccontextmanager
+
+
+# Outbound limits for model calls, per worker process (divide account limits by the number of
+# gunicorn workers). 0 disables a limit.
+RPM_LIMIT = float(os.environ.get("ECOOPTIMA_RPM", 0))
+TPM_LIMIT = float(os.environ.get("ECOOPTIMA_TPM", 0))
+# Stages running at once in this worker, overall and per workflow
+STAGE_CONCURRENCY = int(os.environ.get("ECOOPTIMA_STAGE_CONCURRENCY", 32))
+WORKFLOW_CONCURRENCY = int(os.environ.get("ECOOPTIMA_WORKFLOW_CONCURRENCY", 16))
+# Retries of a stage after a rate limit / transient error, with jittered exponential backoff
+MAX_RETRIES = int(os.environ.get("ECOOPTIMA_MAX_RETRIES", 4))
+BACKOFF_BASE = float(os.environ.get("ECOOPTIMA_BACKOFF_BASE", 0.5))
+BACKOFF_MAX = float(os.environ.get("ECOOPTIMA_BACKOFF_MAX", 20))
+# Time budget of one request (seconds); stays under the gunicorn worker timeout
+REQUEST_TIMEOUT = float(os.environ.get("ECOOPTIMA_REQUEST_TIMEOUT", 280))
+# Output tokens reserved per stage before its real usage is known
+OUTPUT_TOKEN_RESERVE = int(os.environ.get("ECOOPTIMA_OUTPUT_TOKEN_RESERVE", 1000))
+
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+# Subclasses asyncio.TimeoutError so callers already handling timeouts see it on 3.10 as well
+class DeadlineExceeded(asyncio.TimeoutError):
+    pass
+
+
+def new_deadline(seconds: float = REQUEST_TIMEOUT) -> float:
+    return time.monotonic() + seconds
+
+
+def time_left(deadline: float | None) -> float | None:
+    return None if deadline is None else deadline - time.monotonic()
+
+
+#####################
+### TOKEN BUCKETS ###
+#####################
+
+
+# Classic token bucket refilled continuously at `per_minute / 60` per second and holding at
+# most a minute's worth. Thread-safe and loop-agnostic: waiting is an asyncio.sleep.
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    # Waits for `amount` tokens; requests larger than the bucket go through once it is full
+    async def acquire(self, amount: float, deadline: float | None = None) -> float:
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                needed = min(amount, self.capacity)
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return waited
+                wait = (needed - self._tokens) / self.rate
+            left = time_left(deadline)
+            if left is not None and wait >= left:
+                raise DeadlineExceeded(f"Rate limit wait of {wait:.1f} s exceeds the deadline")
+            await asyncio.sleep(wait)
+            waited += wait
+
+    # Settles an estimate against real usage; the balance may go negative (a debt)
+    def adjust(self, delta: float) -> None:
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - delta)
+
+
+############################
+### CONCURRENCY GOVERNOR ###
+############################
+
+
+# asyncio semaphores belong to one event loop, so there is one governor per loop (the worker's
+# background loop in the app, the asyncio.run loop in batch and bench scripts)
+class ConcurrencyGovernor:
+    def __init__(
+        self, overall: int = STAGE_CONCURRENCY, per_workflow: int = WORKFLOW_CONCURRENCY
+    ):
+        self.overall = asyncio.Semaphore(overall)
+        self.per_workflow_limit = per_workflow
+        self.per_workflow: dict[str, asyncio.Semaphore] = {}
+
+    def workflow(self, name: str) -> asyncio.Semaphore:
+        if name not in self.per_workflow:
+            self.per_workflow[name] = asyncio.Semaphore(self.per_workflow_limit)
+        return self.per_workflow[name]
+
+
+_governors: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ConcurrencyGovernor]" = (
+    weakref.WeakKeyDictionary()
+)
+
+# Set while a stage holds its slots. Guardrails run as nested stages inside the stage they
+# guard; taking a second slot there could deadlock once every slot is held by a parent.
+_holding_slot: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "ecooptima_holding_slot", default=False
+)
+
+
+@asynccontextmanager
+async def stage_slot(workflow_name: str | None):
+    if _holding_slot.get():
+        yield
+        return
+    loop = asyncio.get_running_loop()
+    governor = _governors.get(loop)
+    if governor is None:
+        governor = _governors[loop] = ConcurrencyGovernor()
+
+    # Workflow slot first, so a busy workflow queues without holding a global slot
+    workflow_slot = governor.workflow(workflow_name) if workflow_name else None
+    if workflow_slot is not None:
+        await workflow_slot.acquire()
+    try:
+        async with governor.overall:
+            token = _holding_slot.set(True)
+            try:
+                yield
+            finally:
+                _holding_slot.reset(token)
+    finally:
+        if workflow_slot is not None:
+            workflow_slot.release()
+
+
+####################
+### RATE LIMITER ###
+####################
+
+
+_requests_bucket = TokenBucket(RPM_LIMIT) if RPM_LIMIT > 0 else None
+_tokens_bucket = TokenBucket(TPM_LIMIT) if TPM_LIMIT > 0 else None
+_stats: Counter = Counter()
+_stats_lock = threading.Lock()
+
+
+def record(name: str, amount: float = 1) -> None:
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def execution_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+
+# Returns the seconds spent waiting for the buckets
+async def acquire_capacity(estimated_tokens: int, deadline: float | None) -> float:
+    waited = 0.0
+    if _requests_bucket is not None:
+        waited += await _requests_bucket.acquire(1, deadline)
+    if _tokens_bucket is not None:
+        waited += await _tokens_bucket.acquire(estimated_tokens, deadline)
+    if waited:
+        record("rate_limit_waits")
+        record("rate_limit_wait_seconds", waited)
+    return waited
+
+
+# A stage can make several model calls (tool loops); charge what it really used
+def settle_usage(requests: int, total_tokens: int, estimated_tokens: int) -> None:
+    if _requests_bucket is not None and requests > 1:
+        _requests_bucket.adjust(requests - 1)
+    if _tokens_bucket is not None and total_tokens:
+        _tokens_bucket.adjust(total_tokens - estimated_tokens)
+
+
+###############
+### RETRIES ###
+###############
+
+
+# A nested stage (guardrail) that used up its retries marks the error, so the stage around it
+# doesn't multiply the attempts by retrying it all over again
+def mark_exhausted(error: BaseException) -> None:
+    error.ecooptima_retries_exhausted = True
+
+
+def is_retryable(error: BaseException) -> bool:
+    from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+    if getattr(error, "ecooptima_retries_exhausted", False):
+        return False
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+
+def _retry_after(error: BaseException) -> float | None:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[header]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+# Full jitter: uniform in [0, min(max, base * 2**attempt)], but never sooner than Retry-After
+def backoff_delay(attempt: int, error: BaseException | None = None) -> float:
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+    retry_after = _retry_after(error) if error is not None else None
+    return max(delay, retry_after or 0.0)
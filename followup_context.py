@@ -0,0 +1,180 @@
+import json
+import math
+import os
+import re
+
+try:
+    import tiktoken
+except ImportError:  # optional: exact counts for OpenAI models when installed
+    tiktoken = None
+
+
+# Token budget for one follow-up prompt (everything sent to the conversational agent)
+FOLLOWUP_TOKEN_BUDGET = int(os.environ.get("ECOOPTIMA_FOLLOWUP_TOKENS", 2000))
+# Shares of the budget for the analysis being discussed and for the summary of older turns;
+# recent turns get whatever is left
+OUTPUT_SHARE = 0.5
+SUMMARY_SHARE = 0.15
+# Each turn that leaves the recent window is folded into one summary line of at most this size
+SUMMARY_LINE_TOKENS = 40
+SUMMARY_MAX_LINES = 30
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+_encoding = None
+
+
+#########################
+### TOKEN MEASUREMENT ###
+#########################
+
+
+# Local count, no API call. With tiktoken installed it is exact for the o200k models; otherwise
+# words are charged one token per four characters and punctuation one each, which tracks BPE
+# counts for English prose within a few percent.
+def count_tokens(text: str) -> int:
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text))
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECES.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    used = 0
+    end = 0
+    for match in _PIECES.finditer(text):
+        used += math.ceil(len(match.group()) / 4)
+        if used > max_tokens - 1:
+            break
+        end = match.end()
+    return text[:end].rstrip() + " …"
+
+
+def _json_tokens(value) -> int:
+    return count_tokens(json.dumps(value, separators=(",", ":")))
+
+
+#######################
+### ROLLING SUMMARY ###
+#######################
+
+
+# First sentence of a message, capped, e.g. "user: Which trees tolerate clay?"
+def summarize_turn(turn: dict) -> str:
+    content = re.sub(r"\s+", " ", turn.get("content", "")).strip()
+    first_sentence = re.split(r"(?<=[.!?])\s", content, maxsplit=1)[0]
+    return f"{turn.get('role', 'user')}: {truncate_to_tokens(first_sentence, SUMMARY_LINE_TOKENS)}"
+
+
+# Keeps the last `keep_last` messages verbatim and folds older ones into
+# session_state["history_summary"]. Only the messages leaving the window are summarized, once,
+# so the summary grows by a line per turn instead of being rebuilt on every follow-up.
+def roll_history(session_state: dict, keep_last: int) -> None:
+    history = session_state.get("chat_history", [])
+    if len(history) <= keep_last:
+        return
+    overflow, session_state["chat_history"] = history[:-keep_last], history[-keep_last:]
+    summary = session_state.get("history_summary", [])
+    summary = summary + [summarize_turn(turn) for turn in overflow]
+    session_state["history_summary"] = summary[-SUMMARY_MAX_LINES:]
+
+
+########################
+### BUDGETED PAYLOAD ###
+########################
+
+
+# The structured MACC, trimmed until it fits: free-text notes go first, then descriptions and
+# the narrative, then the most expensive options (the tail of the curve order)
+def _fit_macc_result(macc_result: dict, max_tokens: int) -> dict | None:
+    fitted = json.loads(json.dumps(macc_result))
+    for field in ("notes", "description"):
+        if _json_tokens(fitted) <= max_tokens:
+            return fitted
+        for option in fitted.get("options", []):
+            option.pop(field, None)
+    if _json_tokens(fitted) > max_tokens:
+        fitted.get("assumptions", {}).pop("key_notes", None)
+        fitted["narrative"] = truncate_to_tokens(
+            fitted.get("narrative", ""),
+            max(0, max_tokens - _json_tokens({**fitted, "narrative": ""})),
+        )
+
+    order = fitted.get("sorted_option_ids", [])
+    rank = {option_id: index for index, option_id in enumerate(order)}
+    while _json_tokens(fitted) > max_tokens and len(fitted.get("options", [])) > 1:
+        priciest = max(fitted["options"], key=lambda option: rank.get(option["option_id"], 0))
+        fitted["options"].remove(priciest)
+        fitted["sorted_option_ids"] = fitted["sorted_option_ids"][: len(fitted["options"])]
+        fitted["cumulative_abatement_tCO2e"] = fitted["cumulative_abatement_tCO2e"][
+            : len(fitted["options"])
+        ]
+    return fitted if _json_tokens(fitted) <= max_tokens else None
+
+
+def _latest_output(session_state: dict, max_tokens: int):
+    prose = session_state.get("last_pipeline_output", "")
+    macc_result = session_state.get("last_macc_result")
+    if not macc_result:
+        return truncate_to_tokens(prose, max_tokens)
+
+    # Consumer/Academic: the numbers come from the structured result, prose only fills what's left
+    fitted = _fit_macc_result(macc_result, max_tokens)
+    if fitted is None:
+        return truncate_to_tokens(prose, max_tokens)
+    remaining = max_tokens - _json_tokens(fitted) - 8
+    return {"macc_result": fitted, "roi_summary": truncate_to_tokens(prose, remaining)}
+
+
+# Follow-up prompt packed into `budget` tokens: the question always, then the analysis being
+# discussed, the rolling summary of older turns, and as many recent turns as fit (newest first).
+def build_followup_payload(
+    session_state: dict, user_input: str, budget: int = FOLLOWUP_TOKEN_BUDGET
+) -> dict:
+    remaining = budget - count_tokens(user_input) - 32
+
+    latest = _latest_output(session_state, int(remaining * OUTPUT_SHARE))
+    remaining -= _json_tokens(latest)
+
+    summary: list[str] = []
+    summary_budget = int(budget * SUMMARY_SHARE)
+    for line in reversed(session_state.get("history_summary", [])):
+        cost = count_tokens(line) + 2
+        if cost > summary_budget or cost > remaining:
+            break
+        summary.insert(0, line)
+        summary_budget -= cost
+        remaining -= cost
+
+    # The assistant message for the analysis itself repeats latest_workflow_output
+    last_output = session_state.get("last_pipeline_output", "")
+    history: list[dict] = []
+    for turn in reversed(session_state.get("chat_history", [])):
+        content = turn.get("content", "")
+        if turn.get("role") == "assistant" and content == last_output:
+            content = "(see latest_workflow_output)"
+        cost = count_tokens(content) + 8
+        if cost > remaining:
+            content = truncate_to_tokens(content, remaining - 8)
+            cost = count_tokens(content) + 8
+            if not content or cost > remaining:
+                break
+        history.insert(0, {"role": turn.get("role", "user"), "content": content})
+        remaining -= cost
+
+    payload = {
+        "latest_workflow_output": latest,
+        "chat_history": history,
+        "user_followup": user_input,
+    }
+    if summary:
+        payload["conversation_summary"] = summary
+    # Per-part estimates leave out JSON quoting and keys; drop the oldest turns if that tips it over
+    while history and _json_tokens(payload) > budget:
+        history.pop(0)
+    return payload
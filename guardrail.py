@@ -0,0 +1,331 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Literal
+
+from plant_matrix import PlantMatrixIndex, get_plant_matrix
+from response_cache import normalize_input
+
+
+# Local verdicts are only trusted outside this band of on-topic probability; anything in
+# between goes to the guardrail agent. ECOOPTIMA_LOCAL_GUARDRAIL=0 sends everything to the LLM.
+LOCAL_GUARDRAIL_ENABLED = os.environ.get("ECOOPTIMA_LOCAL_GUARDRAIL", "1") != "0"
+ACCEPT_PROBABILITY = float(os.environ.get("ECOOPTIMA_GUARDRAIL_ACCEPT", 0.85))
+REJECT_PROBABILITY = float(os.environ.get("ECOOPTIMA_GUARDRAIL_REJECT", 0.1))
+VERDICT_CACHE_SIZE = int(os.environ.get("ECOOPTIMA_GUARDRAIL_CACHE_SIZE", 4096))
+
+VerdictSource = Literal["species", "model", "cache", "llm"]
+
+
+#######################
+### TRAINING CORPUS ###
+#######################
+
+
+# Generic vocabulary that means "this is about plants". Words that are just as often about
+# something else ("shade of red", "root cause", "rain tomorrow") are left out.
+PLANT_KEYWORDS = frozenset(
+    """
+    plant planting planted tree shrub bush grass perennial annual flower flowering native species
+    garden gardening landscaping landscape canopy seedling sapling hedge groundcover pollinator
+    prairie meadow wildflower bioswale reforestation afforestation arborist mulch deciduous
+    evergreen conifer foliage orchard habitat biodiversity greenspace vegetation
+    """.split()
+)
+
+# Keywords just as common outside plants ("power plant", "family tree", "garden center"); two
+# of them together are still no plant-specific signal
+_GENERIC_KEYWORDS = frozenset(
+    """
+    plant planting planted tree garden gardening landscape landscaping native species annual
+    bush grass flower habitat biodiversity canopy greenspace
+    """.split()
+)
+
+# Plant care words; each is a plant-specific signal next to a keyword, but not one on its own.
+# Site and place words (clay, sandy, sun, county, springs) are no signal at all.
+GROWING_WORDS = frozenset(
+    """
+    sow sowing prune pruning bloom blooming hardiness germinate germination transplant
+    transplanting overwinter
+    """.split()
+)
+
+# A plant keyword as the thing asked for: "what plants should I use", "which trees to plant",
+# "best shrubs for a median". "the power plant emissions" or "a tree in the yard" are no ask.
+_PLANTING_ASK = re.compile(
+    r"\b(?:what|which|recommend|suggest|best)\s+(?:[a-z]+\s+){0,2}?"
+    r"(?:plants?|trees?|shrubs?|bush(?:es)?|flowers?|species|grass(?:es)?|perennials?|"
+    r"hedges?|groundcovers?|wildflowers?|natives?|plant\s+bundles?)\s+"
+    r"(?:should|would|could|can|to|for|do|will|that|grow|thrive)\b"
+)
+
+# Common-name head words too generic to count as a species hit on their own ("chewing gum")
+_AMBIGUOUS_NAME_WORDS = frozenset({"weed", "bush", "gum", "grass", "rose", "common", "wood"})
+
+# Seed examples for the lexical model; plant matrix names are added as on-topic documents
+ON_TOPIC_EXAMPLES = (
+    "which trees should we plant in the community park",
+    "native shrubs for a school yard with clay soil",
+    "best plants for a rain garden in full sun",
+    "what species survive in wet acidic soil",
+    "recommend drought tolerant plants for a street median",
+    "pollinator friendly flowers for our community garden",
+    "shade trees for a parking lot with a small budget",
+    "ground cover for a sandy slope that gets partial shade",
+    "how much carbon do oak trees sequester",
+    "what should we plant along the riverbank to stop erosion",
+    "cheap low maintenance hedges for a church property",
+    "plant recommendations for a neighborhood greening project",
+    "tall grasses for a prairie restoration",
+    "trees that cool the urban heat island",
+    "which maple varieties do well in our city",
+    "plants that tolerate road salt and compacted soil",
+    "best species for a green roof",
+    "planting plan for a vacant lot with a 5000 dollar budget",
+    "survival rate of saplings in dry loamy soil",
+    "flowering shrubs for a playground border",
+    # The example questions on the app's own pages
+    "what plants should i use for a community park with a budget of 5000 dollars",
+    "what plants should i use for a mini forest in ohio",
+    "what plant bundles should i use for leed implementation",
+)
+
+OFF_TOPIC_EXAMPLES = (
+    "what is the weather tomorrow",
+    "write me a python script to sort a list",
+    "who won the football game last night",
+    "give me a recipe for chocolate cake",
+    "what stocks should i buy this year",
+    "tell me a joke",
+    "how do i fix my car's transmission",
+    "translate hello into french",
+    "what movies are playing this weekend",
+    "explain how blockchain works",
+    "book me a flight to chicago",
+    "what is the capital of australia",
+    "help me write a cover letter",
+    "how many calories are in a banana smoothie",
+    "summarize the news today",
+    "what is the best laptop for gaming",
+    "solve this math equation for x",
+    "who is the president of france",
+    "recommend a good tv series",
+    "how do i reset my password",
+)
+
+
+def _words(text: str) -> list[str]:
+    return re.findall(r"[a-z]+", text.lower())
+
+
+def _fold(word: str) -> str:
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
+
+
+# Fold plurals so "trees"/"tree" and "shrubs"/"shrub" share a feature ("quercus" stays). Words
+# in `keep` are left alone, so names like "iris" or "cercis" aren't cut to "iri"/"cerci".
+def _tokens(text: str, keep: frozenset[str] = frozenset()) -> list[str]:
+    return [word if word in keep else _fold(word) for word in _words(text)]
+
+
+#####################
+### LEXICAL MODEL ###
+#####################
+
+
+# Multinomial naive Bayes over word unigrams with add-one smoothing. Tiny and trained at
+# startup, it only has to separate the obvious cases; the LLM still judges everything else.
+class LexicalModel:
+    def __init__(self, on_topic: list[str], off_topic: list[str]):
+        self._counts = {True: Counter(), False: Counter()}
+        for label, documents in ((True, on_topic), (False, off_topic)):
+            for document in documents:
+                self._counts[label].update(_tokens(document))
+        self._vocabulary = set(self._counts[True]) | set(self._counts[False])
+        self._totals = {label: sum(counts.values()) for label, counts in self._counts.items()}
+        total_documents = len(on_topic) + len(off_topic)
+        self._priors = {
+            True: math.log(len(on_topic) / total_documents),
+            False: math.log(len(off_topic) / total_documents),
+        }
+
+    def probability(self, text: str) -> float:
+        known = [token for token in _tokens(text) if token in self._vocabulary]
+        if not known:
+            return 0.5
+        scores = {}
+        for label in (True, False):
+            denominator = self._totals[label] + len(self._vocabulary)
+            scores[label] = self._priors[label] + sum(
+                math.log((self._counts[label][token] + 1) / denominator) for token in known
+            )
+        # Logistic of the log-odds, clamped so huge inputs cannot overflow
+        log_odds = max(-50.0, min(50.0, scores[True] - scores[False]))
+        return 1 / (1 + math.exp(-log_odds))
+
+
+########################
+### TIERED GUARDRAIL ###
+########################
+
+
+@dataclass
+class GuardrailVerdict:
+    is_eco_optima: bool
+    reasoning: str
+    source: VerdictSource
+
+
+# Settles obvious inputs without a model call. An accept needs a PLANT_KEYWORDS word plus a
+# second plant-specific signal: another keyword, a multi-word plant matrix species name, a plant
+# care word or a planting ask ("what trees should we plant") - and the lexical model has to be
+# confident too. Genus and head words ("oak", "cedar") never count on their own ("Oak Ridge
+# jobs", "bury him under an oak tree"), and neither do site or place words ("clay county").
+# Rejects need a confident model and no plant keyword at all. Everything else goes to the LLM.
+# Verdicts (local and LLM) are cached by normalized input; counters track how many guardrail
+# calls were avoided.
+class LocalGuardrail:
+    def __init__(self, plant_matrix: PlantMatrixIndex, cache_size: int = VERDICT_CACHE_SIZE):
+        self._species_phrases = self._species_vocabulary(plant_matrix.rows)
+        self._name_words = frozenset(
+            word for phrase in self._species_phrases for word in phrase.split()
+        )
+        species_documents = sorted(self._species_phrases)
+        self.model = LexicalModel(
+            list(ON_TOPIC_EXAMPLES) + species_documents + sorted(PLANT_KEYWORDS),
+            list(OFF_TOPIC_EXAMPLES),
+        )
+        self.cache_size = cache_size
+        self._verdicts: OrderedDict[tuple[str, str], GuardrailVerdict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+        self._llm_seconds = 0.0
+
+    @staticmethod
+    def _species_vocabulary(rows: list[dict]) -> set[str]:
+        phrases: set[str] = set()
+        for row in rows:
+            common = " ".join(_words(row.get("CommonName") or ""))
+            scientific = " ".join(_words(row.get("ScientificName") or ""))
+            for name in (common, scientific):
+                if name:
+                    phrases.add(name)
+            # Genus ("quercus") and common-name head word ("oak", "maple")
+            for word in (scientific.split()[:1] + common.split()[-1:]):
+                if len(word) > 2 and word not in _AMBIGUOUS_NAME_WORDS:
+                    phrases.add(word)
+        return phrases
+
+    # Longest plant matrix phrase in the words, multi-word names first, with the index after it
+    def _species_hit(self, words: list[str]) -> tuple[str, int] | None:
+        for size in (3, 2, 1):
+            for start in range(len(words) - size + 1):
+                phrase = " ".join(words[start : start + size])
+                if phrase in self._species_phrases:
+                    return phrase, start + size
+        return None
+
+    def classify(self, text: str) -> GuardrailVerdict | None:
+        words = _tokens(text, self._name_words)
+        keywords = {word for word in words if word in PLANT_KEYWORDS}
+        probability = self.model.probability(text)
+        if not keywords:
+            if probability <= REJECT_PROBABILITY:
+                return GuardrailVerdict(False, "Not a question about plants.", "model")
+            return None
+        if probability < ACCEPT_PROBABILITY:
+            return None
+
+        # A full species name is a signal, but "white oak tree" is still one mention: the keyword
+        # right after it adds nothing. A head word ("oak tree") is no signal of its own.
+        species = None
+        hit = self._species_hit(words)
+        if hit is not None and " " in hit[0]:
+            species, end = hit
+            if end < len(words) and words[end] in keywords and words.count(words[end]) == 1:
+                keywords.discard(words[end])
+        # Two signals, at least one of them plant-specific
+        extra = (
+            (species is not None)
+            + any(word in GROWING_WORDS for word in words)
+            + bool(_PLANTING_ASK.search(" ".join(_words(text))))
+        )
+        if len(keywords) + extra < 2 or not (keywords - _GENERIC_KEYWORDS or extra):
+            return None
+        if species is not None:
+            return GuardrailVerdict(True, f"Mentions '{species}' from the plant matrix.", "species")
+        return GuardrailVerdict(True, "Asks about plants or planting.", "model")
+
+    # Cached or local verdict, or None when the guardrail agent has to decide. `scope`
+    # identifies the guardrail prompt/model so a prompt change does not reuse old verdicts.
+    def check(self, text: str, scope: str = "") -> GuardrailVerdict | None:
+        key = (scope, normalize_input(text))
+        with self._lock:
+            verdict = self._verdicts.get(key)
+            if verdict is not None:
+                self._verdicts.move_to_end(key)
+                self._counts["cache"] += 1
+                return GuardrailVerdict(verdict.is_eco_optima, verdict.reasoning, "cache")
+
+        verdict = self.classify(text) if LOCAL_GUARDRAIL_ENABLED else None
+        if verdict is not None:
+            self._store(key, verdict)
+            with self._lock:
+                self._counts["local_accept" if verdict.is_eco_optima else "local_reject"] += 1
+        return verdict
+
+    def record_llm(
+        self, text: str, is_eco_optima: bool, reasoning: str, seconds: float, scope: str = ""
+    ) -> GuardrailVerdict:
+        verdict = GuardrailVerdict(is_eco_optima, reasoning, "llm")
+        self._store((scope, normalize_input(text)), verdict)
+        with self._lock:
+            self._counts["llm"] += 1
+            self._llm_seconds += seconds
+        return verdict
+
+    def _store(self, key: tuple[str, str], verdict: GuardrailVerdict) -> None:
+        with self._lock:
+            self._verdicts[key] = verdict
+            self._verdicts.move_to_end(key)
+            while len(self._verdicts) > self.cache_size:
+                self._verdicts.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+            llm_seconds = self._llm_seconds
+        llm_calls = counts.get("llm", 0)
+        avoided = sum(counts.get(name, 0) for name in ("cache", "local_accept", "local_reject"))
+        avg_llm_ms = llm_seconds / llm_calls * 1000 if llm_calls else 0.0
+        return {
+            "checks": avoided + llm_calls,
+            "llm_calls": llm_calls,
+            "llm_calls_avoided": avoided,
+            "cache_hits": counts.get("cache", 0),
+            "local_accepts": counts.get("local_accept", 0),
+            "local_rejects": counts.get("local_reject", 0),
+            "avg_llm_ms": avg_llm_ms,
+            # Estimated from the average guardrail LLM call observed in this worker
+            "latency_saved_ms": avoided * avg_llm_ms,
+            "cached_verdicts": len(self._verdicts),
+        }
+
+
+_guardrail: LocalGuardrail | None = None
+_guardrail_lock = threading.Lock()
+
+
+def get_guardrail() -> LocalGuardrail:
+    global _guardrail
+    if _guardrail is None:
+        with _guardrail_lock:
+            if _guardrail is None:
+                _guardrail = LocalGuardrail(get_plant_matrix())
+    return _guardrail
@@ -0,0 +1,19 @@
+import os
+
+
+# Threaded workers: each request thread blocks on its own analysis while the
+# coroutines themselves all run on the worker's shared event loop (background_loop.py)
+bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 32))
+
+# A full two-agent pipeline can take well over the default 30 seconds
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 300))
+
+
+# Warm the workflow registry in each worker after it boots, without delaying the boot itself
+def post_worker_init(worker):
+    from app import start_background_warmup
+
+    start_background_warmup()
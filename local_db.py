@@ -0,0 +1,22 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+
+# Connections to the local SQLite stores shared by every worker on the host (response cache,
+# sessions, usage, run log, chart store): one per thread, autocommit (stores open their own
+# transactions), WAL so workers read while another one writes, synchronous=NORMAL.
+# incremental_vacuum has to be asked for before WAL: it only takes on a file that has no
+# tables yet.
+def thread_connection(
+    local: threading.local, path: Path, incremental_vacuum: bool = False
+) -> sqlite3.Connection:
+    db = getattr(local, "db", None)
+    if db is None:
+        db = sqlite3.connect(path, timeout=10, isolation_level=None)
+        if incremental_vacuum:
+            db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        local.db = db
+    return db
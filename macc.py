@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+# Deterministic marginal abatement cost curve math. The MACC agents only estimate raw costs and
+# abatement per option; cost per tCO2e, the curve order and the cumulative abatement are
+# computed here, vectorized, before the ROI stage sees the result.
+
+
+@dataclass
+class MaccCurve:
+    # Per option, in input order (None where abatement is zero: cost per tonne is undefined)
+    cost_per_tCO2e: list[float | None]
+    # Option indices sorted by cost per tCO2e ascending, zero-abatement options last
+    order: list[int]
+    # Running abatement total along `order`
+    cumulative_abatement: list[float]
+
+
+def compute_macc_curve(costs, abatement) -> MaccCurve:
+    costs = np.asarray(costs, dtype=float)
+    abatement = np.asarray(abatement, dtype=float)
+    if costs.shape != abatement.shape:
+        raise ValueError("costs and abatement must have one value per option.")
+
+    # Negative costs (net savings) stay negative and sort first, as on any MACC
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cost_per = np.where(abatement > 0, costs / abatement, np.nan)
+
+    # Stable sort keeps the agent's order for ties; NaN (no abatement) sorts to the end
+    order = np.argsort(cost_per, kind="stable")
+    cumulative = np.cumsum(np.where(abatement > 0, abatement, 0.0)[order])
+
+    return MaccCurve(
+        cost_per_tCO2e=[None if np.isnan(value) else float(value) for value in cost_per],
+        order=order.tolist(),
+        cumulative_abatement=cumulative.tolist(),
+    )
+
+
+# Present cost of each option under a new discount rate and (optionally shorter) horizon. The
+# agents report one present cost per option, not its cash flows, so the cost is treated as a
+# level annual stream over its lifetime at `old_rate` and re-discounted over `years`.
+def rediscount_present_costs(costs, lifetimes, old_rate: float, new_rate: float, years) -> list:
+    costs = np.asarray(costs, dtype=float)
+    lifetimes = np.asarray(lifetimes, dtype=float)
+    years = np.asarray(years, dtype=float)
+    rescale = _annuity_factor(new_rate, years) / _annuity_factor(old_rate, lifetimes)
+    return (costs * rescale).tolist()
+
+
+# Present value of 1 per year for `years` years at `rate`
+def _annuity_factor(rate: float, years):
+    if abs(rate) < 1e-12:
+        return years
+    return (1 - (1 + rate) ** -years) / rate
@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+
+# In-process timing registry exported in the Prometheus text format on /metrics (no client
+# library). Each gunicorn worker keeps its own; scrape every worker or sum them in queries.
+
+# Histogram buckets (seconds), from cache lookups up to full analyses
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160, 320)
+QUANTILES = (0.5, 0.95, 0.99)
+# Recent samples kept per series for the p50/p95/p99 summary
+QUANTILE_WINDOW = 1024
+
+# kind -> (metric name, label carrying the span name, help text)
+KINDS = {
+    "request": ("ecooptima_request", "outcome", "Analyze runs, end to end"),
+    "stage": ("ecooptima_stage", "stage", "Agent stages, with retries and nested guardrails"),
+    "model": ("ecooptima_model_call", "agent", "Single model calls"),
+    "tool": ("ecooptima_tool", "tool", "Local function tool calls"),
+    "step": ("ecooptima_step", "step", "Local steps: cache lookup, chart render, cache write"),
+}
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent: deque[float] = deque(maxlen=QUANTILE_WINDOW)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+
+    def quantiles(self) -> list[float]:
+        ordered = sorted(self.recent)
+        if not ordered:
+            return [0.0 for _ in QUANTILES]
+        return [ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: tuple[tuple[str, str], ...]) -> str:
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (kind, workflow, name) -> Histogram / in-flight count
+        self._histograms: dict[tuple[str, str, str], Histogram] = {}
+        self._in_flight: Counter = Counter()
+
+    def observe(self, kind: str, workflow: str | None, name: str, seconds: float) -> None:
+        key = (kind, workflow or "none", name)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def in_flight(self, kind: str, workflow: str | None, name: str = ""):
+        key = (kind, workflow or "none", name)
+        with self._lock:
+            self._in_flight[key] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight[key] -= 1
+
+    # Prometheus text exposition: per kind a histogram (aggregatable across workers), a summary
+    # with p50/p95/p99 over the last QUANTILE_WINDOW samples, and an in-flight gauge
+    def render(self, counters: dict[str, float] | None = None) -> str:
+        with self._lock:
+            histograms = {
+                key: (list(h.buckets), h.count, h.sum, h.quantiles())
+                for key, h in self._histograms.items()
+            }
+            in_flight = dict(self._in_flight)
+
+        lines = []
+        for kind, (metric, label, help_text) in KINDS.items():
+            series = sorted(key for key in histograms if key[0] == kind)
+            lines.append(f"# HELP {metric}_seconds {help_text} (seconds)")
+            lines.append(f"# TYPE {metric}_seconds histogram")
+            for key in series:
+                buckets, count, total, _ = histograms[key]
+                base = (("workflow", key[1]), (label, key[2]))
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                    cumulative += bucket_count
+                    lines.append(
+                        f"{metric}_seconds_bucket{_labels(base + (('le', f'{bound:g}'),))} "
+                        f"{cumulative}"
+                    )
+                lines.append(f"{metric}_seconds_bucket{_labels(base + (('le', '+Inf'),))} {count}")
+                lines.append(f"{metric}_seconds_sum{_labels(base)} {total:.6f}")
+                lines.append(f"{metric}_seconds_count{_labels(base)} {count}")
+
+            lines.append(f"# HELP {metric}_latency_seconds {help_text}, recent quantiles")
+            lines.append(f"# TYPE {metric}_latency_seconds summary")
+            for key in series:
+                _, count, total, quantiles = histograms[key]
+                base = (("workflow", key[1]), (label, key[2]))
+                for q, value in zip(QUANTILES, quantiles):
+                    lines.append(
+                        f"{metric}_latency_seconds{_labels(base + (('quantile', f'{q:g}'),))} "
+                        f"{value:.6f}"
+                    )
+                lines.append(f"{metric}_latency_seconds_sum{_labels(base)} {total:.6f}")
+                lines.append(f"{metric}_latency_seconds_count{_labels(base)} {count}")
+
+            lines.append(f"# HELP {metric}_in_flight {help_text}, currently running")
+            lines.append(f"# TYPE {metric}_in_flight gauge")
+            for key in sorted(k for k in in_flight if k[0] == kind):
+                labels = (("workflow", key[1]),) + (((label, key[2]),) if key[2] else ())
+                lines.append(f"{metric}_in_flight{_labels(labels)} {in_flight[key]}")
+
+        for name, value in sorted((counters or {}).items()):
+            lines.append(f"# TYPE ecooptima_{name}_total counter")
+            lines.append(f"ecooptima_{name}_total {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    return _registry
+
+
+# Records a span that began at `started` (time.perf_counter) into the registry and, when a run
+# context is given, into that run's breakdown (RunContext.timings, kept in its run log record)
+def record_span(
+    kind: str, name: str, started: float, context=None, workflow: str | None = None
+) -> float:
+    seconds = time.perf_counter() - started
+    workflow = context.workflow if context is not None else workflow
+    _registry.observe(kind, workflow, name, seconds)
+    if context is not None:
+        context.add_timing(kind, name, started, seconds)
+    return seconds
+
+
+@contextmanager
+def timed(kind: str, name: str, context=None, workflow: str | None = None):
+    started = time.perf_counter()
+    with _registry.in_flight(kind, context.workflow if context is not None else workflow, name):
+        try:
+            yield
+        finally:
+            record_span(kind, name, started, context, workflow)
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from execution import time_left
+
+
+# Model routing per agent role. Each stage maps to a role (STAGE_ROLES) and each role to an
+# ordered list of models from the policy: preferred models first, then faster fallbacks. Before
+# a stage runs, the router works out its time budget (the role's share of what is left of the
+# request's latency SLO and hard deadline) and picks the first model whose rolling p95 for that
+# role fits; a model without enough samples yet is assumed to fit. When none fits, the one with
+# the lowest p95 runs. Samples expire after ROUTING_SAMPLE_MAX_AGE: only the model that runs
+# gets new samples, so a model skipped for being slow would otherwise keep its stale p95 for
+# good. Once its samples are gone it runs again until it has MIN_SAMPLES fresh ones, and routing
+# recovers when the slowdown was temporary. Every decision lands on RunContext.routing and in
+# the run log record, so the policy can be tuned offline (python run_log.py routing).
+#
+# ECOOPTIMA_MODEL_POLICY is inline JSON or a path to a JSON file, merged over DEFAULT_POLICY
+# role by role. "models": [] means the workflow's own agent_model.
+MODEL_ROUTING_ENABLED = os.environ.get("ECOOPTIMA_MODEL_ROUTING", "1") != "0"
+MODEL_POLICY = os.environ.get("ECOOPTIMA_MODEL_POLICY", "")
+# Stage durations kept per (role, model), how many are needed before p95 is trusted, and how
+# long (seconds) a sample counts
+LATENCY_WINDOW = 200
+MIN_SAMPLES = int(os.environ.get("ECOOPTIMA_ROUTING_MIN_SAMPLES", 5))
+ROUTING_SAMPLE_MAX_AGE = float(os.environ.get("ECOOPTIMA_ROUTING_SAMPLE_MAX_AGE", 900))
+ROUTING_QUANTILE = 0.95
+
+STAGE_ROLES = {
+    "guardrail": "guardrail",
+    "plant_matrix": "builder",
+    "consumer_macc": "builder",
+    "academic_macc": "builder",
+    "local_roi": "narrator",
+    "consumer_roi": "narrator",
+    "academic_roi": "narrator",
+    "followup": "conversational",
+}
+
+# budget_share: part of the remaining request time a stage of this role may use. Builders leave
+# room for the ROI narrator that follows them; the guardrail runs alongside its stage.
+DEFAULT_POLICY = {
+    # Target seconds per request kind; the hard limit stays ECOOPTIMA_REQUEST_TIMEOUT
+    "slo_seconds": {"analyze": 120, "followup": 30},
+    "roles": {
+        "guardrail": {"models": [], "fallback": ["gpt-4.1-nano"], "budget_share": 0.15},
+        "builder": {"models": [], "fallback": ["gpt-4.1-mini"], "budget_share": 0.6},
+        "narrator": {"models": [], "fallback": ["gpt-4.1-nano"], "budget_share": 1.0},
+        "conversational": {"models": [], "fallback": ["gpt-4.1-nano"], "budget_share": 1.0},
+    },
+}
+
+
+def load_policy(source: str = MODEL_POLICY) -> dict:
+    policy = json.loads(json.dumps(DEFAULT_POLICY))
+    if not source.strip():
+        return policy
+    text = source if source.lstrip().startswith("{") else Path(source).read_text(encoding="utf-8")
+    override = json.loads(text)
+    policy["slo_seconds"].update(override.get("slo_seconds", {}))
+    for role, rules in override.get("roles", {}).items():
+        policy["roles"].setdefault(role, {"models": [], "fallback": [], "budget_share": 1.0})
+        policy["roles"][role].update(rules)
+    return policy
+
+
+# One routing decision, as stored in the run log. seconds/status are filled in once the stage
+# has run; p95_s holds the p95 the router saw for every candidate (None: too few samples).
+@dataclass
+class RouteDecision:
+    stage: str
+    role: str
+    model: str
+    preferred: str
+    fallback: bool
+    reason: str
+    budget_s: float | None
+    p95_s: dict
+    seconds: float | None = None
+    status: str | None = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class ModelRouter:
+    def __init__(self, policy: dict | None = None):
+        self.policy = policy if policy is not None else load_policy()
+        self._lock = threading.Lock()
+        # (role, model) -> (time.monotonic() observed, seconds)
+        self._latencies: dict[tuple[str, str], deque[tuple[float, float]]] = {}
+        # (id(agent), model) -> (agent, clone); the agent is kept so its id is never reused
+        self._clones: dict[tuple[int, str], tuple] = {}
+
+    def slo_seconds(self, kind: str) -> float | None:
+        return self.policy["slo_seconds"].get(kind)
+
+    def observe(self, role: str, model: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._latencies.get((role, model))
+            if samples is None:
+                samples = self._latencies[(role, model)] = deque(maxlen=LATENCY_WINDOW)
+            samples.append((time.monotonic(), seconds))
+
+    def _recent(self, role: str, model: str) -> list[float]:
+        cutoff = time.monotonic() - ROUTING_SAMPLE_MAX_AGE
+        with self._lock:
+            samples = self._latencies.get((role, model))
+            if samples is None:
+                return []
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+            return [seconds for _, seconds in samples]
+
+    def p95(self, role: str, model: str) -> float | None:
+        samples = sorted(self._recent(role, model))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(ROUTING_QUANTILE * len(samples)))]
+
+    def candidates(self, role: str, default_model: str) -> list[str]:
+        rules = self.policy["roles"][role]
+        models = list(rules.get("models") or [default_model])
+        return models + [model for model in rules.get("fallback", []) if model not in models]
+
+    # Seconds this stage may take: its role's share of the tighter of the SLO and the deadline
+    def budget(self, role: str, context) -> float | None:
+        if context is None:
+            return None
+        limits = [time_left(context.deadline)]
+        if context.latency_slo is not None:
+            limits.append(context.latency_slo - (time.perf_counter() - context.started))
+        limits = [limit for limit in limits if limit is not None]
+        if not limits:
+            return None
+        return max(min(limits), 0.0) * self.policy["roles"][role].get("budget_share", 1.0)
+
+    def choose(self, stage: str, default_model: str, context) -> RouteDecision | None:
+        role = STAGE_ROLES.get(stage)
+        if role is None or role not in self.policy["roles"]:
+            return None
+        candidates = self.candidates(role, default_model)
+        budget = self.budget(role, context)
+        p95s = {model: self.p95(role, model) for model in candidates}
+
+        chosen, reason = None, None
+        if budget is None:
+            chosen, reason = candidates[0], "no deadline"
+        else:
+            for model in candidates:
+                if p95s[model] is None:
+                    chosen, reason = model, "no samples"
+                    break
+                if p95s[model] <= budget:
+                    chosen, reason = model, "p95 within budget"
+                    break
+        if chosen is None:
+            chosen = min(candidates, key=lambda model: p95s[model])
+            reason = "deadline at risk, fastest p95"
+        elif chosen != candidates[0]:
+            reason = f"deadline at risk, {reason}"
+        return RouteDecision(
+            stage=stage,
+            role=role,
+            model=chosen,
+            preferred=candidates[0],
+            fallback=chosen != candidates[0],
+            reason=reason,
+            budget_s=round(budget, 2) if budget is not None else None,
+            p95_s={model: round(p, 2) if p is not None else None for model, p in p95s.items()},
+        )
+
+    # The agent as configured, or a copy of it on another model (one copy per agent and model)
+    def agent_for(self, agent, model: str):
+        if agent.model == model:
+            return agent
+        key = (id(agent), model)
+        with self._lock:
+            entry = self._clones.get(key)
+            if entry is None:
+                entry = self._clones[key] = (agent, agent.clone(model=model))
+        return entry[1]
+
+    # Part of the response cache key: answers are only reused for the same preferred models
+    def model_scope(self, default_model: str) -> str:
+        preferred = {
+            role: rules.get("models") or []
+            for role, rules in sorted(self.policy["roles"].items())
+            if rules.get("models")
+        }
+        if not preferred:
+            return default_model
+        digest = hashlib.sha256(json.dumps(preferred, sort_keys=True).encode("utf-8"))
+        return f"{default_model}+{digest.hexdigest()[:8]}"
+
+    def stats(self) -> dict:
+        with self._lock:
+            keys = sorted(self._latencies)
+        return {
+            f"{role}/{model}": {
+                "samples": len(self._recent(role, model)),
+                "p95_s": self.p95(role, model),
+            }
+            for role, model in keys
+        }
+
+
+_router: ModelRouter | None = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter | None:
+    global _router
+    if not MODEL_ROUTING_ENABLED:
+        return None
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
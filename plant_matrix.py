@@ -0,0 +1,251 @@
+import csv
+import difflib
+import json
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+
+# Default data file; ECOOPTIMA_PLANT_MATRIX may point at another .json or .csv export
+PLANT_MATRIX_PATH = Path(__file__).resolve().parent / "plant-matrix" / "plant-matrix.json"
+
+# Comma-separated attribute columns that can be filtered on
+CATEGORICAL_FIELDS = ("Sun", "MoistureLevel", "pH", "Composition", "PlantType")
+# Attribute columns describing the site rather than the plant
+SITE_FIELDS = ("Sun", "MoistureLevel", "pH", "Composition")
+RANGE_FIELDS = ("Height", "Spread")
+# Open-ended sizes ("8+") are read as up to this many times their last number, so a "5-8+" shrub
+# doesn't match a request for 30 ft trees
+OPEN_RANGE_FACTOR = 1.5
+# Filter values people use for a matrix value under another name
+VALUE_SYNONYMS = {
+    "part sun": "partial sun",
+    "part shade": "partial sun",
+    "partial shade": "partial sun",
+    "semi shade": "partial sun",
+    "well draining": "well drained",
+}
+
+
+#####################
+### VALUE PARSING ###
+#####################
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+def _fold_plural(word: str) -> str:
+    if len(word) > 4 and word.endswith(("sses", "shes", "ches", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
+
+
+# Attribute values and filter values alike: "Well-drained" -> "well drained", "Trees" -> "tree",
+# "Partial shade" -> "partial sun" (VALUE_SYNONYMS)
+def _normalize_value(text: str) -> str:
+    words = [_fold_plural(word) for word in _normalize(re.sub(r"[-_/]", " ", str(text))).split()]
+    value = " ".join(words)
+    return VALUE_SYNONYMS.get(value, value)
+
+
+def _split_tokens(raw_value) -> list[str]:
+    return [_normalize_value(part) for part in str(raw_value or "").split(",") if part.strip()]
+
+
+# "4-6" -> (4, 6), "8+" -> (8, 12), "5-8+" -> (5, 12), "6" -> (6, 6), "" -> (nan, nan)
+@lru_cache(maxsize=4096)
+def parse_range(raw_value: str) -> tuple[float, float]:
+    numbers = [float(n) for n in re.findall(r"\d+(?:\.\d+)?", raw_value)]
+    if not numbers:
+        return float("nan"), float("nan")
+    upper = max(numbers)
+    if raw_value.strip().endswith("+"):
+        upper *= OPEN_RANGE_FACTOR
+    return min(numbers), upper
+
+
+# Cached per distinct raw value: real matrices repeat the same few attribute strings
+@lru_cache(maxsize=4096)
+def _field_tokens(raw_value: str) -> tuple[str, ...]:
+    return tuple(dict.fromkeys(_split_tokens(raw_value)))
+
+
+@lru_cache(maxsize=4096)
+def _value_words(value: str) -> frozenset[str]:
+    return frozenset(re.findall(r"[a-z]+", value))
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {_normalize(text)} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+#######################
+### IN-MEMORY INDEX ###
+#######################
+
+
+# Loaded once per process. Attribute filters are precomputed boolean masks per (field, token)
+# and numeric ranges are NumPy arrays, so a query is a handful of vectorized ANDs no matter
+# how many rows the matrix has. A filter value matches every token containing all of its words
+# ("sun" -> "full sun" and "partial sun", "deciduous tree" -> "tree (deciduous)"); a field has
+# only a few distinct tokens, so that is a short loop. Name lookup goes through a trigram index
+# before fuzzy scoring.
+class PlantMatrixIndex:
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+        size = len(rows)
+
+        # field -> token -> mask of rows listing that token; "All ..." values match any query
+        self._token_masks: dict[str, dict[str, np.ndarray]] = {}
+        self._wildcard_masks: dict[str, np.ndarray] = {}
+        for field in CATEGORICAL_FIELDS:
+            token_rows: dict[str, list[int]] = {}
+            for row_id, row in enumerate(rows):
+                for token in _field_tokens(str(row.get(field) or "")):
+                    token_rows.setdefault(token, []).append(row_id)
+
+            token_masks: dict[str, np.ndarray] = {}
+            wildcard = np.zeros(size, dtype=bool)
+            for token, row_ids in token_rows.items():
+                if token.startswith("all"):
+                    wildcard[row_ids] = True
+                    continue
+                token_masks[token] = np.zeros(size, dtype=bool)
+                token_masks[token][row_ids] = True
+            self._token_masks[field] = token_masks
+            self._wildcard_masks[field] = wildcard
+
+        # field -> (lower bounds, upper bounds); unknown sizes are NaN and never match a range filter
+        self._ranges: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        for field in RANGE_FIELDS:
+            bounds = np.array(
+                [parse_range(str(row.get(field) or "")) for row in rows], dtype=float
+            ).reshape(size, 2)
+            self._ranges[field] = (bounds[:, 0], bounds[:, 1])
+
+        # trigram -> row ids, over common and scientific names
+        self._names = [
+            (_normalize(row.get("CommonName", "")), _normalize(row.get("ScientificName", "")))
+            for row in rows
+        ]
+        self._trigram_index: dict[str, list[int]] = {}
+        for row_id, names in enumerate(self._names):
+            for trigram in set().union(*(_trigrams(name) for name in names if name)):
+                self._trigram_index.setdefault(trigram, []).append(row_id)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @classmethod
+    def from_file(cls, path: Path) -> "PlantMatrixIndex":
+        if path.suffix.lower() == ".csv":
+            with path.open(newline="", encoding="utf-8") as handle:
+                rows = list(csv.DictReader(handle))
+        else:
+            rows = json.loads(path.read_text(encoding="utf-8"))
+        return cls(rows)
+
+    # Single words of the site attribute values ("full shade" -> "shade", "well drained" ->
+    # "drained"), without the generic ones that don't tell two sites apart
+    def site_condition_words(self) -> frozenset[str]:
+        words = set()
+        for field in SITE_FIELDS:
+            for token in self._token_masks[field]:
+                words.update(re.findall(r"[a-z]+", token))
+        return frozenset(words - {"all", "full", "soil", "well"})
+
+    def _field_mask(self, field: str, wanted: list[str]) -> np.ndarray:
+        mask = self._wildcard_masks[field].copy()
+        for value in wanted:
+            words = _value_words(_normalize_value(value))
+            if not words:
+                continue
+            for token, token_mask in self._token_masks[field].items():
+                if words <= _value_words(token):
+                    mask |= token_mask
+        return mask
+
+    def _range_mask(self, field: str, minimum: float | None, maximum: float | None) -> np.ndarray:
+        lower, upper = self._ranges[field]
+        # Keep rows whose documented range overlaps the requested one
+        with np.errstate(invalid="ignore"):
+            mask = ~np.isnan(lower)
+            if minimum is not None:
+                mask &= upper >= minimum
+            if maximum is not None:
+                mask &= lower <= maximum
+        return mask
+
+    def _name_scores(self, name: str, candidates: int = 50) -> dict[int, float]:
+        query = _normalize(name)
+        scores: dict[int, float] = {}
+
+        # Cheap candidate retrieval by shared trigrams, then exact scoring on the best few
+        overlap = Counter()
+        for trigram in _trigrams(query):
+            overlap.update(self._trigram_index.get(trigram, ()))
+        for row_id, _ in overlap.most_common(candidates):
+            best = 0.0
+            for candidate in self._names[row_id]:
+                if not candidate:
+                    continue
+                if query in candidate:
+                    best = 1.0
+                    break
+                best = max(best, difflib.SequenceMatcher(None, query, candidate).ratio())
+            scores[row_id] = best
+        return scores
+
+    def search(
+        self,
+        name: str | None = None,
+        filters: dict[str, list[str]] | None = None,
+        height_range: tuple[float | None, float | None] = (None, None),
+        spread_range: tuple[float | None, float | None] = (None, None),
+        limit: int = 15,
+        min_name_score: float = 0.6,
+    ) -> list[dict]:
+        mask = np.ones(len(self.rows), dtype=bool)
+        for field, wanted in (filters or {}).items():
+            if wanted:
+                mask &= self._field_mask(field, wanted)
+        if height_range != (None, None):
+            mask &= self._range_mask("Height", *height_range)
+        if spread_range != (None, None):
+            mask &= self._range_mask("Spread", *spread_range)
+
+        if name:
+            scores = self._name_scores(name)
+            ranked = sorted(
+                (row_id for row_id, score in scores.items() if score >= min_name_score and mask[row_id]),
+                key=lambda row_id: scores[row_id],
+                reverse=True,
+            )
+        else:
+            ranked = np.flatnonzero(mask).tolist()
+
+        return [self.rows[row_id] for row_id in ranked[: max(1, limit)]]
+
+
+_plant_matrix: PlantMatrixIndex | None = None
+_plant_matrix_lock = threading.Lock()
+
+
+def get_plant_matrix() -> PlantMatrixIndex:
+    global _plant_matrix
+    if _plant_matrix is None:
+        with _plant_matrix_lock:
+            if _plant_matrix is None:
+                path = Path(os.environ.get("ECOOPTIMA_PLANT_MATRIX", PLANT_MATRIX_PATH))
+                _plant_matrix = PlantMatrixIndex.from_file(path)
+    return _plant_matrix
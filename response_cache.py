@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from local_db import thread_connection
+from run_context import DATA_ROOT, ChartArtifact
+
+
+# Cache settings (seconds / bytes); ECOOPTIMA_RESPONSE_CACHE=0 turns the cache off
+CACHE_ENABLED = os.environ.get("ECOOPTIMA_RESPONSE_CACHE", "1") != "0"
+CACHE_PATH = Path(os.environ.get("ECOOPTIMA_RESPONSE_CACHE_PATH", DATA_ROOT / "response_cache.sqlite3"))
+CACHE_TTL = float(os.environ.get("ECOOPTIMA_RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+CACHE_MAX_BYTES = int(os.environ.get("ECOOPTIMA_RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+
+####################
+### KEY BUILDING ###
+####################
+
+
+# Case, spacing and trailing punctuation don't change the answer
+def normalize_input(user_input: str) -> str:
+    return re.sub(r"\s+", " ", user_input).strip().rstrip("?.!").strip().lower()
+
+
+def make_cache_key(
+    workflow_name: str,
+    user_input: str,
+    agent_model: str,
+    vector_store_ids: tuple[str, ...],
+    prompt_version: str,
+    chart_mode: str,
+) -> str:
+    material = json.dumps(
+        [
+            workflow_name,
+            normalize_input(user_input),
+            agent_model,
+            list(vector_store_ids),
+            prompt_version,
+            chart_mode,
+        ]
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+######################
+### RESPONSE CACHE ###
+######################
+
+
+@dataclass
+class CachedResponse:
+    text: str
+    charts: list[ChartArtifact]
+    macc_result: dict | None = None
+
+
+# Final text + chart manifest of full analyze runs, in one SQLite file on local disk so every
+# gunicorn worker shares it and it survives restarts. Entries expire after `ttl` seconds and
+# the least recently used ones are evicted once the stored payloads exceed `max_bytes`.
+class ResponseCache:
+    def __init__(self, path: Path, ttl: float = CACHE_TTL, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as db:
+            db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    workflow TEXT NOT NULL,
+                    normalized_input TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+                CREATE INDEX IF NOT EXISTS responses_workflow ON responses (workflow);
+                CREATE TABLE IF NOT EXISTS stats (
+                    name TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    seconds REAL NOT NULL DEFAULT 0
+                );
+                """
+            )
+
+    # One connection per thread (local_db.thread_connection)
+    def _connection(self) -> sqlite3.Connection:
+        return thread_connection(self._local, self.path)
+
+    def get(self, key: str) -> CachedResponse | None:
+        db = self._connection()
+        row = db.execute(
+            "SELECT payload, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        payload, created_at = json.loads(row[0]), row[1]
+        charts = [ChartArtifact.from_dict(chart) for chart in payload["charts"]]
+        # Expired, or an image it points at was cleaned up: drop it and recompute
+        if time.time() - created_at > self.ttl or any(
+            chart.path is not None and not chart.path.exists() for chart in charts
+        ):
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+
+        db.execute(
+            "UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?",
+            (time.time(), key),
+        )
+        return CachedResponse(payload["text"], charts, payload.get("macc_result"))
+
+    def put(
+        self,
+        key: str,
+        workflow_name: str,
+        user_input: str,
+        text: str,
+        charts: list[ChartArtifact],
+        macc_result: dict | None = None,
+    ) -> None:
+        payload = json.dumps(
+            {
+                "text": text,
+                "charts": [chart.to_dict() for chart in charts],
+                "macc_result": macc_result,
+            }
+        )
+        now = time.time()
+        db = self._connection()
+        db.execute(
+            """
+            INSERT OR REPLACE INTO responses
+                (key, workflow, normalized_input, payload, size, created_at, last_access, hits)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+            """,
+            (key, workflow_name, normalize_input(user_input), payload, len(payload), now, now),
+        )
+        self.evict()
+
+    def evict(self) -> int:
+        db = self._connection()
+        removed = db.execute(
+            "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+        ).rowcount
+
+        # Oldest-accessed first until the payloads fit the byte budget again
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            for key, size in db.execute(
+                "SELECT key, size FROM responses ORDER BY last_access"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+        return removed
+
+    # Whether any entry (for any model or prompt version) still holds this input
+    def has_input(self, workflow_name: str, normalized_input: str) -> bool:
+        return (
+            self._connection().execute(
+                "SELECT 1 FROM responses WHERE workflow = ? AND normalized_input = ? LIMIT 1",
+                (workflow_name, normalized_input),
+            ).fetchone()
+            is not None
+        )
+
+    # (rowid, workflow, normalized input) of entries stored after `rowid`, oldest first
+    def entries_since(self, rowid: int) -> list[tuple[int, str, str]]:
+        return self._connection().execute(
+            "SELECT rowid, workflow, normalized_input FROM responses WHERE rowid > ? ORDER BY rowid",
+            (rowid,),
+        ).fetchall()
+
+    # Drop one key, one workflow's entries, or (no arguments) everything
+    def invalidate(self, key: str | None = None, workflow_name: str | None = None) -> int:
+        db = self._connection()
+        if key is not None:
+            return db.execute("DELETE FROM responses WHERE key = ?", (key,)).rowcount
+        if workflow_name is not None:
+            return db.execute(
+                "DELETE FROM responses WHERE workflow = ?", (workflow_name,)
+            ).rowcount
+        return db.execute("DELETE FROM responses").rowcount
+
+    def record(self, outcome: str, seconds: float) -> None:
+        self._connection().execute(
+            """
+            INSERT INTO stats (name, count, seconds) VALUES (?, 1, ?)
+            ON CONFLICT(name) DO UPDATE SET count = count + 1, seconds = seconds + excluded.seconds
+            """,
+            (outcome, seconds),
+        )
+
+    def stats(self) -> dict:
+        db = self._connection()
+        counters = {
+            name: (count, seconds)
+            for name, count, seconds in db.execute("SELECT name, count, seconds FROM stats")
+        }
+        hits, hit_seconds = counters.get("hit", (0, 0.0))
+        misses, miss_seconds = counters.get("miss", (0, 0.0))
+        similar_hits, similar_seconds = counters.get("similar_hit", (0, 0.0))
+        similar_offers, _ = counters.get("similar_offer", (0, 0.0))
+        entries, size = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "avg_hit_ms": hit_seconds / hits * 1000 if hits else 0.0,
+            "avg_miss_ms": miss_seconds / misses * 1000 if misses else 0.0,
+            "similar_hits": similar_hits,
+            "similar_offers": similar_offers,
+            "avg_similar_hit_ms": similar_seconds / similar_hits * 1000 if similar_hits else 0.0,
+        }
+
+
+_response_cache: ResponseCache | None = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache | None:
+    global _response_cache
+    if not CACHE_ENABLED:
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(CACHE_PATH)
+    return _response_cache
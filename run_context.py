@@ -0,0 +1,154 @@
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Literal
+from uuid import uuid4
+
+
+# Root folder for per-run artifacts, served by app.response_log_file
+LOG_ROOT = Path("response_log")
+
+# Root folder for local state shared by every worker on the host (caches, stores)
+DATA_ROOT = Path(os.environ.get("ECOOPTIMA_DATA_DIR", "ecooptima_data"))
+
+# "image": charts are rendered to PNGs under LOG_ROOT
+# "data": charts are returned as series for the browser to draw (nothing is rendered or written)
+ChartMode = Literal["image", "data"]
+CHART_MODES = ("image", "data")
+
+
+def _chart_mode_from_env() -> ChartMode:
+    mode = os.environ.get("ECOOPTIMA_CHART_MODE", "image").strip().lower()
+    return mode if mode in CHART_MODES else "image"
+
+
+DEFAULT_CHART_MODE = _chart_mode_from_env()
+
+
+############################
+##### CHART MANIFEST #######
+############################
+
+
+# One chart produced by a tool during a run: a rendered image (path) or chart data (series)
+@dataclass
+class ChartArtifact:
+    title: str
+    metric_name: str
+    path: Path | None = None
+    series: list[dict] | None = None
+    orientation: str = "horizontal"
+
+    @property
+    def kind(self) -> ChartMode:
+        return "image" if self.path is not None else "data"
+
+    @property
+    def relative_path(self) -> str | None:
+        # Path under LOG_ROOT, as expected by the response_log_file route
+        return self.path.relative_to(LOG_ROOT).as_posix() if self.path else None
+
+    @classmethod
+    def from_dict(cls, chart: dict) -> "ChartArtifact":
+        return cls(
+            title=chart["title"],
+            metric_name=chart["metric_name"],
+            path=LOG_ROOT / chart["path"] if chart.get("path") else None,
+            series=chart.get("series"),
+            orientation=chart.get("orientation", "horizontal"),
+        )
+
+    def to_dict(self) -> dict:
+        chart = {
+            "kind": self.kind,
+            "title": self.title,
+            "metric_name": self.metric_name,
+            "orientation": self.orientation,
+        }
+        if self.path is not None:
+            chart["path"] = self.relative_path
+        else:
+            chart["series"] = self.series
+        return chart
+
+
+############################
+####### RUN CONTEXT ########
+############################
+
+
+# Timestamp prefix keeps run folders sortable; the random suffix keeps same-second runs apart
+def _new_run_id() -> str:
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid4().hex[:8]}"
+
+
+# Per-run state handed to Runner.run(context=...) and read by tools through RunContextWrapper.
+# Every run gets its own directory and manifest, so concurrent runs never share state.
+# events, when set, receives progress events (stage start/end, tool calls, text deltas, charts).
+@dataclass
+class RunContext:
+    workflow: str
+    run_id: str = field(default_factory=_new_run_id)
+    chart_mode: ChartMode = DEFAULT_CHART_MODE
+    charts: list[ChartArtifact] = field(default_factory=list)
+    events: Callable[[dict], None] | None = field(default=None, repr=False)
+    chart_count: int = field(default=0, repr=False)
+    # Structured MaccResult (model_dump) of Consumer/Academic runs, kept for follow-ups
+    macc_result: dict | None = None
+    # time.monotonic() by which the request must finish; every stage and retry stays inside it
+    deadline: float | None = None
+    # Timed spans of this run (metrics.timed): stages, model calls, tools, local steps
+    started: float = field(default_factory=time.perf_counter, repr=False)
+    timings: list[dict] = field(default_factory=list, repr=False)
+    # Browser session the run belongs to, and token usage per stage (usage.stage_usage)
+    session_id: str | None = None
+    usage: list[dict] = field(default_factory=list, repr=False)
+    # Target seconds for the whole run (model_routing); stages fall back to faster models when
+    # it is at risk. Model routing decisions of the run, in stage order (RouteDecision.to_dict)
+    latency_slo: float | None = None
+    routing: list[dict] = field(default_factory=list, repr=False)
+
+    @property
+    def run_dir(self) -> Path:
+        return LOG_ROOT / self.run_id
+
+    def emit(self, event_type: str, **data) -> None:
+        if self.events is not None:
+            self.events({"type": event_type, **data})
+
+    # Reserved before rendering so parallel tool calls in one run never pick the same file name
+    def new_chart_path(self, slug: str, suffix: str = ".png") -> Path:
+        self.chart_count += 1
+        return self.run_dir / f"{slug}-{self.chart_count}{suffix}"
+
+    def add_chart(self, chart: ChartArtifact) -> None:
+        self.charts.append(chart)
+        self.emit("chart_ready", chart=chart.to_dict())
+
+    def add_timing(self, kind: str, name: str, started: float, seconds: float) -> None:
+        self.timings.append(
+            {
+                "kind": kind,
+                "name": name,
+                "start_ms": round((started - self.started) * 1000, 1),
+                "ms": round(seconds * 1000, 1),
+            }
+        )
+
+    # Per-run breakdown for the run log: every span in start order, plus totals per kind/name.
+    # Spans nest (a guardrail stage inside the stage it guards, a tool inside its stage), so
+    # totals of different kinds overlap and don't add up to the wall time.
+    def timing_breakdown(self) -> dict:
+        totals: dict[str, dict[str, float]] = {}
+        for span in self.timings:
+            by_name = totals.setdefault(span["kind"], {})
+            by_name[span["name"]] = round(by_name.get(span["name"], 0.0) + span["ms"], 1)
+        return {
+            "run_id": self.run_id,
+            "workflow": self.workflow,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "totals_ms": totals,
+            "spans": sorted(self.timings, key=lambda span: span["start_ms"]),
+        }
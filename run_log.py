@@ -0,0 +1,523 @@
+import argparse
+import atexit
+import json
+import os
+import queue
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+from local_db import thread_connection
+from run_context import DATA_ROOT, LOG_ROOT
+
+
+# Run log: one row per analyze run or follow-up (input, output, chart manifest, token usage,
+# timing breakdown) in an append-only SQLite file shared by all workers, indexed by time,
+# workflow and session. Rows are queued and written in batches by a background thread, so the
+# event loop never waits on disk. Only rendered chart images stay as files, under
+# response_log/<run_id>/. Rows older than RUN_LOG_MAX_AGE, or the oldest ones beyond
+# RUN_LOG_MAX_BYTES, are deleted together with their chart folders, and the freed pages are
+# returned to the filesystem (incremental vacuum). chart_refs counts the records pointing at
+# each chart image, so the shared chart store (chart_store.py) never evicts a chart a logged
+# run still shows.
+RUN_LOG_ENABLED = os.environ.get("ECOOPTIMA_RUN_LOG", "1") != "0"
+RUN_LOG_PATH = Path(os.environ.get("ECOOPTIMA_RUN_LOG_PATH", DATA_ROOT / "run_log.sqlite3"))
+RUN_LOG_MAX_AGE = float(os.environ.get("ECOOPTIMA_RUN_LOG_MAX_AGE", 30 * 24 * 3600))
+RUN_LOG_MAX_BYTES = int(os.environ.get("ECOOPTIMA_RUN_LOG_MAX_BYTES", 512 * 1024 * 1024))
+# Background writer: rows per transaction, seconds a row may wait, seconds between retention
+RUN_LOG_BATCH_SIZE = 64
+RUN_LOG_FLUSH_INTERVAL = 0.5
+RUN_LOG_RETENTION_INTERVAL = 600
+
+
+@dataclass
+class RunRecord:
+    run_id: str
+    workflow: str
+    input: str
+    output: str = ""
+    # "analyze" or "followup"
+    kind: str = "analyze"
+    # ok, cached, blocked, timeout, error
+    status: str = "ok"
+    session_id: str | None = None
+    created_at: float = field(default_factory=time.time)
+    seconds: float = 0.0
+    error: str | None = None
+    charts: list[dict] = field(default_factory=list)
+    usage: list[dict] = field(default_factory=list)
+    timings: dict = field(default_factory=dict)
+    # Model routing decisions per stage (model_routing.RouteDecision), for tuning the policy
+    routing: list[dict] = field(default_factory=list)
+
+    def size(self) -> int:
+        return (
+            len(self.input)
+            + len(self.output)
+            + len(json.dumps(self.charts))
+            + len(json.dumps(self.usage))
+            + len(json.dumps(self.timings))
+            + len(json.dumps(self.routing))
+            + 256
+        )
+
+
+_COLUMNS = (
+    "run_id", "created_at", "workflow", "session_id", "kind", "status", "seconds", "input",
+    "output", "error", "charts", "usage", "timings", "routing", "size",
+)
+_JSON_COLUMNS = ("charts", "usage", "timings", "routing")
+
+
+class RunLogStore:
+    def __init__(
+        self,
+        path: Path = RUN_LOG_PATH,
+        max_age: float = RUN_LOG_MAX_AGE,
+        max_bytes: int = RUN_LOG_MAX_BYTES,
+    ):
+        self.path = Path(path)
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._queue: queue.Queue[RunRecord | None] = queue.Queue()
+        self._writer: threading.Thread | None = None
+        self._writer_lock = threading.Lock()
+        self._last_retention = 0.0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        db = self._connection()
+        db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                workflow TEXT NOT NULL,
+                session_id TEXT,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                input TEXT NOT NULL,
+                output TEXT NOT NULL,
+                error TEXT,
+                charts TEXT NOT NULL,
+                usage TEXT NOT NULL,
+                timings TEXT NOT NULL,
+                routing TEXT NOT NULL DEFAULT '[]',
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at);
+            CREATE INDEX IF NOT EXISTS runs_workflow ON runs (workflow, created_at);
+            CREATE INDEX IF NOT EXISTS runs_session ON runs (session_id, created_at);
+            CREATE TABLE IF NOT EXISTS chart_refs (
+                path TEXT NOT NULL,
+                run_id TEXT NOT NULL,
+                PRIMARY KEY (path, run_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS chart_refs_run ON chart_refs (run_id);
+            """
+        )
+        # Files written before routing decisions were logged
+        columns = {row[1] for row in db.execute("PRAGMA table_info(runs)")}
+        if "routing" not in columns:
+            try:
+                db.execute("ALTER TABLE runs ADD COLUMN routing TEXT NOT NULL DEFAULT '[]'")
+            except sqlite3.OperationalError:
+                pass  # another worker added it first
+
+    def _connection(self) -> sqlite3.Connection:
+        # Older files without incremental auto-vacuum are converted by compact()
+        return thread_connection(self._local, self.path, incremental_vacuum=True)
+
+    ###############
+    ### WRITING ###
+    ###############
+
+    # Non-blocking: the row is written by the background thread within RUN_LOG_FLUSH_INTERVAL
+    def append(self, record: RunRecord) -> None:
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(
+                        target=self._write_loop, name="ecooptima-run-log", daemon=True
+                    )
+                    self._writer.start()
+                    atexit.register(self.close)
+        self._queue.put(record)
+
+    def write(self, records: list[RunRecord], replace: bool = False) -> None:
+        rows = []
+        refs = []
+        for record in records:
+            refs.extend(
+                (chart["path"], record.run_id) for chart in record.charts if chart.get("path")
+            )
+            row = asdict(record)
+            for column in _JSON_COLUMNS:
+                row[column] = json.dumps(row[column])
+            row["size"] = record.size()
+            rows.append(tuple(row[column] for column in _COLUMNS))
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        db = self._connection()
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                f"{verb} INTO runs ({', '.join(_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                rows,
+            )
+            db.executemany("INSERT OR IGNORE INTO chart_refs (path, run_id) VALUES (?, ?)", refs)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _write_loop(self) -> None:
+        while True:
+            record = self._queue.get()
+            stop = record is None
+            batch = [] if stop else [record]
+            deadline = time.monotonic() + RUN_LOG_FLUSH_INTERVAL
+            while not stop and len(batch) < RUN_LOG_BATCH_SIZE:
+                try:
+                    record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                else:
+                    batch.append(record)
+
+            if batch:
+                try:
+                    self.write(batch)
+                except sqlite3.Error as e:
+                    print(f"[run_log] dropped {len(batch)} records: {e}", file=sys.stderr)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                return
+            if time.monotonic() - self._last_retention > RUN_LOG_RETENTION_INTERVAL:
+                self._last_retention = time.monotonic()
+                # A failed pass (locked by another worker, a chart folder that won't go) is
+                # retried next interval; it must not take the writer thread down with it
+                try:
+                    self.enforce_retention()
+                except (sqlite3.Error, OSError) as e:
+                    print(f"[run_log] retention failed: {e}", file=sys.stderr)
+
+    # Waits until everything appended so far is on disk
+    def flush(self) -> None:
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+
+    ###############
+    ### QUERIES ###
+    ###############
+
+    def _record(self, row: tuple) -> RunRecord:
+        values = dict(zip(_COLUMNS, row))
+        values.pop("size")
+        for column in _JSON_COLUMNS:
+            values[column] = json.loads(values[column])
+        return RunRecord(**values)
+
+    def get(self, run_id: str) -> RunRecord | None:
+        row = self._connection().execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM runs WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        return self._record(row) if row else None
+
+    # Newest first; each filter maps onto one of the indexes
+    def query(
+        self,
+        since: float | None = None,
+        until: float | None = None,
+        workflow: str | None = None,
+        session_id: str | None = None,
+        status: str | None = None,
+        limit: int = 100,
+    ) -> list[RunRecord]:
+        clauses, params = [], []
+        for clause, value in (
+            ("created_at >= ?", since),
+            ("created_at < ?", until),
+            ("workflow = ?", workflow),
+            ("session_id = ?", session_id),
+            ("status = ?", status),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        rows = self._connection().execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM runs {where} ORDER BY created_at DESC LIMIT ?",
+            params + [limit],
+        ).fetchall()
+        return [self._record(row) for row in rows]
+
+    # Number of run records pointing at each chart path (paths relative to LOG_ROOT)
+    def chart_refcounts(self, paths: list[str]) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        db = self._connection()
+        for start in range(0, len(paths), 500):
+            chunk = paths[start : start + 500]
+            counts.update(
+                db.execute(
+                    f"SELECT path, COUNT(*) FROM chart_refs "
+                    f"WHERE path IN ({', '.join('?' for _ in chunk)}) GROUP BY path",
+                    chunk,
+                ).fetchall()
+            )
+        return counts
+
+    def stats(self) -> dict:
+        count, size, oldest = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(created_at) FROM runs"
+        ).fetchone()
+        return {
+            "runs": count,
+            "bytes": size,
+            "oldest": oldest,
+            "queued": self._queue.qsize(),
+            "max_age": self.max_age,
+            "max_bytes": self.max_bytes,
+        }
+
+    #################
+    ### RETENTION ###
+    #################
+
+    # Deletes runs past max_age, then the oldest until the rows fit max_bytes, along with their
+    # chart folders, and hands the freed pages back to the filesystem
+    def enforce_retention(self) -> int:
+        db = self._connection()
+        expired = [
+            run_id
+            for (run_id,) in db.execute(
+                "SELECT run_id FROM runs WHERE created_at < ?", (time.time() - self.max_age,)
+            )
+        ]
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM runs").fetchone()[0]
+        if total > self.max_bytes:
+            for run_id, size in db.execute(
+                "SELECT run_id, size FROM runs WHERE created_at >= ? ORDER BY created_at",
+                (time.time() - self.max_age,),
+            ):
+                if total <= self.max_bytes:
+                    break
+                expired.append(run_id)
+                total -= size
+        return self.delete(expired)
+
+    def delete(self, run_ids: list[str]) -> int:
+        if not run_ids:
+            return 0
+        db = self._connection()
+        for start in range(0, len(run_ids), 500):
+            chunk = run_ids[start : start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            db.execute(f"DELETE FROM runs WHERE run_id IN ({placeholders})", chunk)
+            db.execute(f"DELETE FROM chart_refs WHERE run_id IN ({placeholders})", chunk)
+        for run_id in run_ids:
+            shutil.rmtree(LOG_ROOT / run_id, ignore_errors=True)
+        # Through executescript: execute() steps a pragma once, which frees a single page
+        db.executescript("PRAGMA incremental_vacuum;")
+        return len(run_ids)
+
+    # Full rewrite of the file (blocks writers while it runs; use from the CLI). Also switches
+    # files created without incremental auto-vacuum over to it.
+    def compact(self) -> None:
+        db = self._connection()
+        db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        db.execute("VACUUM")
+
+
+_run_log: RunLogStore | None = None
+_run_log_lock = threading.Lock()
+
+
+def get_run_log() -> RunLogStore | None:
+    global _run_log
+    if not RUN_LOG_ENABLED:
+        return None
+    if _run_log is None:
+        with _run_log_lock:
+            if _run_log is None:
+                _run_log = RunLogStore(RUN_LOG_PATH)
+    return _run_log
+
+
+#################
+### MIGRATION ###
+#################
+
+
+def _created_at(run_dir: Path) -> float:
+    try:
+        return datetime.strptime(run_dir.name[:15], "%Y%m%d-%H%M%S").timestamp()
+    except ValueError:
+        return run_dir.stat().st_mtime
+
+
+def _read_json(path: Path, default):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return default
+
+
+# One record per legacy response_log/<run>/ folder with an input.txt. Old second-resolution
+# folders may hold several runs that collided; those come out as one record with the last
+# input/output written and every chart in the folder. Chart images stay where they are.
+def migrate_record(run_dir: Path) -> RunRecord | None:
+    input_path = run_dir / "input.txt"
+    if not input_path.is_file():
+        return None
+    output_path = run_dir / "output.txt"
+    timings = _read_json(run_dir / "timings.json", {})
+    usage = _read_json(run_dir / "usage.json", {}).get("stages", [])
+    charts = [
+        {
+            "kind": "image",
+            "title": chart.stem,
+            "metric_name": "",
+            "orientation": "horizontal",
+            "path": chart.relative_to(LOG_ROOT).as_posix(),
+        }
+        for chart in sorted(run_dir.glob("*.png"))
+    ]
+    return RunRecord(
+        run_id=run_dir.name,
+        workflow=timings.get("workflow", "unknown"),
+        input=input_path.read_text(encoding="utf-8", errors="replace"),
+        output=(
+            output_path.read_text(encoding="utf-8", errors="replace")
+            if output_path.is_file()
+            else ""
+        ),
+        status="ok" if output_path.is_file() else "error",
+        created_at=_created_at(run_dir),
+        seconds=timings.get("total_ms", 0.0) / 1000,
+        charts=charts,
+        usage=usage,
+        timings=timings,
+    )
+
+
+def migrate(store: RunLogStore, root: Path = LOG_ROOT, remove_text: bool = False) -> int:
+    migrated = 0
+    batch: list[RunRecord] = []
+    for run_dir in sorted(path for path in root.iterdir() if path.is_dir()):
+        record = migrate_record(run_dir)
+        if record is None:
+            continue
+        batch.append(record)
+        if len(batch) >= 500:
+            store.write(batch)
+            migrated += len(batch)
+            batch = []
+    if batch:
+        store.write(batch)
+        migrated += len(batch)
+
+    if remove_text:
+        for run_dir in root.iterdir():
+            if not run_dir.is_dir() or store.get(run_dir.name) is None:
+                continue
+            for name in ("input.txt", "output.txt", "usage.json", "timings.json"):
+                (run_dir / name).unlink(missing_ok=True)
+            if not any(run_dir.iterdir()):
+                run_dir.rmdir()
+    return migrated
+
+
+# Routing decisions of the given records per (stage, model): how often each model ran, how
+# often as a fallback, its outcomes and observed stage seconds. Input for tuning the policy.
+def routing_summary(records: list[RunRecord]) -> list[dict]:
+    groups: dict[tuple[str, str], dict] = {}
+    for record in records:
+        for decision in record.routing:
+            group = groups.setdefault(
+                (decision["stage"], decision["model"]),
+                {
+                    "stage": decision["stage"],
+                    "model": decision["model"],
+                    "runs": 0,
+                    "fallbacks": 0,
+                    "status": {},
+                    "seconds": [],
+                },
+            )
+            group["runs"] += 1
+            group["fallbacks"] += bool(decision["fallback"])
+            status = decision.get("status") or "unknown"
+            group["status"][status] = group["status"].get(status, 0) + 1
+            if decision.get("seconds") is not None:
+                group["seconds"].append(decision["seconds"])
+
+    summary = []
+    for key in sorted(groups):
+        group = groups[key]
+        seconds = sorted(group.pop("seconds"))
+        for name, q in (("p50_s", 0.5), ("p95_s", 0.95)):
+            group[name] = seconds[min(len(seconds) - 1, int(q * len(seconds)))] if seconds else None
+        summary.append(group)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run log maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="import legacy response_log folders")
+    migrate_parser.add_argument("root", type=Path, nargs="?", default=LOG_ROOT)
+    migrate_parser.add_argument(
+        "--remove-text",
+        action="store_true",
+        help="delete the migrated text files (chart images are kept)",
+    )
+    commands.add_parser("retention", help="apply age/size retention now")
+    commands.add_parser("compact", help="VACUUM the run log file")
+    query_parser = commands.add_parser("query", help="print recent runs as JSON lines")
+    query_parser.add_argument("--workflow")
+    query_parser.add_argument("--session")
+    query_parser.add_argument("--since-hours", type=float)
+    query_parser.add_argument("--limit", type=int, default=20)
+    routing_parser = commands.add_parser("routing", help="summarize model routing decisions")
+    routing_parser.add_argument("--workflow")
+    routing_parser.add_argument("--since-hours", type=float, default=24)
+    routing_parser.add_argument("--limit", type=int, default=10000)
+    args = parser.parse_args()
+
+    store = RunLogStore(RUN_LOG_PATH)
+    if args.command == "migrate":
+        print(f"migrated {migrate(store, args.root, args.remove_text)} runs from {args.root}")
+    elif args.command == "retention":
+        print(f"deleted {store.enforce_retention()} runs")
+    elif args.command == "compact":
+        before = store.path.stat().st_size
+        store.compact()
+        print(f"{before / 2**20:.1f} MB -> {store.path.stat().st_size / 2**20:.1f} MB")
+    elif args.command == "routing":
+        since = time.time() - args.since_hours * 3600
+        records = store.query(since, None, args.workflow, limit=args.limit)
+        for group in routing_summary(records):
+            print(json.dumps(group))
+    else:
+        since = time.time() - args.since_hours * 3600 if args.since_hours else None
+        for record in store.query(since, None, args.workflow, args.session, limit=args.limit):
+            print(json.dumps(asdict(record)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import json
+import re
+
+from macc import compute_macc_curve, rediscount_present_costs
+
+
+# Local what-if scenarios over the last Consumer/Academic MaccResult. A follow-up that changes
+# discount_rate_real, time_horizon_years or household_archetype is answered here instead of by
+# a full two-agent re-run: present costs are re-discounted, abatement is cut to the horizon,
+# options the household can't take are filtered out, and cost per tCO2e, curve order and
+# cumulative abatement are recomputed with macc.compute_macc_curve. The agents' per-option
+# estimates are kept as they are.
+
+HOUSEHOLD_ARCHETYPES = ("SFH_owner", "apartment_renter", "mixed")
+ARCHETYPE_LABELS = {
+    "SFH_owner": "single-family homeowner",
+    "apartment_renter": "apartment renter",
+    "mixed": "mixed household",
+}
+# Options listed in the scenario answer, cheapest per tCO2e first
+SUMMARY_OPTIONS = 5
+
+# Only a follow-up that asks for different assumptions is a scenario; "why is the discount rate
+# 3%?" or "which options work for renters?" are questions for the conversational agent
+_CHANGE = re.compile(
+    r"\bwhat if\b|\bassum(?:e|ing)\b|\bsuppos(?:e|ing)\b|\binstead of\b"
+    r"|\bus(?:e|ing)\s+(?:an?\s|the\s|\d)|\b(?:go back|revert|reset)\b"
+    r"|\b(?:change|changing|switch|switching|set|setting)\b.*\bto\b",
+    re.IGNORECASE,
+)
+# "discount rate of 7%", "discount rate to 0.05", "a 7% discount rate"
+_RATE = re.compile(
+    r"discount(?:ing)?\s+rate\s*(?:of|to|at|=|:|is|was|were|be|becomes)?\s*(?:only\s+)?"
+    r"(\d+(?:\.\d+)?)\s*(%|percent)?"
+    r"|(\d+(?:\.\d+)?)\s*(%|percent)\s+(?:real\s+)?discount(?:ing)?\s+rate",
+    re.IGNORECASE,
+)
+_HORIZON = re.compile(
+    r"(\d{1,3})\s*-?\s*(?:years?|yrs?)\s+(?:time\s+)?horizon"
+    r"|horizon\s*(?:of|to|=|:|is|was|were|be)?\s*(\d{1,3})",
+    re.IGNORECASE,
+)
+_RENTER = re.compile(r"\brent(?:er|ers|ing)\b|\btenants?\b", re.IGNORECASE)
+_OWNER = re.compile(
+    r"\bhome\s?owners?\b|\bown (?:my|our|the) (?:home|house)\b|\bsingle[- ]family\b",
+    re.IGNORECASE,
+)
+_MIXED = re.compile(r"\b(?:mixed|all|any) households?\b", re.IGNORECASE)
+# "not a renter", "we don't rent", "isn't a homeowner"
+_NEGATION = re.compile(r"\b(?:not|no|never)\s+(?:an?\s+)?$|n't\s+(?:an?\s+)?$", re.IGNORECASE)
+_BASELINE = re.compile(
+    r"\b(?:original|baseline|default|initial) (?:assumptions|scenario)\b", re.IGNORECASE
+)
+
+
+###############
+### PARSING ###
+###############
+
+
+def _affirmed(pattern: re.Pattern, text: str) -> bool:
+    return any(
+        not _NEGATION.search(text[max(0, match.start() - 12) : match.start()])
+        for match in pattern.finditer(text)
+    )
+
+
+# Scenario changes a follow-up asks for, e.g. "what if the discount rate were 7%?" ->
+# {"discount_rate_real": 0.07}. {"baseline": True} asks for the original assumptions again.
+# Empty unless the follow-up explicitly asks to change an assumption ("what if", "assume",
+# "use", "switch to", "instead of"), so everything else goes to the conversational agent.
+def parse_scenario(user_input: str, workflow: str) -> dict:
+    changes: dict = {}
+    if not _CHANGE.search(user_input):
+        return changes
+    if _BASELINE.search(user_input):
+        return {"baseline": True}
+
+    match = _RATE.search(user_input)
+    if match:
+        value, unit = (match.group(1), match.group(2)) if match.group(1) else match.group(3, 4)
+        rate = float(value)
+        # "7%", "7 percent" and "7" are all 7%; "0.07" already is a fraction
+        if unit or rate >= 1:
+            rate /= 100
+        if 0 <= rate < 1:
+            changes["discount_rate_real"] = rate
+
+    match = _HORIZON.search(user_input)
+    if match:
+        years = int(match.group(1) or match.group(2))
+        if 1 <= years <= 100:
+            changes["time_horizon_years"] = years
+
+    # Renter/owner feasibility only exists on consumer options. Negated mentions don't count
+    # ("I'm not a renter, I own my home" is an owner), and naming both is left to the agent.
+    if workflow == "consumer":
+        renter = _affirmed(_RENTER, user_input)
+        owner = _affirmed(_OWNER, user_input)
+        if renter != owner:
+            changes["household_archetype"] = "apartment_renter" if renter else "SFH_owner"
+        elif not renter and _affirmed(_MIXED, user_input):
+            changes["household_archetype"] = "mixed"
+    return changes
+
+
+# Explicit parameters (form fields / API), checked and typed; unknown or invalid ones dropped
+def scenario_from_fields(fields: dict) -> dict:
+    changes: dict = {}
+    try:
+        if fields.get("discount_rate_real") not in (None, ""):
+            rate = float(fields["discount_rate_real"])
+            if 0 <= rate < 1:
+                changes["discount_rate_real"] = rate
+        if fields.get("time_horizon_years") not in (None, ""):
+            years = int(fields["time_horizon_years"])
+            if 1 <= years <= 100:
+                changes["time_horizon_years"] = years
+    except ValueError:
+        pass
+    if fields.get("household_archetype") in HOUSEHOLD_ARCHETYPES:
+        changes["household_archetype"] = fields["household_archetype"]
+    return changes
+
+
+###################
+### RECOMPUTING ###
+###################
+
+
+def _is_consumer(macc_result: dict) -> bool:
+    options = macc_result.get("options") or []
+    return bool(options) and "net_present_cost_usd" in options[0]
+
+
+def _feasible(option: dict, archetype: str) -> bool:
+    if archetype == "apartment_renter":
+        return option.get("renter_feasible") is not False
+    if archetype == "SFH_owner":
+        return option.get("homeowner_feasible") is not False
+    return True
+
+
+# New MaccResult dict (same shape as the stored one, plus a "scenario" block) for the base
+# result under `parameters`. The base dict is never modified.
+def apply_scenario(base: dict, parameters: dict) -> dict:
+    result = json.loads(json.dumps(base))
+    assumptions = result["assumptions"]
+    consumer = _is_consumer(result)
+    old_rate = float(base["assumptions"].get("discount_rate_real", 0.04))
+    new_rate = float(parameters.get("discount_rate_real", old_rate))
+    horizon = parameters.get("time_horizon_years")
+    archetype = parameters.get("household_archetype", assumptions.get("household_archetype"))
+
+    options = result["options"]
+    excluded = []
+    if consumer and archetype:
+        excluded = [option["option_id"] for option in options if not _feasible(option, archetype)]
+        options = [option for option in options if _feasible(option, archetype)]
+
+    cost_field = "net_present_cost_usd" if consumer else "cost_usd"
+    abatement_field = "lifetime_abatement_tCO2e" if consumer else "total_effective_abatement_tCO2e"
+    lifetimes = [option["lifetime_years"] for option in options]
+    years = [min(lifetime, horizon) if horizon else lifetime for lifetime in lifetimes]
+    costs = rediscount_present_costs(
+        [option[cost_field] for option in options], lifetimes, old_rate, new_rate, years
+    )
+    if consumer:
+        abatement = [
+            option["annual_abatement_tCO2e"] * counted for option, counted in zip(options, years)
+        ]
+    else:
+        # Lifetime totals are spread evenly over the years; only those inside the horizon count
+        abatement = [
+            option[abatement_field] * counted / lifetime
+            for option, counted, lifetime in zip(options, years, lifetimes)
+        ]
+
+    curve = compute_macc_curve(costs, abatement)
+    for option, cost, tonnes, cost_per in zip(options, costs, abatement, curve.cost_per_tCO2e):
+        option[cost_field] = cost
+        option[abatement_field] = tonnes
+        option["cost_per_tCO2e_usd"] = cost_per
+
+    assumptions["discount_rate_real"] = new_rate
+    if horizon:
+        assumptions["time_horizon_years"] = horizon
+    if consumer and archetype:
+        assumptions["household_archetype"] = archetype
+    result["options"] = options
+    result["sorted_option_ids"] = [options[index]["option_id"] for index in curve.order]
+    result["cumulative_abatement_tCO2e"] = curve.cumulative_abatement
+    result["scenario"] = {
+        "parameters": dict(parameters),
+        "base_discount_rate_real": old_rate,
+        "excluded_option_ids": excluded,
+    }
+    return result
+
+
+#################
+### ANSWERING ###
+#################
+
+
+def describe_parameters(parameters: dict, base_assumptions: dict) -> str:
+    parts = []
+    if "discount_rate_real" in parameters:
+        base_rate = base_assumptions.get("discount_rate_real", 0.04)
+        parts.append(
+            f"{parameters['discount_rate_real']:.1%} real discount rate (was {base_rate:.1%})"
+        )
+    if "time_horizon_years" in parameters:
+        parts.append(f"{parameters['time_horizon_years']}-year horizon")
+    if "household_archetype" in parameters:
+        parts.append(ARCHETYPE_LABELS[parameters["household_archetype"]])
+    return ", ".join(parts) or "original assumptions"
+
+
+def scenario_title(parameters: dict) -> str:
+    parts = []
+    if "discount_rate_real" in parameters:
+        parts.append(f"{parameters['discount_rate_real']:.1%} discount rate")
+    if "time_horizon_years" in parameters:
+        parts.append(f"{parameters['time_horizon_years']}-year horizon")
+    if "household_archetype" in parameters:
+        parts.append(ARCHETYPE_LABELS[parameters["household_archetype"]])
+    return "Cost per tCO2e: " + (", ".join(parts) or "original assumptions")
+
+
+# Short plain-text answer: what changed, the cheapest options per tCO2e, totals
+def summarize_scenario(result: dict, base: dict) -> str:
+    scenario = result["scenario"]
+    options = {option["option_id"]: option for option in result["options"]}
+    cost_field = "net_present_cost_usd" if _is_consumer(result) else "cost_usd"
+    lines = [f"Scenario: {describe_parameters(scenario['parameters'], base['assumptions'])}."]
+    if scenario["excluded_option_ids"]:
+        lines.append(
+            f"Left out as not feasible for this household: "
+            f"{', '.join(scenario['excluded_option_ids'])}."
+        )
+
+    ranked = [
+        options[option_id]
+        for option_id in result["sorted_option_ids"]
+        if options[option_id]["cost_per_tCO2e_usd"] is not None
+    ]
+    if ranked:
+        lines.append("")
+        lines.append("Lowest cost per tCO2e:")
+        for rank, option in enumerate(ranked[:SUMMARY_OPTIONS], start=1):
+            lines.append(
+                f"{rank}. {option['description'] or option['option_id']}: "
+                f"${option['cost_per_tCO2e_usd']:,.0f}/tCO2e "
+                f"(present cost ${option[cost_field]:,.0f})"
+            )
+
+    total = result["cumulative_abatement_tCO2e"][-1] if result["cumulative_abatement_tCO2e"] else 0
+    savers = sum(1 for option in ranked if option["cost_per_tCO2e_usd"] < 0)
+    lines.append("")
+    lines.append(
+        f"Total abatement: {total:,.1f} tCO2e across {len(result['options'])} options "
+        f"({savers} with net lifetime savings)."
+    )
+    lines.append(
+        "Recomputed from the last analysis's per-option estimates. Ask for a new analysis if "
+        "the options themselves should change."
+    )
+    return "\n".join(lines)
+
+
+# Bars for the scenario chart: cost per tCO2e of every option that abates something, ordered
+# like plot_bar_chart's cleaned series so equal scenarios map to one stored chart
+def scenario_series(result: dict) -> list[tuple[str, float]]:
+    series = [
+        (option["option_id"], option["cost_per_tCO2e_usd"])
+        for option in result["options"]
+        if option["cost_per_tCO2e_usd"] is not None
+    ]
+    return sorted(series, key=lambda row: (-row[1], row[0]))
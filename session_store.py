@@ -0,0 +1,259 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from local_db import thread_connection
+from run_context import DATA_ROOT
+
+
+# ECOOPTIMA_SESSION_STORE picks the backend: "memory" (per worker) or "sqlite" (shared by every
+# worker on the host). Idle sessions expire after SESSION_TTL seconds in both.
+SESSION_BACKEND = os.environ.get("ECOOPTIMA_SESSION_STORE", "memory")
+SESSION_PATH = Path(os.environ.get("ECOOPTIMA_SESSION_PATH", DATA_ROOT / "sessions.sqlite3"))
+SESSION_TTL = float(os.environ.get("ECOOPTIMA_SESSION_TTL", 24 * 3600))
+SESSION_MAX_ENTRIES = int(os.environ.get("ECOOPTIMA_SESSION_MAX_ENTRIES", 10_000))
+SESSION_MAX_BYTES = int(os.environ.get("ECOOPTIMA_SESSION_MAX_BYTES", 64 * 1024 * 1024))
+# Chat turns kept per session (ecooptima.main trims to the same window)
+SESSION_HISTORY_TURNS = 12
+
+
+# A session is a plain dict:
+#   chat_history        last SESSION_HISTORY_TURNS {"role", "content"} messages
+#   turn_count          messages ever appended, so a store can tell which ones are new
+#   last_pipeline_output, workflow, ... small scalar fields
+def new_session_state() -> dict:
+    return {"chat_history": [], "last_pipeline_output": "", "turn_count": 0}
+
+
+def _state_size(state: dict) -> int:
+    history = sum(len(turn.get("content", "")) + 32 for turn in state.get("chat_history", []))
+    fields = sum(len(str(value)) for key, value in state.items() if key != "chat_history")
+    return history + fields + 256
+
+
+######################
+### MEMORY BACKEND ###
+######################
+
+
+# Per-process LRU with idle TTL and two caps: number of sessions and approximate bytes.
+# load() hands out a copy, so a run mutating its state never races the stored one.
+class MemorySessionStore:
+    def __init__(
+        self,
+        ttl: float = SESSION_TTL,
+        max_entries: int = SESSION_MAX_ENTRIES,
+        max_bytes: int = SESSION_MAX_BYTES,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # session id -> (state, size, last access)
+        self._sessions: OrderedDict[str, tuple[dict, int, float]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def load(self, session_id: str) -> dict:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or time.time() - entry[2] > self.ttl:
+                return new_session_state()
+            state = entry[0]
+        return {**state, "chat_history": list(state["chat_history"])}
+
+    def save(self, session_id: str, state: dict) -> None:
+        stored = {**state, "chat_history": list(state.get("chat_history", []))}
+        size = _state_size(stored)
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._sessions[session_id] = (stored, size, time.time())
+            self._bytes += size
+            self._evict()
+
+    def reset(self, session_id: str) -> None:
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+
+    # Expired sessions first (they sit at the cold end), then LRU until both caps hold
+    def _evict(self) -> None:
+        deadline = time.time() - self.ttl
+        while self._sessions:
+            _, (_, size, last_access) = next(iter(self._sessions.items()))
+            over_cap = len(self._sessions) > self.max_entries or self._bytes > self.max_bytes
+            if last_access >= deadline and not over_cap:
+                break
+            self._sessions.popitem(last=False)
+            self._bytes -= size
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+        }
+
+
+######################
+### SQLITE BACKEND ###
+######################
+
+
+# Shared by every worker on the host. Scalar fields live in one small JSON row per session and
+# are only rewritten when they change; chat turns are rows of their own, so a request appends
+# its two new messages and deletes the ones that fell out of the window instead of rewriting
+# the whole history.
+class SqliteSessionStore:
+    def __init__(self, path: Path = SESSION_PATH, ttl: float = SESSION_TTL):
+        self.path = Path(path)
+        self.ttl = ttl
+        self._local = threading.local()
+        self._saves = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                fields TEXT NOT NULL,
+                turn_count INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);
+            CREATE TABLE IF NOT EXISTS turns (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        return thread_connection(self._local, self.path)
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def load(self, session_id: str) -> dict:
+        db = self._connection()
+        row = db.execute(
+            "SELECT fields, turn_count, updated_at FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return new_session_state()
+
+        turns = db.execute(
+            "SELECT role, content FROM turns WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, SESSION_HISTORY_TURNS),
+        ).fetchall()
+        state = json.loads(row[0])
+        state["turn_count"] = row[1]
+        state["chat_history"] = [
+            {"role": role, "content": content} for role, content in reversed(turns)
+        ]
+        return state
+
+    def save(self, session_id: str, state: dict) -> None:
+        scalars = {
+            key: value
+            for key, value in state.items()
+            if key not in ("chat_history", "turn_count")
+        }
+        fields = json.dumps(scalars, sort_keys=True)
+        turn_count = state.get("turn_count", 0)
+        history = state.get("chat_history", [])
+        now = time.time()
+
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT fields, turn_count FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            stored_count = row[1] if row is not None else 0
+            if turn_count < stored_count:
+                # The session started over (expired, or reset by another worker): replace its turns
+                db.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+                stored_count = max(0, turn_count - len(history))
+            if row is None:
+                db.execute(
+                    "INSERT INTO sessions (id, fields, turn_count, updated_at) VALUES (?, ?, ?, ?)",
+                    (session_id, fields, turn_count, now),
+                )
+            elif row[0] != fields:
+                db.execute(
+                    "UPDATE sessions SET fields = ?, turn_count = ?, updated_at = ? WHERE id = ?",
+                    (fields, turn_count, now, session_id),
+                )
+            else:
+                db.execute(
+                    "UPDATE sessions SET turn_count = ?, updated_at = ? WHERE id = ?",
+                    (turn_count, now, session_id),
+                )
+
+            # Only the messages appended since the stored count are written
+            new_turns = history[stored_count - turn_count :] if turn_count > stored_count else []
+            first_seq = turn_count - len(new_turns)
+            db.executemany(
+                "INSERT OR REPLACE INTO turns (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [
+                    (session_id, first_seq + offset, turn["role"], turn["content"])
+                    for offset, turn in enumerate(new_turns)
+                ],
+            )
+            if new_turns:
+                db.execute(
+                    "DELETE FROM turns WHERE session_id = ? AND seq < ?",
+                    (session_id, turn_count - SESSION_HISTORY_TURNS),
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        self._saves += 1
+        if self._saves % 1000 == 0:
+            self.expire()
+
+    def reset(self, session_id: str) -> None:
+        db = self._connection()
+        db.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+        db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def expire(self) -> int:
+        db = self._connection()
+        deadline = time.time() - self.ttl
+        db.execute(
+            "DELETE FROM turns WHERE session_id IN (SELECT id FROM sessions WHERE updated_at < ?)",
+            (deadline,),
+        )
+        return db.execute("DELETE FROM sessions WHERE updated_at < ?", (deadline,)).rowcount
+
+    def stats(self) -> dict:
+        db = self._connection()
+        return {
+            "backend": "sqlite",
+            "sessions": db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0],
+            "turns": db.execute("SELECT COUNT(*) FROM turns").fetchone()[0],
+        }
+
+
+def create_session_store(backend: str = SESSION_BACKEND):
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SqliteSessionStore()
+    raise ValueError(f"Unsupported session store '{backend}'")
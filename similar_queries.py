@@ -0,0 +1,329 @@
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+
+from plant_matrix import get_plant_matrix
+from response_cache import ResponseCache
+
+
+# Similarity settings. Scores are TF-IDF cosine in [0, 1]; at or above SIMILAR_OFFER_THRESHOLD
+# a past answer is offered (sent to the client while the fresh run goes ahead). It is only served
+# instead of running the workflow when it asks the same thing (SimilarQuery.same_ask): a high
+# score alone still lets one added qualifier ("native", "in Arizona", "without a budget") through.
+# ECOOPTIMA_SIMILAR_CACHE=0 turns the layer off.
+SIMILAR_ENABLED = os.environ.get("ECOOPTIMA_SIMILAR_CACHE", "1") != "0"
+SIMILAR_OFFER_THRESHOLD = float(os.environ.get("ECOOPTIMA_SIMILAR_OFFER_THRESHOLD", 0.6))
+# How often (seconds) to pull entries other workers added to the shared response cache
+SIMILAR_SYNC_INTERVAL = float(os.environ.get("ECOOPTIMA_SIMILAR_SYNC_INTERVAL", 5))
+
+# MinHash signature length and LSH banding (NUM_BANDS * BAND_ROWS == NUM_PERMUTATIONS). Narrow
+# bands let short queries that share only about half their tokens still meet as candidates.
+NUM_PERMUTATIONS = 64
+BAND_ROWS = 2
+NUM_BANDS = NUM_PERMUTATIONS // BAND_ROWS
+# Candidates scored exactly per lookup, best LSH band agreement first
+MAX_CANDIDATES = 32
+# Buckets this full only say "shares a very common word" and are skipped at lookup
+MAX_BUCKET_SIZE = 256
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.default_rng(20240611)
+_PERM_A = _rng.integers(1, 1 << 31, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 31, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+STOPWORDS = frozenset(
+    """
+    a an and are as at be by can could do does for from have how i if in is it its me my of on
+    or our should so that the their them there these this to us was we what when where which
+    who will with would you your want need some any about into like best good
+    """.split()
+)
+# Words (after plural folding) that phrase the ask without changing it: "plants for a park" and
+# "what should I use for a park" want the same answer. Every other word is content.
+FILLER_WORDS = frozenset(
+    """
+    plant use using dollar usd budget recommend recommendation suggest suggestion choose pick
+    option idea kind type list please tell give show help
+    """.split()
+)
+
+
+######################
+### QUERY FEATURES ###
+######################
+
+
+# "$5,000" -> 5000, "5k" -> 5000, "1.5m" -> 1500000
+_NUMBER = re.compile(r"\$?\s*(\d+(?:[.,]\d+)*)\s*(k|m|thousand|million)?\b")
+_MULTIPLIERS = {"k": 1e3, "thousand": 1e3, "m": 1e6, "million": 1e6}
+
+
+def _number_tokens(text: str) -> tuple[str, list[str]]:
+    numbers: list[str] = []
+
+    def replace(match: re.Match) -> str:
+        digits = match.group(1).replace(",", "")
+        try:
+            value = float(digits) * _MULTIPLIERS.get(match.group(2) or "", 1)
+        except ValueError:
+            return " "
+        numbers.append(f"#{value:g}")
+        return " "
+
+    return _NUMBER.sub(replace, text), numbers
+
+
+# Everyday words for the site conditions of the plant matrix (sun, moisture, pH, soil), mapped
+# to its own vocabulary; "alkaline" has no matrix value but is just as decisive
+SITE_SYNONYMS = {
+    "sunny": "sun",
+    "shady": "shade",
+    "shaded": "shade",
+    "damp": "moist",
+    "soggy": "wet",
+    "boggy": "wet",
+    "swampy": "wet",
+    "waterlogged": "wet",
+    "arid": "dry",
+    "drought": "dry",
+    "acid": "acidic",
+    "alkaline": "alkaline",
+    "loam": "loamy",
+    "sand": "sandy",
+    "rock": "rocky",
+    "stony": "rocky",
+    "gravelly": "rocky",
+    "clayey": "clay",
+    "drainage": "drained",
+}
+
+_site_words: frozenset[str] | None = None
+
+
+def _site_condition(word: str) -> str | None:
+    global _site_words
+    if _site_words is None:
+        _site_words = get_plant_matrix().site_condition_words()
+    if word in SITE_SYNONYMS:
+        return SITE_SYNONYMS[word]
+    return word if word in _site_words else None
+
+
+# Crude plural folding so "plants"/"plant" and "trees"/"tree" share a token
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+@dataclass(frozen=True)
+class QueryFeatures:
+    words: frozenset[str]
+    # Amounts ("#5000") must match exactly: a $5k and a $50k budget are different questions
+    numbers: frozenset[str]
+    # So must site conditions: a shady and a sunny park need different plants
+    conditions: frozenset[str] = frozenset()
+
+    @property
+    def tokens(self) -> frozenset[str]:
+        return self.words | self.numbers
+
+    @property
+    def content(self) -> frozenset[str]:
+        return self.words - FILLER_WORDS
+
+
+def query_features(text: str) -> QueryFeatures:
+    text, numbers = _number_tokens(text.lower())
+    words = {
+        _stem(word)
+        for word in re.findall(r"[a-z]+", text)
+        if word not in STOPWORDS and len(word) > 1
+    }
+    conditions = {_site_condition(word) for word in words} - {None}
+    return QueryFeatures(
+        words=frozenset(words), numbers=frozenset(numbers), conditions=frozenset(conditions)
+    )
+
+
+def minhash_signature(tokens: frozenset[str]) -> np.ndarray:
+    if not tokens:
+        return np.full(NUM_PERMUTATIONS, _MERSENNE_PRIME, dtype=np.uint64)
+    hashes = np.fromiter(
+        (zlib.crc32(token.encode("utf-8")) for token in tokens), dtype=np.uint64, count=len(tokens)
+    )
+    # (a * x + b) mod p per permutation; a < 2**31 and x < 2**32, so nothing overflows uint64
+    permuted = (_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+
+def _band_keys(signature: np.ndarray) -> list[bytes]:
+    raw = signature.tobytes()
+    width = BAND_ROWS * signature.itemsize
+    return [bytes((band,)) + raw[band * width : (band + 1) * width] for band in range(NUM_BANDS)]
+
+
+###################
+### QUERY INDEX ###
+###################
+
+
+@dataclass
+class SimilarQuery:
+    input: str
+    score: float
+    # Neither query has a content word the other lacks, so the stored answer may be served
+    same_ask: bool = False
+
+
+# Past analyze inputs per workflow, kept in memory. MinHash LSH buckets narrow a lookup down to
+# a few candidates in constant time, which are then ranked by TF-IDF cosine over their tokens.
+# Entries are added one at a time as runs are cached; document frequencies update with them.
+class QueryIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # workflow -> band key -> entry ids
+        self._buckets: dict[str, dict[bytes, list[int]]] = {}
+        self._entries: list[tuple[str, str, QueryFeatures] | None] = []
+        self._by_input: dict[tuple[str, str], int] = {}
+        self._document_frequency: Counter = Counter()
+
+    def __len__(self) -> int:
+        return len(self._by_input)
+
+    def add(self, workflow_name: str, user_input: str) -> None:
+        features = query_features(user_input)
+        if not features.words:
+            return
+        key = (workflow_name, user_input)
+        signature = minhash_signature(features.tokens)
+        with self._lock:
+            if key in self._by_input:
+                return
+            entry_id = len(self._entries)
+            self._entries.append((workflow_name, user_input, features))
+            self._by_input[key] = entry_id
+            self._document_frequency.update(features.tokens)
+            buckets = self._buckets.setdefault(workflow_name, {})
+            for band_key in _band_keys(signature):
+                buckets.setdefault(band_key, []).append(entry_id)
+
+    def remove(self, workflow_name: str, user_input: str) -> None:
+        with self._lock:
+            entry_id = self._by_input.pop((workflow_name, user_input), None)
+            if entry_id is None:
+                return
+            _, _, features = self._entries[entry_id]
+            self._entries[entry_id] = None
+            self._document_frequency.subtract(features.tokens)
+
+    def _idf(self, token: str) -> float:
+        return math.log((1 + len(self._by_input)) / (1 + self._document_frequency[token])) + 1
+
+    # Binary-TF cosine; `weights` memoizes squared IDFs across the candidates of one lookup
+    def _cosine(self, left: frozenset[str], right: frozenset[str], weights: dict[str, float]) -> float:
+        for token in left | right:
+            if token not in weights:
+                weights[token] = self._idf(token) ** 2
+        shared = sum(weights[token] for token in left & right)
+        if not shared:
+            return 0.0
+        left_norm = math.sqrt(sum(weights[token] for token in left))
+        right_norm = math.sqrt(sum(weights[token] for token in right))
+        return shared / (left_norm * right_norm)
+
+    def lookup(
+        self, workflow_name: str, user_input: str, threshold: float, limit: int = 3
+    ) -> list[SimilarQuery]:
+        features = query_features(user_input)
+        if not features.words:
+            return []
+        band_keys = _band_keys(minhash_signature(features.tokens))
+
+        with self._lock:
+            buckets = self._buckets.get(workflow_name, {})
+            votes: Counter = Counter()
+            for band_key in band_keys:
+                bucket = buckets.get(band_key, ())
+                if len(bucket) <= MAX_BUCKET_SIZE:
+                    votes.update(bucket)
+
+            matches: list[SimilarQuery] = []
+            weights: dict[str, float] = {}
+            for entry_id, _ in votes.most_common(MAX_CANDIDATES):
+                entry = self._entries[entry_id]
+                if entry is None:
+                    continue
+                # Both must match exactly; the cosine only ranks rewordings of the same ask
+                stored = entry[2]
+                if stored.numbers != features.numbers or stored.conditions != features.conditions:
+                    continue
+                # The same ask is a match however much the filler words pull the score down
+                score = self._cosine(features.tokens, stored.tokens, weights)
+                same_ask = stored.content == features.content
+                if score >= threshold or same_ask:
+                    matches.append(
+                        SimilarQuery(input=entry[1], score=round(score, 4), same_ask=same_ask)
+                    )
+
+        # Servable matches first, each group by score
+        matches.sort(key=lambda match: (match.same_ask, match.score), reverse=True)
+        return matches[:limit]
+
+
+# Index over the inputs stored in the shared response cache. Each worker builds it once from the
+# cache and then only reads rows added since its last sync, so runs cached by other workers
+# become matchable within SIMILAR_SYNC_INTERVAL seconds.
+class SimilarQueryCache:
+    def __init__(self, cache: ResponseCache, sync_interval: float = SIMILAR_SYNC_INTERVAL):
+        self.cache = cache
+        self.index = QueryIndex()
+        self.sync_interval = sync_interval
+        self._last_rowid = 0
+        self._last_sync = 0.0
+        self._sync_lock = threading.Lock()
+        self.sync(force=True)
+
+    def sync(self, force: bool = False) -> None:
+        if not force and time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        if not self._sync_lock.acquire(blocking=force):
+            return
+        try:
+            for rowid, workflow_name, normalized_input in self.cache.entries_since(self._last_rowid):
+                self.index.add(workflow_name, normalized_input)
+                self._last_rowid = max(self._last_rowid, rowid)
+            self._last_sync = time.monotonic()
+        finally:
+            self._sync_lock.release()
+
+    def add(self, workflow_name: str, normalized_input: str) -> None:
+        self.index.add(workflow_name, normalized_input)
+
+    def lookup(self, workflow_name: str, user_input: str, threshold: float) -> list[SimilarQuery]:
+        self.sync()
+        return self.index.lookup(workflow_name, user_input, threshold)
+
+
+_similar_cache: SimilarQueryCache | None = None
+_similar_cache_lock = threading.Lock()
+
+
+def get_similar_cache(cache: ResponseCache | None) -> SimilarQueryCache | None:
+    global _similar_cache
+    if not SIMILAR_ENABLED or cache is None:
+        return None
+    if _similar_cache is None:
+        with _similar_cache_lock:
+            if _similar_cache is None:
+                _similar_cache = SimilarQueryCache(cache)
+    return _similar_cache
@@ -1,4 +1,68 @@
 // static/js/common.js
+function encodeWorkflowForm(input, mode, workflow) {
+    // Ask for chart data instead of server-rendered PNGs whenever Chart.js is on the page
+    var chartMode = window.Chart ? "data" : "image";
+    return (
+        "userInput=" +
+        encodeURIComponent(input) +
+        "&mode=" +
+        encodeURIComponent(mode) +
+        "&workflow=" +
+        encodeURIComponent(workflow) +
+        "&chartMode=" +
+        encodeURIComponent(chartMode)
+    );
+}
+
+function appendChartImage(charts, src, idx) {
+    var img = document.createElement("img");
+    img.src = src;
+    img.alt = "chart " + (idx + 1);
+    img.style.maxWidth = "100%";
+    img.style.height = "auto";
+    charts.appendChild(img);
+}
+
+// Draws a chart returned in data mode ({title, metric_name, orientation, series: [{label, value}]})
+function appendDataChart(charts, chart) {
+    var wrapper = document.createElement("div");
+    var canvas = document.createElement("canvas");
+    var horizontal = chart.orientation !== "vertical";
+    wrapper.style.position = "relative";
+    wrapper.style.height = Math.max(260, chart.series.length * (horizontal ? 32 : 0) + 120) + "px";
+    wrapper.appendChild(canvas);
+    charts.appendChild(wrapper);
+
+    new Chart(canvas.getContext("2d"), {
+        type: "bar",
+        data: {
+            labels: chart.series.map(function(point) { return point.label; }),
+            datasets: [{
+                label: chart.metric_name,
+                data: chart.series.map(function(point) { return point.value; }),
+                backgroundColor: "#2f855a"
+            }]
+        },
+        options: {
+            indexAxis: horizontal ? "y" : "x",
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+                legend: { display: false },
+                title: { display: true, text: chart.title }
+            }
+        }
+    });
+}
+
+function appendChart(charts, chart, idx) {
+    if (chart.kind === "data") {
+        appendDataChart(charts, chart);
+    } else {
+        appendChartImage(charts, chart.url, idx);
+    }
+}
+
 function sendToFlask(mode, workflow) {
     var inputField = document.getElementById("userInput");
     var input = inputField.value;
@@ -14,6 +78,12 @@ function sendToFlask(mode, workflow) {
     spinner.style.display = "block";
     inputField.disabled = true;
 
+    // Stream progress when the browser can read a fetch body incrementally
+    if (window.fetch && window.ReadableStream && window.TextDecoder) {
+        streamFromFlask(input, selectedMode, selectedWorkflow, inputField);
+        return;
+    }
+
     var xhr = new XMLHttpRequest();
     xhr.open("POST", "/response", true);
     xhr.setRequestHeader("Content-Type", "application/x-www-form-urlencoded");
@@ -30,13 +100,8 @@ function sendToFlask(mode, workflow) {
                 var charts = document.getElementById("charts");
                 charts.innerHTML = "";
 
-                (data.img_urls || []).forEach(function(src, idx) {
-                    var img = document.createElement("img");
-                    img.src = src;
-                    img.alt = "chart " + (idx + 1);
-                    img.style.maxWidth = "100%";
-                    img.style.height = "auto";
-                    charts.appendChild(img);
+                (data.charts || []).forEach(function(chart, idx) {
+                    appendChart(charts, chart, idx);
                 });
 
                 setTimeout(function() {
@@ -46,14 +111,105 @@ function sendToFlask(mode, workflow) {
         }
     }
 
-    xhr.send(
-        "userInput=" +
-            encodeURIComponent(input) +
-            "&mode=" +
-            encodeURIComponent(selectedMode) +
-            "&workflow=" +
-            encodeURIComponent(selectedWorkflow)
-    );
+    xhr.send(encodeWorkflowForm(input, selectedMode, selectedWorkflow));
+}
+
+// Reads server-sent events from /response/stream and renders them as they arrive
+function streamFromFlask(input, mode, workflow, inputField) {
+    var output = document.getElementById("assistant-output");
+    var responseEl = document.getElementById("response");
+    var charts = document.getElementById("charts");
+    var shownCharts = {};
+    var chartCount = 0;
+    var currentStage = null;
+
+    output.style.display = "block";
+    responseEl.innerText = "";
+    charts.innerHTML = "";
+
+    function finish() {
+        spinner.style.display = "none";
+        inputField.disabled = false;
+        setTimeout(function() {
+            inputField.focus();
+        }, 50);
+    }
+
+    function showChart(chart) {
+        var key = chart.url || chart.title + "|" + chart.metric_name;
+        if (shownCharts[key]) {
+            return;
+        }
+        shownCharts[key] = true;
+        appendChart(charts, chart, chartCount++);
+    }
+
+    function handleEvent(event) {
+        switch (event.type) {
+            case "stage_start":
+                spinner.style.display = "block";
+                break;
+            case "text_delta":
+                // Fan-out runs interleave several workflows; their merged text arrives with "done"
+                if (event.workflow) {
+                    break;
+                }
+                // Only the last stage's text is the answer; reset when a new stage starts talking
+                if (currentStage !== event.stage) {
+                    currentStage = event.stage;
+                    responseEl.innerText = "";
+                }
+                responseEl.innerText += event.delta;
+                break;
+            case "similar_result":
+                // A reworded past question's answer, shown until this run's own text streams in
+                responseEl.innerText = event.result;
+                break;
+            case "chart_ready":
+                showChart(event.chart);
+                break;
+            case "done":
+                responseEl.innerText = event.result;
+                (event.charts || []).forEach(showChart);
+                break;
+            case "error":
+                responseEl.innerText = event.message;
+                break;
+        }
+    }
+
+    fetch("/response/stream", {
+        method: "POST",
+        headers: { "Content-Type": "application/x-www-form-urlencoded" },
+        body: encodeWorkflowForm(input, mode, workflow),
+    })
+        .then(function(res) {
+            var reader = res.body.getReader();
+            var decoder = new TextDecoder();
+            var buffer = "";
+
+            function pump() {
+                return reader.read().then(function(chunk) {
+                    if (chunk.done) {
+                        return;
+                    }
+                    buffer += decoder.decode(chunk.value, { stream: true });
+                    var messages = buffer.split("\n\n");
+                    buffer = messages.pop();
+                    messages.forEach(function(message) {
+                        if (message.indexOf("data: ") === 0) {
+                            handleEvent(JSON.parse(message.slice(6)));
+                        }
+                    });
+                    return pump();
+                });
+            }
+            return pump();
+        })
+        .catch(function(err) {
+            responseEl.innerText = "Request failed: " + err;
+        })
+        .then(finish);
 }
 
 function resetConversation() {
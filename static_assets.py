@@ -0,0 +1,310 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from flask import Flask, Response, request, send_from_directory
+from werkzeug.security import safe_join
+
+from run_context import DATA_ROOT, LOG_ROOT
+
+try:
+    import brotli
+except ImportError:  # optional: .br variants and br responses when installed
+    brotli = None
+
+
+# Static asset pipeline. The build step copies every file under static/ to a content-hashed name
+# (css/style.3f9a0c1d.css) in BUILD_ROOT, next to pre-compressed .gz/.br variants of text assets
+# and a .webp variant of every PNG/JPEG, and writes a manifest. url_for("static", ...) then
+# points templates at the hashed names, which are served with immutable cache headers and the
+# best variant the client accepts. Runs with `python static_assets.py build` at deploy time, or
+# on first use when the manifest is missing or out of date (workers racing on it write the
+# same files). ECOOPTIMA_STATIC_ASSETS=0 serves static/ as plain Flask does.
+STATIC_ASSETS_ENABLED = os.environ.get("ECOOPTIMA_STATIC_ASSETS", "1") != "0"
+STATIC_ROOT = Path(__file__).resolve().parent / "static"
+BUILD_ROOT = Path(os.environ.get("ECOOPTIMA_STATIC_BUILD_DIR", DATA_ROOT / "static"))
+MANIFEST_NAME = "manifest.json"
+# Bump when the build output changes shape, so old manifests are rebuilt
+BUILD_VERSION = "1"
+
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".html", ".svg", ".json", ".txt", ".map"}
+WEBP_SUFFIXES = {".png", ".jpg", ".jpeg"}
+WEBP_QUALITY = 85
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Dynamic responses: compressed when at least this big and of one of these types
+DYNAMIC_MIN_BYTES = 1024
+DYNAMIC_MIMETYPES = {"application/json", "text/html", "text/plain"}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+
+
+def _webp(source: Path) -> bytes | None:
+    from io import BytesIO
+
+    from PIL import Image
+
+    buffer = BytesIO()
+    with Image.open(source) as image:
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=6)
+    return buffer.getvalue()
+
+
+#############
+### BUILD ###
+#############
+
+
+# manifest: source path (relative to static/) -> hashed name, content hash, sizes and variants
+def build(static_root: Path = STATIC_ROOT, build_root: Path = BUILD_ROOT) -> dict:
+    manifest_path = build_root / MANIFEST_NAME
+    previous = _read_manifest(manifest_path).get("assets", {})
+    assets = {}
+    for source in sorted(path for path in static_root.rglob("*") if path.is_file()):
+        name = source.relative_to(static_root).as_posix()
+        data = source.read_bytes()
+        digest = _digest(data)
+        entry = previous.get(name)
+        if entry is not None and entry["hash"] == digest and _complete(build_root, entry):
+            assets[name] = entry
+            continue
+
+        suffix = source.suffix.lower()
+        hashed = f"{Path(name).with_suffix('').as_posix()}.{digest[:10]}{source.suffix}"
+        entry = {"path": hashed, "hash": digest, "bytes": len(data), "variants": {}}
+        _write_atomic(build_root / hashed, data)
+        if suffix in COMPRESSIBLE_SUFFIXES:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                _write_atomic(build_root / f"{hashed}.gz", compressed)
+                entry["variants"]["gzip"] = len(compressed)
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data):
+                    _write_atomic(build_root / f"{hashed}.br", compressed)
+                    entry["variants"]["br"] = len(compressed)
+        if suffix in WEBP_SUFFIXES:
+            webp = _webp(source)
+            if webp is not None and len(webp) < len(data):
+                _write_atomic(build_root / f"{hashed}.webp", webp)
+                entry["variants"]["webp"] = len(webp)
+        assets[name] = entry
+
+    manifest = {"version": BUILD_VERSION, "brotli": brotli is not None, "assets": assets}
+    _write_atomic(manifest_path, json.dumps(manifest, indent=2).encode("utf-8"))
+    return manifest
+
+
+def _complete(build_root: Path, entry: dict) -> bool:
+    names = [entry["path"]] + [
+        f"{entry['path']}.{'gz' if variant == 'gzip' else variant}" for variant in entry["variants"]
+    ]
+    return all((build_root / name).is_file() for name in names)
+
+
+def _read_manifest(path: Path) -> dict:
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get("version") == BUILD_VERSION else {}
+
+
+# Up to date when every static file is listed with its current size and mtime no newer than
+# the manifest (a cheap check; a full rebuild rehashes everything)
+def _is_current(manifest: dict, manifest_path: Path, static_root: Path) -> bool:
+    if not manifest or manifest.get("brotli") != (brotli is not None):
+        return False
+    assets = manifest["assets"]
+    built_at = manifest_path.stat().st_mtime
+    sources = [path for path in static_root.rglob("*") if path.is_file()]
+    if len(sources) != len(assets):
+        return False
+    for source in sources:
+        entry = assets.get(source.relative_to(static_root).as_posix())
+        stat = source.stat()
+        if entry is None or entry["bytes"] != stat.st_size or stat.st_mtime > built_at:
+            return False
+    return True
+
+
+_manifest: dict | None = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest() -> dict:
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                manifest_path = BUILD_ROOT / MANIFEST_NAME
+                manifest = _read_manifest(manifest_path)
+                if not _is_current(manifest, manifest_path, STATIC_ROOT):
+                    manifest = build()
+                _manifest = manifest
+    return _manifest
+
+
+###############
+### SERVING ###
+###############
+
+
+def _accepts(encoding: str) -> bool:
+    return request.accept_encodings.quality(encoding) > 0
+
+
+# Only an explicit image/webp counts; every browser sends */* for images
+def _accepts_webp() -> bool:
+    return "image/webp" in request.headers.get("Accept", "")
+
+
+# Files under static/ resolve to their hashed build output; the original file is the fallback
+# for anything the manifest doesn't know
+def _serve_static(filename: str):
+    entry = _hashed_assets().get(filename)
+    if entry is None:
+        return send_from_directory(STATIC_ROOT, filename)
+
+    variants = entry["variants"]
+    served, encoding, etag = filename, None, entry["hash"][:20]
+    if "webp" in variants:
+        if _accepts_webp():
+            served, etag = f"{filename}.webp", f"{etag}-webp"
+    elif "br" in variants and _accepts("br"):
+        served, encoding, etag = f"{filename}.br", "br", f"{etag}-br"
+    elif "gzip" in variants and _accepts("gzip"):
+        served, encoding, etag = f"{filename}.gz", "gzip", f"{etag}-gz"
+
+    response = send_from_directory(BUILD_ROOT.resolve(), served, etag=False, conditional=False)
+    if "webp" in variants:
+        response.headers["Vary"] = "Accept"
+        if served.endswith(".webp"):
+            response.mimetype = "image/webp"
+    else:
+        response.headers["Vary"] = "Accept-Encoding"
+        response.mimetype = _mimetype(filename)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    # send_file names the variant file (style.3f9a0c1d.css.gz) here
+    del response.headers["Content-Disposition"]
+    response.headers["Cache-Control"] = IMMUTABLE
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def _mimetype(filename: str) -> str:
+    import mimetypes
+
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+_by_path: dict | None = None
+
+
+def _hashed_assets() -> dict:
+    global _by_path
+    if _by_path is None:
+        _by_path = {entry["path"]: entry for entry in get_manifest()["assets"].values()}
+    return _by_path
+
+
+# Chart images in the content-addressed store (response_log/charts/) never change under their
+# name: immutable caching, plus a WebP copy made on first request from a client that takes it
+def serve_chart_image(filename: str):
+    source = safe_join(str(LOG_ROOT), filename)
+    if not filename.startswith("charts/") or source is None or not os.path.isfile(source):
+        return send_from_directory(LOG_ROOT.resolve(), filename)
+    source = Path(source)
+
+    served = filename
+    if STATIC_ASSETS_ENABLED and _accepts_webp():
+        webp_path = source.with_suffix(".webp")
+        if not webp_path.is_file():
+            webp = _webp(source)
+            if webp is not None and len(webp) < source.stat().st_size:
+                _write_atomic(webp_path, webp)
+        if webp_path.is_file():
+            served = Path(filename).with_suffix(".webp").as_posix()
+
+    response = send_from_directory(LOG_ROOT.resolve(), served, etag=False)
+    response.headers["Vary"] = "Accept"
+    response.headers["Cache-Control"] = IMMUTABLE
+    response.set_etag(f"{Path(filename).stem[:20]}-{Path(served).suffix[1:]}")
+    return response.make_conditional(request)
+
+
+# Negotiated gzip/br for dynamic responses (JSON, pages, metrics). Streams (server-sent events)
+# and file responses are left alone.
+def compress_response(response: Response) -> Response:
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in DYNAMIC_MIMETYPES
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+    ):
+        return response
+    data = response.get_data()
+    if len(data) < DYNAMIC_MIN_BYTES:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if brotli is not None and _accepts("br"):
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        response.headers["Content-Encoding"] = "br"
+    elif _accepts("gzip"):
+        response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def init_app(app: Flask) -> None:
+    if not STATIC_ASSETS_ENABLED:
+        return
+
+    # Templates keep url_for("static", filename="css/style.css"); the URL gets the hashed name
+    @app.url_defaults
+    def _hashed_static_url(endpoint: str, values: dict) -> None:
+        if endpoint == "static" and "filename" in values:
+            entry = get_manifest()["assets"].get(values["filename"])
+            if entry is not None:
+                values["filename"] = entry["path"]
+
+    app.view_functions["static"] = _serve_static
+    app.after_request(compress_response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static asset build")
+    parser.add_argument("command", choices=["build"])
+    parser.parse_args()
+    manifest = build()
+    assets = manifest["assets"].values()
+    raw = sum(entry["bytes"] for entry in assets)
+    smallest = sum(min([entry["bytes"], *entry["variants"].values()]) for entry in assets)
+    print(
+        f"{len(manifest['assets'])} assets -> {BUILD_ROOT}: {raw / 1024:.0f} KB, "
+        f"{smallest / 1024:.0f} KB in the smallest variants (brotli: {manifest['brotli']})"
+    )
+
+
+if __name__ == "__main__":
+    main()
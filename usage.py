@@ -0,0 +1,283 @@
+import atexit
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+from local_db import thread_connection
+from run_context import DATA_ROOT
+
+
+# Token usage of every model stage, kept in one SQLite file shared by all workers so cost can
+# be broken down by workflow, stage and session. ECOOPTIMA_USAGE_LOG=0 turns the store off
+# (run log records and session totals still carry usage). Rows are queued and written in batches
+# by a background thread, like the run log's, so runs never wait on the file.
+USAGE_ENABLED = os.environ.get("ECOOPTIMA_USAGE_LOG", "1") != "0"
+USAGE_PATH = Path(os.environ.get("ECOOPTIMA_USAGE_PATH", DATA_ROOT / "usage.sqlite3"))
+USAGE_RETENTION = float(os.environ.get("ECOOPTIMA_USAGE_RETENTION", 90 * 24 * 3600))
+# Background writer: runs per transaction, seconds a run may wait, batches between expiry passes
+USAGE_BATCH_SIZE = 64
+USAGE_FLUSH_INTERVAL = 0.5
+USAGE_EXPIRE_EVERY = 1000
+
+USAGE_FIELDS = (
+    "requests",
+    "input_tokens",
+    "cached_input_tokens",
+    "output_tokens",
+    "reasoning_tokens",
+    "total_tokens",
+)
+GROUP_COLUMNS = {
+    "workflow": ("workflow",),
+    "stage": ("workflow", "stage", "agent"),
+    "session": ("session_id",),
+    "run": ("run_id", "workflow", "session_id"),
+}
+
+
+# One stage's usage from the SDK's Usage (RunResult.context_wrapper.usage)
+def stage_usage(stage: str, agent: str, usage) -> dict:
+    return {
+        "stage": stage,
+        "agent": agent,
+        "requests": usage.requests,
+        "input_tokens": usage.input_tokens,
+        "cached_input_tokens": usage.input_tokens_details.cached_tokens or 0,
+        "output_tokens": usage.output_tokens,
+        "reasoning_tokens": usage.output_tokens_details.reasoning_tokens or 0,
+        "total_tokens": usage.total_tokens,
+    }
+
+
+def usage_totals(stages: list[dict]) -> dict:
+    return {field: sum(stage.get(field, 0) for stage in stages) for field in USAGE_FIELDS}
+
+
+# Running totals on the session state (saved with it by the session store)
+def add_to_session(session_state: dict, stages: list[dict]) -> None:
+    if not stages:
+        return
+    totals = session_state.get("usage") or {field: 0 for field in USAGE_FIELDS}
+    for field, value in usage_totals(stages).items():
+        totals[field] = totals.get(field, 0) + value
+    totals["runs"] = totals.get("runs", 0) + 1
+    session_state["usage"] = totals
+
+
+###################
+### USAGE STORE ###
+###################
+
+
+class UsageStore:
+    def __init__(self, path: Path = USAGE_PATH, retention: float = USAGE_RETENTION):
+        self.path = Path(path)
+        self.retention = retention
+        self._local = threading.local()
+        self._queue: queue.Queue[list[tuple] | None] = queue.Queue()
+        self._writer: threading.Thread | None = None
+        self._writer_lock = threading.Lock()
+        self._writes = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS stage_usage (
+                run_id TEXT NOT NULL,
+                workflow TEXT NOT NULL,
+                session_id TEXT,
+                stage TEXT NOT NULL,
+                agent TEXT NOT NULL,
+                requests INTEGER NOT NULL,
+                input_tokens INTEGER NOT NULL,
+                cached_input_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                reasoning_tokens INTEGER NOT NULL,
+                total_tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS stage_usage_created_at ON stage_usage (created_at);
+            CREATE INDEX IF NOT EXISTS stage_usage_session ON stage_usage (session_id);
+            CREATE INDEX IF NOT EXISTS stage_usage_input ON stage_usage (input_tokens);
+            """
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        return thread_connection(self._local, self.path)
+
+    ###############
+    ### WRITING ###
+    ###############
+
+    # Non-blocking: the rows are written by the background thread within USAGE_FLUSH_INTERVAL
+    def record(
+        self, run_id: str, workflow: str, session_id: str | None, stages: list[dict]
+    ) -> None:
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(
+                        target=self._write_loop, name="ecooptima-usage", daemon=True
+                    )
+                    self._writer.start()
+                    atexit.register(self.close)
+        now = time.time()
+        self._queue.put(
+            [
+                (run_id, workflow, session_id, stage["stage"], stage["agent"])
+                + tuple(stage[field] for field in USAGE_FIELDS)
+                + (now,)
+                for stage in stages
+            ]
+        )
+
+    def write(self, rows: list[tuple]) -> None:
+        db = self._connection()
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                f"""
+                INSERT INTO stage_usage (run_id, workflow, session_id, stage, agent,
+                    {", ".join(USAGE_FIELDS)}, created_at)
+                VALUES (?, ?, ?, ?, ?, {", ".join("?" for _ in USAGE_FIELDS)}, ?)
+                """,
+                rows,
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _write_loop(self) -> None:
+        while True:
+            rows = self._queue.get()
+            stop = rows is None
+            batch = [] if stop else [rows]
+            deadline = time.monotonic() + USAGE_FLUSH_INTERVAL
+            while not stop and len(batch) < USAGE_BATCH_SIZE:
+                try:
+                    rows = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if rows is None:
+                    stop = True
+                else:
+                    batch.append(rows)
+
+            if batch:
+                try:
+                    self.write([row for rows in batch for row in rows])
+                    self._writes += 1
+                    if self._writes % USAGE_EXPIRE_EVERY == 0:
+                        self.expire()
+                except sqlite3.Error as e:
+                    print(f"[usage] dropped {len(batch)} runs: {e}", file=sys.stderr)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                return
+
+    # Waits until everything recorded so far is on disk
+    def flush(self) -> None:
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+
+    ###############
+    ### QUERIES ###
+    ###############
+
+    # Totals grouped by workflow, stage (workflow + stage + agent), session or run, biggest
+    # consumers first. avg_input_tokens per stage call is the number to watch for bloated prompts.
+    def summary(
+        self,
+        group_by: str = "workflow",
+        since: float | None = None,
+        workflow: str | None = None,
+        session_id: str | None = None,
+        limit: int = 100,
+    ) -> list[dict]:
+        columns = GROUP_COLUMNS[group_by]
+        where, params = self._filters(since, workflow, session_id)
+        sums = ", ".join(f"SUM({field})" for field in USAGE_FIELDS)
+        rows = self._connection().execute(
+            f"""
+            SELECT {", ".join(columns)}, COUNT(*), COUNT(DISTINCT run_id), {sums}
+            FROM stage_usage {where}
+            GROUP BY {", ".join(columns)}
+            ORDER BY SUM(total_tokens) DESC
+            LIMIT ?
+            """,
+            params + [limit],
+        ).fetchall()
+
+        summary = []
+        for row in rows:
+            entry = dict(zip(columns, row))
+            stage_calls, runs = row[len(columns)], row[len(columns) + 1]
+            entry.update(zip(USAGE_FIELDS, row[len(columns) + 2 :]))
+            entry["stage_calls"] = stage_calls
+            entry["runs"] = runs
+            entry["avg_input_tokens"] = round(entry["input_tokens"] / stage_calls, 1)
+            entry["avg_total_tokens_per_run"] = round(entry["total_tokens"] / runs, 1)
+            summary.append(entry)
+        return summary
+
+    # Single stage calls with the largest prompts, e.g. a full MaccResult handed to an ROI agent
+    def largest_prompts(
+        self, limit: int = 20, since: float | None = None, workflow: str | None = None
+    ) -> list[dict]:
+        where, params = self._filters(since, workflow, None)
+        columns = ("run_id", "workflow", "session_id", "stage", "agent", "created_at")
+        rows = self._connection().execute(
+            f"""
+            SELECT {", ".join(columns + USAGE_FIELDS)}
+            FROM stage_usage {where}
+            ORDER BY input_tokens DESC
+            LIMIT ?
+            """,
+            params + [limit],
+        ).fetchall()
+        return [dict(zip(columns + USAGE_FIELDS, row)) for row in rows]
+
+    def _filters(
+        self, since: float | None, workflow: str | None, session_id: str | None
+    ) -> tuple[str, list]:
+        clauses, params = [], []
+        for clause, value in (
+            ("created_at >= ?", since),
+            ("workflow = ?", workflow),
+            ("session_id = ?", session_id),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return ("WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def expire(self) -> int:
+        cutoff = time.time() - self.retention
+        return self._connection().execute(
+            "DELETE FROM stage_usage WHERE created_at < ?", (cutoff,)
+        ).rowcount
+
+
+_usage_store: UsageStore | None = None
+_usage_store_lock = threading.Lock()
+
+
+def get_usage_store() -> UsageStore | None:
+    global _usage_store
+    if not USAGE_ENABLED:
+        return None
+    if _usage_store is None:
+        with _usage_store_lock:
+            if _usage_store is None:
+                _usage_store = UsageStore(USAGE_PATH)
+    return _usage_store
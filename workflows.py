@@ -1,15 +1,32 @@
 from typing import List, Literal, Any
+import hashlib
+import time
 from pydantic import BaseModel, Field
 from agents import (
     Agent,
-    Runner,
     InputGuardrail,
     GuardrailFunctionOutput,
     RunContextWrapper,
     FileSearchTool,
 )
 
-from ecooptima_tools import plot_bar_chart
+from agent_runner import run_stage
+from ecooptima_tools import plot_bar_chart, search_plant_matrix
+from guardrail import get_guardrail
+from macc import compute_macc_curve
+from plant_matrix import get_plant_matrix
+from run_context import RunContext
+
+
+# Fingerprint of everything that shapes an answer (instructions, tools, output schemas).
+# Cached responses are keyed on it, so editing a prompt retires the old cache entries.
+def _prompt_fingerprint(*agents: Agent) -> str:
+    digest = hashlib.sha256()
+    for agent in agents:
+        output_type = getattr(agent.output_type, "__qualname__", str(agent.output_type))
+        tool_names = ",".join(getattr(tool, "name", type(tool).__name__) for tool in agent.tools)
+        digest.update(f"{agent.name}|{agent.instructions}|{output_type}|{tool_names}".encode("utf-8"))
+    return digest.hexdigest()[:16]
 
 
 class CommunityWorkflow:
@@ -17,19 +34,40 @@ class CommunityWorkflow:
     # CONFIG / INIT #
     #################
 
+    # Preferred model of every agent role unless the routing policy names others
+    # (model_routing.py), which may also switch a stage to a faster fallback under time pressure
+    DEFAULT_MODEL = "gpt-5-nano"
+    DEFAULT_VECTOR_STORE = "vs_6910105ece0c81918f2371e0f6c32696"
+
     def __init__(
         self,
-        agent_model: str = "gpt-5-nano",
-        plant_matrix_vector_store: str = "vs_6910105ece0c81918f2371e0f6c32696",
+        agent_model: str = DEFAULT_MODEL,
+        plant_matrix_vector_store: str = DEFAULT_VECTOR_STORE,
+        use_local_plant_matrix: bool = True,
     ):
         self.agent_model = agent_model
         self.plant_matrix_vector_store = plant_matrix_vector_store
+        self.use_local_plant_matrix = use_local_plant_matrix
+
+        # Load the in-memory plant matrix now so no request pays for it
+        if use_local_plant_matrix:
+            get_plant_matrix()
 
         # Initialize agents
         self.local_roi_agent = self._build_local_roi_agent()
         self.conversational_agent = self._build_conversational_agent()
         self.guardrail_agent = self._build_guardrail_agent()
         self.plant_matrix_agent = self._build_plant_matrix_agent()
+        self.prompt_version = _prompt_fingerprint(
+            self.plant_matrix_agent, self.guardrail_agent, self.local_roi_agent
+        )
+        # Cached guardrail verdicts are only reused for the same guardrail prompt and model
+        self.guardrail_scope = f"{self.agent_model}:{_prompt_fingerprint(self.guardrail_agent)}"
+        get_guardrail()
+
+    @property
+    def vector_store_ids(self) -> tuple[str, ...]:
+        return (self.plant_matrix_vector_store,)
 
     ########################
     # SHARED DATA MODELS  #
@@ -55,9 +93,31 @@ class CommunityWorkflow:
     async def on_handoff(self, ctx: RunContextWrapper[None], input_data):
         print(input_data)
 
+    # Obvious on/off-topic inputs and repeats are settled locally; only the rest costs a model call
     async def eco_optima_guardrail(self, ctx, agent, input_data):
-        result = await Runner.run(self.guardrail_agent, input_data)
-        final_output = result.final_output_as(self.GuardrailOutput)
+        guardrail = get_guardrail()
+        verdict = None
+        if isinstance(input_data, str):
+            verdict = guardrail.check(input_data, scope=self.guardrail_scope)
+
+        if verdict is not None:
+            final_output = self.GuardrailOutput(
+                is_eco_optima=verdict.is_eco_optima, reasoning=verdict.reasoning
+            )
+        else:
+            started = time.perf_counter()
+            result = await run_stage(
+                self.guardrail_agent, input_data, context=ctx.context, stage="guardrail"
+            )
+            final_output = result.final_output_as(self.GuardrailOutput)
+            if isinstance(input_data, str):
+                guardrail.record_llm(
+                    input_data,
+                    final_output.is_eco_optima,
+                    final_output.reasoning,
+                    time.perf_counter() - started,
+                    scope=self.guardrail_scope,
+                )
 
         return GuardrailFunctionOutput(
             output_info=final_output,
@@ -68,6 +128,12 @@ class CommunityWorkflow:
     # AGENT BUILDERS  #
     ####################
 
+    # Species lookup: local in-memory search by default, hosted vector store when disabled
+    def _plant_matrix_tools(self) -> list:
+        if self.use_local_plant_matrix:
+            return [search_plant_matrix]
+        return [FileSearchTool(vector_store_ids=[self.plant_matrix_vector_store])]
+
     def _build_local_roi_agent(self) -> Agent:
         return Agent(
             name="Local ROI Advisor",
@@ -81,7 +147,7 @@ class CommunityWorkflow:
                             2. Create a MACC using plot_bar_chart with no explanation.""",
             output_type=str,
             tools=[
-                FileSearchTool(vector_store_ids=[self.plant_matrix_vector_store]),
+                *self._plant_matrix_tools(),
                 plot_bar_chart,
             ],
         )
@@ -110,10 +176,9 @@ class CommunityWorkflow:
             model=self.agent_model,
             handoff_description="Specialist agent for plant matrix",
             instructions="""Recommend the best plant species using the plant matrix.
+                            Look species up in the plant matrix by site conditions (sun, moisture, pH, soil, plant type, size) or by name.
                             Enforce species diversity and resilience.""",
-            tools=[
-                FileSearchTool(vector_store_ids=[self.plant_matrix_vector_store]),
-            ],
+            tools=self._plant_matrix_tools(),
             input_guardrails=[
                 InputGuardrail(guardrail_function=self.eco_optima_guardrail)
             ],
@@ -124,11 +189,15 @@ class CommunityWorkflow:
     # WORKFLOW RUN #
     #################
 
-    async def run(self, user_input: str):
-        result = await Runner.run(self.plant_matrix_agent, user_input)
-        result = await Runner.run(
+    async def run(self, user_input: str, context: RunContext | None = None):
+        result = await run_stage(
+            self.plant_matrix_agent, user_input, context=context, stage="plant_matrix"
+        )
+        result = await run_stage(
             self.local_roi_agent,
             result.final_output.model_dump_json(),
+            context=context,
+            stage="local_roi",
         )
         return result
 
@@ -141,10 +210,13 @@ class ConsumerWorkflow:
     # CONFIG / INIT #
     #################
 
+    DEFAULT_MODEL = "gpt-5-nano"
+    DEFAULT_VECTOR_STORE = "vs_69a4d21889888191b4c0f0653a1f29e3"
+
     def __init__(
         self,
-        agent_model: str = "gpt-5-nano",
-        consumer_vector_store: str = "vs_69a4d21889888191b4c0f0653a1f29e3",
+        agent_model: str = DEFAULT_MODEL,
+        consumer_vector_store: str = DEFAULT_VECTOR_STORE,
     ):
         self.agent_model = agent_model
         self.consumer_vector_store = consumer_vector_store
@@ -153,12 +225,20 @@ class ConsumerWorkflow:
         self.consumer_macc_agent = self._build_consumer_macc_agent()
         self.consumer_roi_agent = self._build_consumer_roi_agent()
         self.conversational_agent = self._build_conversational_agent()
+        self.prompt_version = _prompt_fingerprint(
+            self.consumer_macc_agent, self.consumer_roi_agent
+        )
+
+    @property
+    def vector_store_ids(self) -> tuple[str, ...]:
+        return (self.consumer_vector_store,)
 
     ########################
     # SHARED DATA MODELS   #
     ########################
 
-    class OptionRow(BaseModel):
+    # Raw estimates produced by the MACC agent
+    class OptionEstimate(BaseModel):
         option_id: str
         category: str
         description: str
@@ -166,11 +246,9 @@ class ConsumerWorkflow:
         # Effects
         annual_abatement_tCO2e: float = Field(..., ge=0)
         lifetime_years: int = Field(..., ge=1)
-        lifetime_abatement_tCO2e: float = Field(..., ge=0)
 
         # Economics (consumer)
         net_present_cost_usd: float
-        cost_per_tCO2e_usd: float
 
         # Practicality
         homeowner_feasible: bool
@@ -178,6 +256,11 @@ class ConsumerWorkflow:
 
         notes: str = ""
 
+    # Estimate plus the columns computed locally by macc.compute_macc_curve
+    class OptionRow(OptionEstimate):
+        lifetime_abatement_tCO2e: float = Field(..., ge=0)
+        cost_per_tCO2e_usd: float | None  # None when the option abates nothing
+
     class MaccAssumptions(BaseModel):
         location: str = "Cincinnati, Ohio"
         household_archetype: HouseholdArchetype = "mixed"
@@ -185,6 +268,11 @@ class ConsumerWorkflow:
         grid_emissions_basis: str = "Documented/assumed Cincinnati grid intensity"
         key_notes: List[str] = []
 
+    class MaccEstimate(BaseModel):
+        assumptions: "ConsumerWorkflow.MaccAssumptions"
+        options: List["ConsumerWorkflow.OptionEstimate"]
+        narrative: str
+
     class MaccResult(BaseModel):
         assumptions: "ConsumerWorkflow.MaccAssumptions"
         options: List["ConsumerWorkflow.OptionRow"]
@@ -199,6 +287,36 @@ class ConsumerWorkflow:
     async def on_handoff(self, ctx, input_data: Any):
         print(input_data)
 
+    # Derived columns, curve order and cumulative abatement, computed locally from the raw estimates
+    def build_macc_result(
+        self, estimate: "ConsumerWorkflow.MaccEstimate"
+    ) -> "ConsumerWorkflow.MaccResult":
+        lifetime_abatement = [
+            option.annual_abatement_tCO2e * option.lifetime_years
+            for option in estimate.options
+        ]
+        curve = compute_macc_curve(
+            [option.net_present_cost_usd for option in estimate.options],
+            lifetime_abatement,
+        )
+        options = [
+            self.OptionRow(
+                **option.model_dump(),
+                lifetime_abatement_tCO2e=abatement,
+                cost_per_tCO2e_usd=cost_per,
+            )
+            for option, abatement, cost_per in zip(
+                estimate.options, lifetime_abatement, curve.cost_per_tCO2e
+            )
+        ]
+        return self.MaccResult(
+            assumptions=estimate.assumptions,
+            options=options,
+            sorted_option_ids=[options[index].option_id for index in curve.order],
+            cumulative_abatement_tCO2e=curve.cumulative_abatement,
+            narrative=estimate.narrative,
+        )
+
     ####################
     # AGENT BUILDERS   #
     ####################
@@ -209,10 +327,10 @@ class ConsumerWorkflow:
             model=self.agent_model,
             instructions="""Recommend the best consumer climate actions for a Cincinnati household using a marginal abatement cost curve.
                             Build 8-15 actions covering purchases, transport, home energy, efficiency, and behavior.
-                            For each action, estimate annual and lifetime abatement, net present cost, cost per tCO2e, and homeowner/renter feasibility.
-                            Enforce internally consistent assumptions, avoid double counting, sort by cost_per_tCO2e_usd ascending,
-                            and compute cumulative_abatement_tCO2e in that order.""",
-            output_type=self.MaccResult,
+                            For each action, estimate annual abatement, lifetime in years, net present cost, and homeowner/renter feasibility.
+                            Enforce internally consistent assumptions and avoid double counting.
+                            Do not compute lifetime abatement, cost per tCO2e, sort order or cumulative abatement; they are derived from your estimates.""",
+            output_type=self.MaccEstimate,
             tools=[
                 FileSearchTool(vector_store_ids=[self.consumer_vector_store]),
             ],
@@ -248,11 +366,18 @@ class ConsumerWorkflow:
     # WORKFLOW RUN  #
     #################
 
-    async def run(self, user_input: str):
-        result = await Runner.run(self.consumer_macc_agent, user_input)
-        result = await Runner.run(
+    async def run(self, user_input: str, context: RunContext | None = None):
+        result = await run_stage(
+            self.consumer_macc_agent, user_input, context=context, stage="consumer_macc"
+        )
+        final_macc = self.build_macc_result(result.final_output_as(self.MaccEstimate))
+        if context is not None:
+            context.macc_result = final_macc.model_dump()
+        result = await run_stage(
             self.consumer_roi_agent,
-            result.final_output.model_dump_json(),
+            final_macc.model_dump_json(),
+            context=context,
+            stage="consumer_roi",
         )
         return result
 
@@ -272,27 +397,37 @@ class AcademicWorkflow:
     # CONFIG / INIT #
     #################
 
+    DEFAULT_MODEL = "gpt-5-nano"
+    DEFAULT_VECTOR_STORE = "vs_69a4d21889888191b4c0f0653a1f29e3"
+
     def __init__(
         self,
-        agent_model: str = "gpt-5-nano",
-        academic_vector_store: str = "vs_69a4d21889888191b4c0f0653a1f29e3",
+        agent_model: str = DEFAULT_MODEL,
+        academic_vector_store: str = DEFAULT_VECTOR_STORE,
     ):
         self.agent_model = agent_model
         self.academic_vector_store = academic_vector_store
 
-        # State for follow-ups
-        self.latest_workflow_output: "AcademicWorkflow.MaccResult"
+        # Instances are shared across requests (see ecooptima.get_workflow), so no per-run state lives here
 
         # Initialize agents (2 “thinking” agents + conversational)
         self.academic_macc_agent = self._build_academic_macc_agent()
         self.academic_roi_agent = self._build_academic_roi_agent()
         self.conversational_agent = self._build_conversational_agent()
+        self.prompt_version = _prompt_fingerprint(
+            self.academic_macc_agent, self.academic_roi_agent
+        )
+
+    @property
+    def vector_store_ids(self) -> tuple[str, ...]:
+        return (self.academic_vector_store,)
 
     ########################
     # SHARED DATA MODELS   #
     ########################
 
-    class AcademicOption(BaseModel):
+    # Raw estimates produced by the MACC agent
+    class AcademicOptionEstimate(BaseModel):
         option_id: str
         category: Literal[
             "campus_operations", "research_programs", "workforce_training"
@@ -308,12 +443,13 @@ class AcademicWorkflow:
         research_spillover_tCO2e: float = Field(..., ge=0)
         workforce_spillover_tCO2e: float = Field(..., ge=0)
 
-        # Derived fields (must be populated by the MACC agent)
-        total_effective_abatement_tCO2e: float = Field(..., ge=0)
-        cost_per_tCO2e_usd: float
-
         notes: str = ""
 
+    # Derived fields (computed locally by macc.compute_macc_curve)
+    class AcademicOption(AcademicOptionEstimate):
+        total_effective_abatement_tCO2e: float = Field(..., ge=0)
+        cost_per_tCO2e_usd: float | None  # None when the option abates nothing
+
     class MaccAssumptions(BaseModel):
         institution_type: InstitutionType = "mixed"
         region: Region = "US"
@@ -326,6 +462,11 @@ class AcademicWorkflow:
 
         key_notes: List[str] = []
 
+    class MaccEstimate(BaseModel):
+        assumptions: "AcademicWorkflow.MaccAssumptions"
+        options: List["AcademicWorkflow.AcademicOptionEstimate"]
+        narrative: str
+
     class MaccResult(BaseModel):
         assumptions: "AcademicWorkflow.MaccAssumptions"
         options: List["AcademicWorkflow.AcademicOption"]
@@ -343,6 +484,37 @@ class AcademicWorkflow:
     async def on_handoff(self, ctx, input_data: Any):
         print(input_data)
 
+    # Derived columns, curve order and cumulative abatement, computed locally from the raw estimates
+    def build_macc_result(
+        self, estimate: "AcademicWorkflow.MaccEstimate"
+    ) -> "AcademicWorkflow.MaccResult":
+        total_abatement = [
+            option.operational_abatement_tCO2e
+            + option.research_spillover_tCO2e
+            + option.workforce_spillover_tCO2e
+            for option in estimate.options
+        ]
+        curve = compute_macc_curve(
+            [option.cost_usd for option in estimate.options], total_abatement
+        )
+        options = [
+            self.AcademicOption(
+                **option.model_dump(),
+                total_effective_abatement_tCO2e=abatement,
+                cost_per_tCO2e_usd=cost_per,
+            )
+            for option, abatement, cost_per in zip(
+                estimate.options, total_abatement, curve.cost_per_tCO2e
+            )
+        ]
+        return self.MaccResult(
+            assumptions=estimate.assumptions,
+            options=options,
+            sorted_option_ids=[options[index].option_id for index in curve.order],
+            cumulative_abatement_tCO2e=curve.cumulative_abatement,
+            narrative=estimate.narrative,
+        )
+
     ####################
     # AGENT BUILDERS   #
     ####################
@@ -366,19 +538,17 @@ class AcademicWorkflow:
                             2) For each option, fill:
                                - cost_usd, lifetime_years
                                - operational_abatement_tCO2e, research_spillover_tCO2e, workforce_spillover_tCO2e
-                               - total_effective_abatement_tCO2e = sum of the three channels
-                               - cost_per_tCO2e_usd = cost_usd / total_effective_abatement_tCO2e
                             3) Enforce internal consistency and avoid double counting:
                                - Do NOT count the same abatement in multiple channels for the same intervention.
                                - Research spillovers must be attribution-adjusted (expected value, conservative).
                                - Workforce spillovers must be attribution-adjusted and conservative.
-                            4) Sort options by cost_per_tCO2e_usd ascending and compute cumulative_abatement_tCO2e in that sorted order.
+                            4) Do NOT compute totals, cost per tCO2e, sort order or cumulative abatement; they are derived from your estimates.
                             5) Return a short narrative explaining which levers dominate and why.
 
                             OUTPUT:
-                            - Must conform exactly to the MaccResult schema.
+                            - Must conform exactly to the MaccEstimate schema.
                             """,
-            output_type=self.MaccResult,
+            output_type=self.MaccEstimate,
             tools=[
                 FileSearchTool(vector_store_ids=[self.academic_vector_store]),
             ],
@@ -415,7 +585,8 @@ class AcademicWorkflow:
             instructions="""
                             You are the user-facing assistant for academic MACC follow-up questions.
                             Use latest_workflow_output as factual context for numbers.
-                            If asked to modify assumptions (discount rate, institution type, attribution method), explain how it would change results and recommend re-running the workflow.
+                            Discount rate and time horizon changes are recomputed locally before they reach you; if latest_workflow_output has a scenario block, its numbers already reflect it.
+                            If asked to modify other assumptions (institution type, attribution method), explain how it would change results and recommend re-running the workflow.
                             """,
             output_type=str,
         )
@@ -424,30 +595,42 @@ class AcademicWorkflow:
     # WORKFLOW RUN  #
     #################
 
-    async def run(self, user_input: str):
+    async def run(self, user_input: str, context: RunContext | None = None):
         # 1) Build the MACC dataset
-        macc_result = await Runner.run(self.academic_macc_agent, user_input)
-        final_macc = macc_result.final_output_as(self.MaccResult)
-        self.latest_workflow_output = final_macc
+        macc_result = await run_stage(
+            self.academic_macc_agent, user_input, context=context, stage="academic_macc"
+        )
+        final_macc = self.build_macc_result(
+            macc_result.final_output_as(self.MaccEstimate)
+        )
+        if context is not None:
+            context.macc_result = final_macc.model_dump()
 
         # 2) ROI analysis + plot (pass the structured result)
-        roi_result = await Runner.run(
+        roi_result = await run_stage(
             self.academic_roi_agent,
             final_macc.model_dump_json(),
+            context=context,
+            stage="academic_roi",
         )
 
         return roi_result
 
-    async def chat(self, user_input: str) -> str:
+    async def chat(
+        self,
+        user_input: str,
+        latest_workflow_output: "AcademicWorkflow.MaccResult | None" = None,
+    ) -> str:
         # Optional: conversational follow-ups without rebuilding the MACC
         ctx = (
-            self.latest_workflow_output.model_dump_json(indent=2)
-            if self.latest_workflow_output
+            latest_workflow_output.model_dump_json(indent=2)
+            if latest_workflow_output
             else "No academic MACC has been generated yet."
         )
 
-        result = await Runner.run(
+        result = await run_stage(
             self.conversational_agent,
             f"latest_workflow_output:\n{ctx}\n\nuser:\n{user_input}",
+            stage="followup",
         )
         return result.final_output